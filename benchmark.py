@@ -0,0 +1,698 @@
+"""
+Micro-benchmarks du serveur de partage de fichiers
+
+Usage:
+    python benchmark.py            # tous les benchmarks
+    python benchmark.py registry   # un benchmark précis
+"""
+
+import contextlib
+import io
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from chatlog import FSYNC_POLICIES, ChatLog
+from client import FileShareClient
+from metadata import MetadataStore
+from passwords import PasswordHasher
+from protocol import CODECS, FRAME_HEADER, decode_body, encode_frame, make_message, recv_exact
+from ratelimit import DEFAULT_RATE_LIMITS, RateLimiter
+from roomindex import SORT_KEYS
+from server import FileShareServer
+
+
+def report(text=""):
+    """Afficher un résultat (stdout est masqué pendant les benchmarks)"""
+    print(text, file=sys.__stdout__, flush=True)
+
+
+def measure(func, repeat):
+    """Temps moyen d'un appel en microsecondes"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+# Serveurs créés par le benchmark en cours, arrêtés à sa fin (threads, pool du KDF, fichiers)
+_servers = []
+
+
+def make_server(**options):
+    """Créer un serveur (non démarré) dans un dossier temporaire"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_"))
+    server = FileShareServer(**options)
+    _servers.append(server)
+    return server
+
+
+def stop_servers():
+    """Arrêter les serveurs créés depuis le dernier appel (stop() peut déjà avoir été appelé)"""
+    while _servers:
+        _servers.pop().stop()
+
+
+def bench_registry(num_clients=10_000, repeat=2_000):
+    """Recherche d'une connexion par pseudo / adresse: scan linéaire vs index"""
+    server = make_server()
+
+    with server.clients_lock:
+        for i in range(num_clients):
+            connection = object()
+            server.register_client(connection, ("10.0.0.1", 10_000 + i))
+            server.clients[connection]["pseudo"] = f"user{i}"
+            server.index_user(connection, f"user{i}")
+
+    # Pire cas pour le scan: le dernier client connecté
+    target_user = f"user{num_clients - 1}"
+    target_address = ("10.0.0.1", 10_000 + num_clients - 1)
+
+    def scan_by_user():
+        for connection, client_info in server.clients.items():
+            if client_info.get("pseudo") == target_user:
+                return connection
+
+    def scan_by_address():
+        for connection, client_info in server.clients.items():
+            if client_info.get("address") == target_address:
+                return connection
+
+    results = [
+        ("P2P_REQUEST (pseudo) - scan", measure(scan_by_user, repeat)),
+        ("P2P_REQUEST (pseudo) - index", measure(lambda: server.find_user_connection(target_user), repeat)),
+        ("kick / broadcast (adresse) - scan", measure(scan_by_address, repeat)),
+        ("kick / broadcast (adresse) - index",
+         measure(lambda: server.connections_by_address.get(target_address), repeat)),
+    ]
+
+    report(f"\n📊 Registre des connexions ({num_clients} clients)")
+    report("-" * 60)
+    for label, micros in results:
+        report(f"{label:40} {micros:>10.2f} µs")
+
+
+def bench_lookup(num_files=50_000, repeat=2_000):
+    """Recherche d'un fichier de room (DOWNLOAD_FILE): scan linéaire vs index"""
+    server = make_server()
+    files = server.files_by_room["general"]
+    for i in range(num_files):
+        files.append({
+            "file_id": f"{i:08x}", "filename": f"file{i}.bin", "uploader": "bench",
+            "size": i, "path": f"uploads/{i}", "hash": None, "upload_date": datetime.now().isoformat()
+        })
+
+    # Pire cas pour le scan: le dernier fichier partagé
+    target_name = f"file{num_files - 1}.bin"
+    target_id = f"{num_files - 1:08x}"
+
+    def scan_by_name():
+        for f in files:
+            if f["filename"] == target_name:
+                return f
+
+    results = [
+        ("DOWNLOAD_FILE (nom) - scan", measure(scan_by_name, repeat // 10)),
+        ("DOWNLOAD_FILE (nom) - index", measure(lambda: files.find(target_name), repeat)),
+        ("DOWNLOAD_FILE (file_id) - index", measure(lambda: files.get(target_id), repeat)),
+    ]
+
+    report(f"\n📊 Recherche d'un fichier ({num_files} fichiers dans la room)")
+    report("-" * 60)
+    for label, micros in results:
+        report(f"{label:40} {micros:>10.2f} µs")
+
+
+def bench_pages(num_files=50_000, page_size=50, repeat=200):
+    """Page de LIST_ROOM_FILES triée par nom: liste complète triée vs index trié + curseur"""
+    server = make_server()
+    files = server.files_by_room["general"]
+    for i in range(num_files):
+        files.append({
+            "file_id": f"{i:08x}", "filename": f"file{(i * 7919) % num_files}.bin", "uploader": "bench",
+            "size": i, "path": f"uploads/{i}", "hash": None, "upload_date": datetime.now().isoformat()
+        })
+
+    # Curseur de la dernière page (pire cas pour un découpage de la liste complète)
+    ordered, _ = files.page("name")
+    after = SORT_KEYS["name"](ordered[-page_size - 1])
+
+    def full_sort():
+        by_name = sorted(files, key=SORT_KEYS["name"])
+        return by_name[-page_size:]
+
+    files.page("name", after=after, limit=page_size)
+    results = [
+        ("dernière page - tri de la liste", measure(full_sort, repeat // 10)),
+        ("dernière page - index + curseur", measure(lambda: files.page("name", after=after, limit=page_size), repeat)),
+        ("filtre préfixe - index",
+         measure(lambda: files.page("name", limit=page_size, prefix="file4999"), repeat)),
+    ]
+
+    report(f"\n📊 LIST_ROOM_FILES paginé ({num_files} fichiers, pages de {page_size})")
+    report("-" * 60)
+    for label, micros in results:
+        report(f"{label:40} {micros:>10.1f} µs")
+
+
+def free_port():
+    """Trouver un port TCP libre sur la boucle locale"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(**options):
+    """Démarrer un serveur local en arrière-plan (logs masqués)"""
+    server = make_server()
+    server.host = "127.0.0.1"
+    server.port = free_port()
+    for name, value in options.items():
+        setattr(server, name, value)
+
+    threading.Thread(target=server.start, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection((server.host, server.port)).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return server
+
+
+def connect_client(server, username, room_id="general"):
+    """Client inscrit, connecté et dans une room (sans interaction)"""
+    client = FileShareClient(server.host, server.port)
+    client.connect()
+    client.pseudo = username
+    client.send_message("REGISTER", {"username": username, "password": "bench"})
+    client.receive_message()
+    client.send_message("LOGIN", {"username": username, "password": "bench"})
+    client.session_token = client.receive_message()["payload"]["session_token"]
+    client.send_message("JOIN_ROOM", {"session_token": client.session_token, "room_id": room_id})
+    client.receive_message()
+    client.current_room = room_id
+    return client
+
+
+def add_room_file(server, room_id, filename, size):
+    """Déposer directement un fichier dans une room du serveur"""
+    # Charger l'index de la room avant d'y créer le fichier (sinon il serait indexé deux fois)
+    files = server.files_by_room[room_id]
+    path = os.path.join(server.upload_dir, room_id, filename)
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size // len(block)):
+            f.write(block)
+    files.append({
+        "file_id": filename,
+        "filename": filename,
+        "uploader": "bench",
+        "size": os.path.getsize(path),
+        "path": path,
+        "upload_date": datetime.now().isoformat()
+    })
+    return os.path.getsize(path)
+
+
+def bench_download(size_mb=256, rounds=3):
+    """Débit d'un téléchargement: chunks de 8 KB vs flux unique (sendfile)"""
+    report(f"\n📊 Téléchargement d'un fichier de {size_mb} MB (boucle locale)")
+    report("-" * 60)
+
+    for mode in ("threaded", "async"):
+        server = start_server(mode=mode)
+        size = add_room_file(server, "general", "bench.bin", size_mb * 1024 * 1024)
+        client = connect_client(server, "downloader")
+
+        for transfer_mode in ("chunked", "stream"):
+            best = None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                path = client.fetch_file("bench.bin", "bench_downloads", mode=transfer_mode)
+                elapsed = time.perf_counter() - start
+                if path is None or os.path.getsize(path) != size:
+                    report(f"❌ {mode}/{transfer_mode}: téléchargement incomplet")
+                    break
+                best = elapsed if best is None else min(best, elapsed)
+            if best:
+                report(f"{mode + ' / ' + transfer_mode:30} {size / best / 1024 / 1024:>10.1f} MB/s")
+
+        client.socket.close()
+        server.stop()
+
+
+def bench_upload(size_mb=96, rounds=3):
+    """Débit d'un upload et mémoire Python allouée pendant le transfert"""
+    report(f"\n📊 Upload d'un fichier de {size_mb} MB (boucle locale)")
+    report("-" * 60)
+
+    source = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench_upload.bin")
+    with open(source, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+
+    for mode in ("threaded", "async"):
+        server = start_server(mode=mode)
+        client = connect_client(server, "uploader")
+
+        best = None
+        peak = 0
+        for _ in range(rounds):
+            # Contenu différent à chaque tour, sinon le serveur déduplique l'envoi
+            with open(source, "r+b") as f:
+                f.write(os.urandom(16))
+            tracemalloc.start()
+            start = time.perf_counter()
+            ok = client.send_file(source)
+            elapsed = time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            # FILE_SHARED diffusé à l'uploader lui-même
+            client.receive_message()
+            if not ok:
+                report(f"❌ {mode}: upload échoué")
+                break
+            best = elapsed if best is None else min(best, elapsed)
+
+        if best:
+            report(f"{mode:30} {size_mb / best:>10.1f} MB/s   pic mémoire {peak / 1024 / 1024:.1f} MB")
+
+        client.socket.close()
+        server.stop()
+
+
+def bench_writes(num_receivers=20, num_messages=2_000):
+    """Appels d'écriture par message livré pendant une rafale de chat diffusée"""
+    report(f"\n📊 Écritures groupées: rafale de {num_messages} messages vers {num_receivers} membres")
+    report("   (sans regroupement: 1 sendall, donc au moins 1 appel système, par message)")
+    report("-" * 60)
+
+    for mode in ("threaded", "async"):
+        for flush_window in (0.0, 0.002):
+            # File assez grande pour que rien ne soit abandonné pendant la rafale
+            server = start_server(mode=mode, flush_window=flush_window, outbound_queue_size=num_messages * 2,
+                                  rate_limiter=None)
+            sender = connect_client(server, "sender")
+            receivers = [connect_client(server, f"r{i}") for i in range(num_receivers)]
+            time.sleep(0.2)
+
+            connections = [next(iter(server.connections_by_user[f"r{i}"])) for i in range(num_receivers)]
+            before = [connection.outbound.stats() for connection in connections]
+
+            def drain(client):
+                received = 0
+                while received < num_messages:
+                    message = client.receive_message()
+                    if message is None:
+                        break
+                    if message["type"] == "MESSAGE":
+                        received += 1
+
+            threads = [threading.Thread(target=drain, args=(client,)) for client in receivers]
+            for thread in threads:
+                thread.start()
+
+            start = time.perf_counter()
+            for i in range(num_messages):
+                sender.send_message("SEND_MESSAGE", {"session_token": sender.session_token, "message": f"msg {i}"})
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            after = [connection.outbound.stats() for connection in connections]
+            frames = sum(a["sent"] - b["sent"] for a, b in zip(after, before))
+            writes = sum(a["writes"] - b["writes"] for a, b in zip(after, before))
+
+            label = f"{mode} / fenêtre {flush_window * 1000:.0f} ms"
+            report(f"{label:30} {writes / max(frames, 1):>6.3f} écriture/message "
+                   f"({frames / elapsed:,.0f} messages livrés/s)")
+
+            for client in [sender] + receivers:
+                client.socket.close()
+            server.stop()
+
+
+class _NullConnection:
+    """Connexion factice: accepte les trames sans rien envoyer (mesure du coût d'encodage)"""
+
+    def __init__(self, codec="json"):
+        self.codec = codec
+        self.frames = 0
+
+    def send_frame(self, parts, key=None):
+        self.frames += 1
+
+
+def bench_broadcast(room_size=500, repeat=200):
+    """Diffusion d'un message dans une room: un encodage par membre vs un seul"""
+    server = make_server()
+    connections = [_NullConnection() for _ in range(room_size)]
+    for i, connection in enumerate(connections):
+        server.join_room_index(connection, f"user{i}", "general")
+
+    payload = {
+        "username": "alice",
+        "message": "Salut tout le monde, le build de ce soir est prêt 🚀",
+        "room_id": "general",
+        "timestamp": datetime.now().isoformat()
+    }
+
+    def per_recipient():
+        for connection in server.get_room_connections("general"):
+            server.send_message(connection, "MESSAGE", payload)
+
+    results = [
+        ("send_message par membre", measure(per_recipient, repeat)),
+        ("broadcast_to_room (encodage unique)",
+         measure(lambda: server.broadcast_to_room("general", "MESSAGE", payload), repeat)),
+    ]
+
+    report(f"\n📊 Broadcast d'un MESSAGE à une room de {room_size} membres")
+    report("-" * 60)
+    for label, micros in results:
+        report(f"{label:40} {micros:>10.1f} µs")
+
+
+def bench_metadata(num_users=2_000, num_files=100_000):
+    """Écriture d'un compte (REGISTER) et démarrage sur une base déjà remplie"""
+    make_server()
+    user = {"password": "0" * 64, "email": "", "user_id": "00000000-0000-0000-0000-000000000000"}
+
+    # Un commit (et un fsync) par écriture, comme sans mise en file
+    db = sqlite3.connect("direct.db")
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT, email TEXT, user_id TEXT)")
+    counter = iter(range(num_users))
+
+    def direct_commit():
+        with db:
+            db.execute("INSERT INTO users VALUES (?, ?, ?, ?)",
+                       (f"user{next(counter)}", user["password"], user["email"], user["user_id"]))
+
+    direct = measure(direct_commit, num_users)
+    db.close()
+
+    store = MetadataStore("server.db")
+    counter = iter(range(num_users))
+    queued = measure(lambda: store.save_user(f"user{next(counter)}", user), num_users)
+
+    for i in range(num_files):
+        store.add_file("general", {
+            "file_id": f"{i:08x}", "filename": f"file{i}.bin", "uploader": "user0",
+            "size": i, "path": f"uploads/{i}", "hash": None, "upload_date": datetime.now().isoformat()
+        })
+    store.close()
+
+    start = time.perf_counter()
+    server = FileShareServer(metadata_db="server.db")
+    startup = (time.perf_counter() - start) * 1000
+    _servers.append(server)
+    start = time.perf_counter()
+    files = server.files_by_room["general"]
+    first_access = (time.perf_counter() - start) * 1000
+
+    report(f"\n📊 Métadonnées SQLite ({num_users} comptes, {num_files} fichiers)")
+    report("-" * 60)
+    report(f"{'REGISTER, commit par écriture':40} {direct:>10.1f} µs")
+    report(f"{'REGISTER, écritures groupées':40} {queued:>10.1f} µs")
+    report(f"{'démarrage du serveur':40} {startup:>10.1f} ms")
+    report(f"{'1er accès à une room (' + str(len(files)) + ' fichiers)':40} {first_access:>10.1f} ms")
+
+
+def codec_payloads(server, num_files=200, num_members=50):
+    """Payloads représentatifs: message de chat, liste des rooms, SYNC_DATA"""
+    now = datetime.now().isoformat()
+    files = [
+        {"filename": f"rapport_{i}.pdf", "uploader": f"user{i % 20}", "size": 1_000_000 + i, "upload_date": now}
+        for i in range(num_files)
+    ]
+    return {
+        "MESSAGE": {
+            "username": "alice",
+            "message": "Salut tout le monde, le build de ce soir est prêt 🚀",
+            "room_id": "general",
+            "timestamp": now
+        },
+        "ROOMS_LIST": {
+            "rooms": [
+                {"id": room_id, "name": room["name"], "description": room["description"], "members_count": 12}
+                for room_id, room in server.rooms.items()
+            ]
+        },
+        "SYNC_DATA": {
+            "state": "syncing",
+            "room_id": "general",
+            "room_name": "Général",
+            "files": files,
+            "members": [f"user{i}" for i in range(num_members)],
+            "total_files_size": sum(f["size"] for f in files)
+        },
+    }
+
+
+def bench_codec(duration=0.5):
+    """Trames encodées + décodées par seconde et taille sur le fil, par codec"""
+    server = make_server()
+    payloads = codec_payloads(server)
+
+    report("\n📊 Codecs des trames (encodage + décodage)")
+    report("-" * 60)
+    missing = [name for name in ("msgpack", "cbor") if name not in CODECS]
+    if missing:
+        report(f"⚠️  Non installé(s): {', '.join(missing)} (pip install msgpack cbor2)")
+
+    for message_type, payload in payloads.items():
+        for codec in CODECS:
+            frame = encode_frame(make_message(message_type, payload, codec), codec)
+
+            # Enveloppe (horodatage compris), encodage et décodage: le coût complet d'une trame
+            count = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                for _ in range(100):
+                    body = encode_frame(make_message(message_type, payload, codec), codec)[FRAME_HEADER.size:]
+                    decode_body(body, codec)
+                count += 100
+            rate = count / (time.perf_counter() - start)
+
+            report(f"{message_type + ' / ' + codec:30} {rate:>10.0f} trames/s {len(frame):>8} octets")
+
+
+def bench_chatlog(num_senders=8, duration=1.0):
+    """Messages journalisés par seconde pour chaque politique de fsync"""
+    make_server()
+    message = {
+        "username": "alice",
+        "message": "Salut tout le monde, le build de ce soir est prêt 🚀",
+        "room_id": "general",
+        "timestamp": datetime.now().isoformat()
+    }
+
+    report(f"\n📊 Journal de chat ({num_senders} émetteurs, une room)")
+    report("-" * 60)
+    for policy in FSYNC_POLICIES:
+        chat_log = ChatLog(os.path.join("chat_logs", policy), fsync_policy=policy)
+        deadline = time.perf_counter() + duration
+
+        def sender():
+            while time.perf_counter() < deadline:
+                chat_log.append("general", message)
+                chat_log.commit("general")
+
+        start = time.perf_counter()
+        senders = [threading.Thread(target=sender) for _ in range(num_senders)]
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+        chat_log.close()
+        elapsed = time.perf_counter() - start
+
+        stats = chat_log.stats()
+        report(f"{policy:10} {stats['messages'] / elapsed:>12.0f} messages/s {stats['fsyncs']:>8} fsync")
+
+
+def chat_latencies(client, until):
+    """Aller-retour d'un message de chat (envoi → diffusion reçue) en boucle jusqu'à until()"""
+    latencies = []
+    while not until():
+        start = time.perf_counter()
+        client.send_message("SEND_MESSAGE", {"session_token": client.session_token, "message": "ping"})
+        while client.receive_message()["type"] != "MESSAGE":
+            pass
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def login_storm(server, usernames, num_threads=8):
+    """Tous les comptes se reconnectent en même temps (un LOGIN par connexion)"""
+    frame_of = {
+        username: encode_frame(make_message("LOGIN", {"username": username, "password": "bench"}))
+        for username in usernames
+    }
+
+    def reconnect(batch):
+        sockets = [socket.create_connection((server.host, server.port)) for _ in batch]
+        for sock, username in zip(sockets, batch):
+            sock.sendall(frame_of[username])
+        for sock in sockets:
+            size = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))[0]
+            assert decode_body(recv_exact(sock, size))["type"] == "LOGIN_SUCCESS"
+            sock.close()
+
+    threads = [threading.Thread(target=reconnect, args=(usernames[i::num_threads],)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def bench_logins(num_users=1_000):
+    """Débit de LOGIN et latence du chat pendant la reconnexion de num_users clients"""
+    # Comptes avec un hash scrypt chacun (un sel par compte), calculés dans le pool
+    hasher = PasswordHasher()
+    with ThreadPoolExecutor(hasher.max_pending) as executor:
+        hashes = list(executor.map(hasher.hash, ["bench"] * num_users))
+    hasher.close()
+    usernames = [f"user{i}" for i in range(num_users)]
+
+    report(f"\n📊 Reconnexion de {num_users} clients (LOGIN scrypt) pendant un chat")
+    report("   (latence = aller-retour d'un message de chat, p50 / p99 / max en ms)")
+    report("-" * 60)
+
+    for mode in ("threaded", "async"):
+        for label, workers in (("KDF dans la connexion", 0), ("KDF en pool", None)):
+            server = start_server(mode=mode, passwords=PasswordHasher(workers), rate_limiter=None)
+            for username, password_hash in zip(usernames, hashes):
+                server.users[username] = {"password": password_hash, "email": None, "user_id": username}
+            chatter = connect_client(server, "chatter")
+
+            deadline = time.perf_counter() + 0.5
+            idle = chat_latencies(chatter, lambda: time.perf_counter() > deadline)
+            report(f"{mode + ' / ' + label:34} {'sans rafale':>14} "
+                   f"{idle[len(idle) // 2] * 1000:>6.2f} / {idle[len(idle) * 99 // 100] * 1000:>6.2f} / "
+                   f"{idle[-1] * 1000:>6.2f}")
+
+            # 2e rafale dans le TTL du cache: les vérifications réussies ne repassent pas par le KDF
+            for storm in ("rafale", "rafale (cache)"):
+                start = time.perf_counter()
+                threads = login_storm(server, usernames)
+                latencies = chat_latencies(chatter, lambda: not any(thread.is_alive() for thread in threads))
+                elapsed = time.perf_counter() - start
+                latencies = latencies or [0.0]
+                report(f"{'':34} {storm:>14} "
+                       f"{latencies[len(latencies) // 2] * 1000:>6.2f} / "
+                       f"{latencies[len(latencies) * 99 // 100] * 1000:>6.2f} / "
+                       f"{latencies[-1] * 1000:>6.2f}   {num_users / elapsed:>8.0f} LOGIN/s")
+
+            chatter.socket.close()
+            server.stop()
+
+
+def paced_latencies(client, until, interval=0.25):
+    """Aller-retour de ses propres messages de chat, un toutes les interval secondes, jusqu'à until()"""
+    latencies = []
+    while not until():
+        start = time.perf_counter()
+        client.send_message("SEND_MESSAGE", {"session_token": client.session_token, "message": "ping"})
+        while True:
+            message = client.receive_message()
+            if message is None:
+                return sorted(latencies)
+            if message["type"] == "MESSAGE" and message["payload"]["username"] == client.pseudo:
+                break
+        latencies.append(time.perf_counter() - start)
+        time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+    return sorted(latencies)
+
+
+def bench_flood(room_size=50, duration=2.0):
+    """Un client envoie SEND_MESSAGE en boucle: diffusions et latence des autres membres, avec et sans limite"""
+    report(f"\n📊 Flood de SEND_MESSAGE par un client, room de {room_size} membres ({duration:.0f} s)")
+    report("   (latence = aller-retour du message d'un autre membre, p50 / p99 en ms)")
+    report("-" * 60)
+
+    for mode in ("threaded", "async"):
+        for label, limits in (("sans limite", None), ("seaux à jetons", DEFAULT_RATE_LIMITS)):
+            server = start_server(mode=mode, rate_limiter=RateLimiter(limits) if limits else None)
+            flooder = connect_client(server, "flooder")
+            chatter = connect_client(server, "chatter")
+            chatter.socket.settimeout(5)
+            # Un serveur qui ne lit plus le flooder ne doit pas bloquer le benchmark
+            flooder.socket.settimeout(0.1)
+            members = [connect_client(server, f"m{i}") for i in range(room_size - 2)]
+            time.sleep(0.2)
+
+            frame = encode_frame(make_message(
+                "SEND_MESSAGE", {"session_token": flooder.session_token, "message": "spam"}
+            ))
+            deadline = time.perf_counter() + duration
+
+            def flood():
+                while time.perf_counter() < deadline:
+                    try:
+                        flooder.socket.sendall(frame)
+                    except OSError:
+                        pass
+
+            first_seq = server.room_events["general"].seq
+            thread = threading.Thread(target=flood)
+            thread.start()
+            latencies = paced_latencies(chatter, lambda: time.perf_counter() > deadline)
+            thread.join()
+            broadcasts = server.room_events["general"].seq - first_seq
+
+            refused = 0
+            if server.rate_limiter:
+                refused = sum(server.rate_limiter.stats()["chat"]["limited"].values())
+            # Pas de latence: le message du membre a été abandonné par sa file saturée
+            latency = (f"{latencies[len(latencies) // 2] * 1000:>7.2f} / "
+                       f"{latencies[len(latencies) * 99 // 100] * 1000:>7.2f}" if latencies else f"{'perdu':>17}")
+            report(f"{mode + ' / ' + label:28} {broadcasts / duration:>8.0f} diffusions/s "
+                   f"({broadcasts * room_size / duration:>9,.0f} trames/s)  {latency}  {refused:>8} refusés")
+
+            for client in [flooder, chatter] + members:
+                client.socket.close()
+            server.stop()
+
+
+BENCHMARKS = {
+    "registry": bench_registry,
+    "lookup": bench_lookup,
+    "pages": bench_pages,
+    "download": bench_download,
+    "upload": bench_upload,
+    "codec": bench_codec,
+    "writes": bench_writes,
+    "broadcast": bench_broadcast,
+    "metadata": bench_metadata,
+    "chatlog": bench_chatlog,
+    "logins": bench_logins,
+    "flood": bench_flood,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"❌ Benchmark inconnu: {name} (disponibles: {', '.join(BENCHMARKS)})")
+            continue
+        # Les logs du serveur et du client sont masqués, seuls les résultats s'affichent
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                BENCHMARKS[name]()
+            finally:
+                stop_servers()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Journal des messages de chat, en ajout seul, un par room
+
+Chaque room écrit ses messages (une ligne JSON par message) dans des
+segments chat_logs/<room_id>/<numéro>.log. Quand un segment dépasse
+segment_size, il est scellé et un nouveau est ouvert ; les segments scellés
+au-delà des keep_segments plus récents sont compactés (gzip), jamais effacés.
+
+Politiques de synchronisation disque (fsync_policy):
+- "always" : un fsync par message, rien n'est perdu sur une panne
+- "group"  : commit groupé, un thread synchronise toutes les rooms modifiées
+             toutes les group_window secondes, ou dès que group_bytes octets
+             attendent ; une panne perd au plus cette fenêtre
+- "never"  : écriture dans le cache du système, le noyau décide du flush
+
+append() ne fait que l'écriture : l'appelant peut le tenir sous son propre
+lock pour que l'ordre du journal suive le sien, puis appeler commit() une fois
+ce lock relâché (fsync de "always", compression des segments scellés).
+
+Au démarrage, les derniers messages de chaque room sont relus en mémoire.
+"""
+
+import gzip
+import json
+import os
+import threading
+from collections import deque
+
+
+FSYNC_POLICIES = ("always", "group", "never")
+
+
+class RoomLog:
+    """Segments d'une room et segment courant ouvert en ajout"""
+
+    def __init__(self, directory, recent_size):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()  # Un fsync de commit() à la fois
+        self.compact_lock = threading.Lock()
+        self.recent = deque(maxlen=recent_size)  # Derniers messages (dict)
+        self.dirty = 0  # Octets écrits depuis le dernier fsync
+        self.rolled = False  # Segment scellé, compression à faire par commit()
+        self.fd = None
+        self.size = 0
+        self.segment = 0
+
+    def segments(self):
+        """Numéros des segments existants (compactés ou non), du plus ancien au plus récent"""
+        numbers = set()
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            for suffix in (".log", ".log.gz"):
+                if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+                    numbers.add(int(name[:-len(suffix)]))
+        return sorted(numbers)
+
+    def segment_path(self, number, compressed=False):
+        return os.path.join(self.directory, f"{number:08d}.log" + (".gz" if compressed else ""))
+
+    def open_segment(self, number):
+        self.segment = number
+        path = self.segment_path(number)
+        self.truncate_torn_line(path)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.size = os.fstat(self.fd).st_size
+
+    @staticmethod
+    def truncate_torn_line(path):
+        """Couper une dernière ligne incomplète (panne pendant une écriture)
+
+        Sinon le prochain message serait collé à elle et perdu à la relecture.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 64 * 1024)
+                f.seek(start)
+                block = f.read(position - start)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                f.truncate(position)
+
+    def read_segment(self, number):
+        """Messages d'un segment (une ligne tronquée par une panne est ignorée)"""
+        path = self.segment_path(number)
+        if os.path.exists(path):
+            f = open(path, "rb")
+        else:
+            f = gzip.open(self.segment_path(number, compressed=True), "rb")
+
+        messages = []
+        with f:
+            for line in f:
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    continue
+        return messages
+
+
+class ChatLog:
+    """Journal de chat de toutes les rooms"""
+
+    def __init__(self, root="chat_logs", fsync_policy="group", group_window=0.01, group_bytes=256 * 1024,
+                 segment_size=4 * 1024 * 1024, keep_segments=4, recent_size=200):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Politique fsync inconnue: {fsync_policy}")
+
+        self.root = root
+        self.fsync_policy = fsync_policy
+        self.group_window = group_window
+        self.group_bytes = group_bytes
+        self.segment_size = segment_size
+        self.keep_segments = keep_segments
+        self.recent_size = recent_size
+        os.makedirs(self.root, exist_ok=True)
+
+        self.rooms = {}  # {room_id: RoomLog}
+        self.rooms_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.appended = 0
+        self.fsyncs = 0
+
+        # Rejouer les rooms déjà journalisées
+        for entry in os.scandir(self.root):
+            if entry.is_dir():
+                self.room(entry.name)
+
+        self.running = True
+        self.wakeup = threading.Event()
+        self.flusher = None
+        if self.fsync_policy == "group":
+            self.flusher = threading.Thread(target=self._flush_loop, name="ChatLog-Flusher", daemon=True)
+            self.flusher.start()
+
+    def room(self, room_id):
+        """Journal d'une room (ouvert et rejoué à la première utilisation)"""
+        log = self.rooms.get(room_id)
+        if log is not None:
+            return log
+
+        with self.rooms_lock:
+            log = self.rooms.get(room_id)
+            if log is None:
+                log = RoomLog(os.path.join(self.root, room_id), self.recent_size)
+                self.replay(log)
+                self.rooms[room_id] = log
+            return log
+
+    def replay(self, log):
+        """Relire les derniers messages, du segment le plus récent vers les plus anciens"""
+        numbers = log.segments()
+        for number in reversed(numbers):
+            if len(log.recent) >= log.recent.maxlen:
+                break
+            messages = log.read_segment(number)
+            missing = log.recent.maxlen - len(log.recent)
+            log.recent.extendleft(reversed(messages[-missing:]))
+
+        # Reprendre l'écriture dans le dernier segment s'il n'est pas compacté
+        last = numbers[-1] if numbers else 1
+        if not os.path.exists(log.segment_path(last)) and numbers:
+            last += 1
+        log.open_segment(last)
+
+    def append(self, room_id, message):
+        """Écrire un message (dict) dans le journal de la room, sans fsync (voir commit)"""
+        line = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        log = self.room(room_id)
+
+        with log.lock:
+            if log.fd is None:
+                # Journal fermé (arrêt du serveur)
+                return
+            view = memoryview(line)
+            while view:
+                written = os.write(log.fd, view)
+                view = view[written:]
+            log.size += len(line)
+            log.dirty += len(line)
+            log.recent.append(message)
+
+            if log.size >= self.segment_size:
+                self.roll(log)
+                log.rolled = True
+
+        with self.stats_lock:
+            self.appended += 1
+
+        if self.fsync_policy == "group" and log.dirty >= self.group_bytes:
+            self.wakeup.set()
+
+    def commit(self, room_id):
+        """Terminer les ajouts de la room: fsync ("always") et compression des segments scellés
+
+        À appeler après append(), hors des locks de l'appelant. Avec "always",
+        les messages écrits avant l'appel sont sur disque au retour.
+        """
+        log = self.room(room_id)
+
+        if self.fsync_policy == "always":
+            # Un appel concurrent qui trouve dirty à 0 attend le fsync en cours
+            with log.sync_lock:
+                with log.lock:
+                    fd = log.fd if log.dirty else None
+                    log.dirty = 0
+                if fd is not None:
+                    try:
+                        # Hors de log.lock: les autres émetteurs continuent d'écrire
+                        os.fsync(fd)
+                        self._count_fsync()
+                    except OSError:
+                        # Segment scellé entre-temps (roll l'a déjà synchronisé)
+                        pass
+
+        if log.rolled:
+            log.rolled = False
+            # La room continue d'écrire pendant la compression
+            self.compact_old_segments(log)
+
+    def recent(self, room_id):
+        """Derniers messages de la room (du plus ancien au plus récent)"""
+        log = self.room(room_id)
+        with log.lock:
+            return list(log.recent)
+
+    def roll(self, log):
+        """Sceller le segment courant et en ouvrir un nouveau (log.lock tenu)"""
+        if self.fsync_policy != "never":
+            os.fsync(log.fd)
+            log.dirty = 0
+            self._count_fsync()
+        os.close(log.fd)
+        log.open_segment(log.segment + 1)
+
+    def compact_old_segments(self, log):
+        """Compresser les segments scellés au-delà des keep_segments plus récents"""
+        if not log.compact_lock.acquire(blocking=False):
+            # Une compression est déjà en cours pour cette room
+            return
+        try:
+            # Le dernier segment est le segment courant
+            for number in log.segments()[:-(self.keep_segments + 1)]:
+                self.compact(log, number)
+        finally:
+            log.compact_lock.release()
+
+    def compact(self, log, number):
+        """Compresser un segment scellé (le .log n'est supprimé qu'une fois le .gz complet)"""
+        path = log.segment_path(number)
+        if not os.path.exists(path):
+            return
+        compressed = log.segment_path(number, compressed=True)
+        with open(path, "rb") as source, gzip.open(compressed + ".tmp", "wb") as target:
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                target.write(chunk)
+        os.replace(compressed + ".tmp", compressed)
+        os.remove(path)
+
+    def _count_fsync(self):
+        with self.stats_lock:
+            self.fsyncs += 1
+
+    def _flush_loop(self):
+        while self.running:
+            self.wakeup.wait(self.group_window)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """fsync de toutes les rooms modifiées depuis le dernier commit"""
+        for log in list(self.rooms.values()):
+            with log.lock:
+                if not log.dirty:
+                    continue
+                fd = log.fd
+                log.dirty = 0
+            try:
+                # Hors du lock: les messages suivants s'ajoutent pendant le fsync
+                os.fsync(fd)
+            except OSError:
+                # Segment scellé entre-temps (roll l'a déjà synchronisé)
+                continue
+            self._count_fsync()
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        for log in list(self.rooms.values()):
+            with log.lock:
+                if log.fd is not None:
+                    if self.fsync_policy != "never":
+                        os.fsync(log.fd)
+                    os.close(log.fd)
+                    log.fd = None
+
+    def stats(self):
+        with self.stats_lock:
+            return {"messages": self.appended, "fsyncs": self.fsyncs}
@@ -1,24 +1,64 @@
 import socket
-import json
+import hashlib
+import io
 import threading
 import sys
 import os
-import struct
-from datetime import datetime
+import select
+import time
+from collections import deque
 from tkinter import Tk, filedialog
 
+from protocol import (
+    CHUNK_HEADER, CODEC_PREFERENCE, PROTOCOL_VERSION, TRANSFER_BUFFER_SIZE,
+    FrameReader, decode_body, encode_frame, make_message, recv_exact, recv_to_file
+)
+
 
 class FileShareClient:
+    # Nombre de reconnexions tentées pour reprendre un upload interrompu
+    MAX_UPLOAD_RETRIES = 5
+    # Fichiers demandés par page de LIST_ROOM_FILES
+    FILES_PAGE_SIZE = 20
+    # Messages récents demandés en rejoignant une room, puis par /history
+    HISTORY_PAGE_SIZE = 20
+    # Événements de room numérotés par le serveur (seq)
+    ROOM_EVENT_TYPES = {"MESSAGE", "USER_JOINED", "USER_LEFT", "USER_KICKED", "FILE_SHARED", "FILE_DELETED"}
+    # Intervalle (secondes) du thread qui répond aux PING quand personne ne lit la connexion
+    KEEPALIVE_POLL = 1.0
+    # Trames lues par ce thread en attendant d'être demandées (au-delà, les plus anciennes sont perdues)
+    MAX_PENDING = 1000
+    
     def __init__(self, host='localhost', port=5555):
         self.host = host
         self.port = port
         self.socket = None
+        self.reader = None  # Lecture bufferisée des trames (et des flux de fichiers)
         self.pseudo = None
         self.session_token = None
         self.current_room = None
         self.current_room_name = None
         self.running = False
         self.listening = False
+        self.codec = "json"  # Codec des trames, négocié par HELLO à la connexion
+        self.send_lock = threading.Lock()  # Une trame ou un flux d'upload à la fois sur le socket
+        # Un seul lecteur à la fois (appel en cours, listener du chat ou thread keep-alive) ;
+        # les trames lues par le keep-alive attendent dans pending
+        self.recv_lock = threading.RLock()
+        self.pending = deque(maxlen=self.MAX_PENDING)
+        
+        # Buffer de réception réutilisé pour tous les téléchargements
+        self.transfer_buffer = bytearray(TRANSFER_BUFFER_SIZE)
+        
+        # État synchronisé de chaque room (SYNC_ROOM incrémental):
+        # {room_id: {"epoch": "", "version": 0, "files": {file_id: infos}, "members": set()}}
+        self.room_sync = {}
+        
+        # Dernier événement reçu de la room courante (RESUME après reconnexion)
+        self.room_epoch = None
+        self.last_seq = None
+        self.missing_seqs = set()  # Numéros sautés, en attente de RESUMED
+        self.history_before = None  # Curseur HISTORY vers les messages plus anciens
         
         # P2P attributes
         self.p2p_connections = {}  # {username: socket}
@@ -29,63 +69,144 @@ class FileShareClient:
     def connect(self):
         """Se connecter au serveur"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((self.host, self.port))
+            with self.recv_lock:
+                self.socket = sock
+                self.reader = FrameReader(sock)
+                self.pending.clear()
             print(f"✅ Connecté au serveur {self.host}:{self.port}")
+            self.hello()
+            
+            # Répondre aux PING du serveur même dans les menus et les saisies
+            threading.Thread(target=self.keep_alive, args=(sock,), daemon=True).start()
             return True
         except Exception as e:
             print(f"❌ Erreur de connexion: {e}")
             return False
     
+    def hello(self):
+        """Négocier le codec des trames (un serveur sans HELLO garde le JSON)"""
+        self.codec = "json"
+        self.send_message("HELLO", {
+            "version": PROTOCOL_VERSION,
+            "codecs": CODEC_PREFERENCE
+        })
+        response = self.receive_message()
+        if response and response["type"] == "HELLO_ACK":
+            self.codec = response["payload"].get("codec", "json")
+    
+    def reconnect(self):
+        """Rétablir la connexion et reprendre la session (token + room courante)"""
+        try:
+            self.socket.close()
+        except Exception:
+            pass
+        
+        if not self.connect():
+            return False
+        
+        if self.session_token and self.current_room:
+            # RESUME: rejoindre la room et recevoir seulement les événements manqués
+            self.send_message("RESUME", {
+                "session_token": self.session_token,
+                "room_id": self.current_room,
+                "epoch": self.room_epoch,
+                "last_seq": self.last_seq
+            })
+            response = self.receive_message()
+            if not response or response["type"] != "JOIN_SUCCESS":
+                return False
+            response = self.receive_message()
+            if not response or response["type"] != "RESUMED":
+                return False
+            self.apply_resumed(response["payload"])
+        return True
+    
+    def apply_resumed(self, payload):
+        """Afficher les événements rejoués par RESUMED et avancer le curseur"""
+        if payload.get("gap"):
+            print("\r\033[K⚠️  Trop d'événements manqués: synchronise la room (menu) pour tout récupérer")
+        for event in payload.get("events", []):
+            seq = event["payload"].get("seq")
+            # Pendant une reconnexion tout est manqué ; sinon seuls les numéros sautés
+            if self.missing_seqs and seq not in self.missing_seqs:
+                continue
+            self.show_room_event(event["type"], event["payload"])
+        self.missing_seqs.clear()
+        self.room_epoch = payload.get("epoch")
+        self.last_seq = max(self.last_seq or 0, payload.get("last_seq", 0))
+    
     def send_message(self, message_type, payload):
         """Envoyer un message au serveur"""
-        message = {
-            "type": message_type,
-            "payload": payload,
-            "timestamp": datetime.now().isoformat()
-        }
         try:
-            # Encoder le message JSON en UTF-8
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
-            
-            # Créer l'en-tête de taille (4 octets, int 32 bits, big-endian)
-            size_header = struct.pack('>I', len(message_bytes))
+            # Encoder dans le codec négocié, précédé de l'en-tête de taille (4 octets)
+            frame = encode_frame(make_message(message_type, payload, self.codec), self.codec)
             
-            # Envoyer l'en-tête puis les données
-            self.socket.sendall(size_header + message_bytes)
+            # Envoyer l'en-tête et les données (le listener peut répondre PONG en même temps)
+            with self.send_lock:
+                self.socket.sendall(frame)
         except Exception as e:
             print(f"❌ Erreur d'envoi: {e}")
     
     def receive_message(self):
-        """Recevoir un message du serveur"""
+        """Recevoir un message du serveur (d'abord ceux déjà lus par le keep-alive)"""
+        with self.recv_lock:
+            if self.pending:
+                return self.pending.popleft()
+            return self.read_message()
+    
+    def receive_response(self):
+        """Réponse à la dernière requête: les événements de room reçus avant elle sont traités au passage"""
+        while True:
+            message = self.receive_message()
+            if not message or message.get("type") not in self.ROOM_EVENT_TYPES:
+                return message
+            self.receive_room_event(message["type"], message.get("payload", {}))
+    
+    def read_message(self):
+        """Lire la prochaine trame sur le socket (appelant: recv_lock)"""
         try:
-            # Lire l'en-tête de taille (4 octets)
-            size_header = b''
-            while len(size_header) < 4:
-                chunk = self.socket.recv(4 - len(size_header))
-                if not chunk:
-                    return None
-                size_header += chunk
-            
-            # Décoder la taille du message
-            message_size = struct.unpack('>I', size_header)[0]
-            
-            # Lire exactement message_size octets
-            message_bytes = b''
-            while len(message_bytes) < message_size:
-                chunk = self.socket.recv(message_size - len(message_bytes))
-                if not chunk:
+            while True:
+                message_bytes = self.reader.read_frame()
+                if message_bytes is None:
                     return None
-                message_bytes += chunk
-            
-            # Décoder et parser le JSON
-            message_str = message_bytes.decode('utf-8')
-            return json.loads(message_str)
+                
+                # Décoder le corps (JSON ou codec négocié)
+                message = decode_body(message_bytes, self.codec)
+                
+                # Heartbeat du serveur: répondre sans le remonter à l'appelant
+                if message.get("type") != "PING":
+                    return message
+                self.send_message("PONG", {})
         except Exception as e:
             print(f"❌ Erreur de réception: {e}")
             return None
     
+    def keep_alive(self, sock):
+        """Lire la connexion quand personne d'autre ne le fait, pour répondre aux PING du serveur
+        
+        Sans lecteur (menus, saisie du pseudo...), les PING resteraient sans réponse
+        et le serveur fermerait la connexion. Les autres trames lues ici sont
+        rendues par le prochain receive_message.
+        """
+        while self.socket is sock:
+            time.sleep(self.KEEPALIVE_POLL)
+            # Un appel en cours ou le listener du chat lit déjà (et répond aux PING)
+            if not self.recv_lock.acquire(blocking=False):
+                continue
+            try:
+                while self.socket is sock and (self.reader.buffer or select.select([sock], [], [], 0)[0]):
+                    message = self.read_message()
+                    if message is None:
+                        return
+                    self.pending.append(message)
+            except (OSError, ValueError):
+                # Socket fermé
+                return
+            finally:
+                self.recv_lock.release()
+    
     def choose_pseudo(self):
         """Interface de sélection du pseudo"""
         print("\n" + "="*50)
@@ -232,7 +353,8 @@ class FileShareClient:
         
         self.send_message("JOIN_ROOM", {
             "session_token": self.session_token,
-            "room_id": room_id
+            "room_id": room_id,
+            "history": self.HISTORY_PAGE_SIZE
         })
         
         response = self.receive_message()
@@ -241,9 +363,14 @@ class FileShareClient:
                 self.current_room = response['payload']['room_id']
                 self.current_room_name = response['payload']['room_name']
                 members = response['payload']['members']
+                self.room_epoch = response['payload'].get('epoch')
+                self.last_seq = response['payload'].get('last_seq')
+                self.missing_seqs.clear()
                 
                 print(f"\n✅ Tu as rejoint #{self.current_room_name}!")
                 print(f"👥 Membres: {', '.join(members)}\n")
+                self.history_before = response['payload'].get('history_before')
+                self.show_history(response['payload'].get('history', []))
                 print("="*50)
                 print("💬 Démarre la conversation! (tape 'quit' pour quitter)")
                 print("="*50 + "\n")
@@ -258,33 +385,35 @@ class FileShareClient:
         """Écouter les messages entrants en arrière-plan"""
         while self.listening:
             try:
-                response = self.receive_message()
+                with self.recv_lock:
+                    response = self.receive_message()
+                    if response and not self.listening:
+                        # Sorti du chat pendant la lecture: la trame revient au menu
+                        self.pending.appendleft(response)
+                        break
                 if not response:
                     break
                 
                 msg_type = response.get("type")
                 payload = response.get("payload", {})
                 
-                if msg_type == "MESSAGE":
-                    username = payload.get("username")
-                    message = payload.get("message")
-                    print(f"\r\033[K💬 {username}: {message}")
-                    print(f"[{self.pseudo}] > ", end="", flush=True)
-                
-                elif msg_type == "USER_JOINED":
-                    username = payload.get("username")
-                    print(f"\r\033[K✅ {username} a rejoint la room")
-                    print(f"[{self.pseudo}] > ", end="", flush=True)
+                if msg_type in self.ROOM_EVENT_TYPES:
+                    self.receive_room_event(msg_type, payload)
                 
-                elif msg_type == "USER_LEFT":
-                    username = payload.get("username")
-                    print(f"\r\033[K👋 {username} a quitté la room")
-                    print(f"[{self.pseudo}] > ", end="", flush=True)
+                elif msg_type == "HISTORY_DATA":
+                    print("\r\033[K", end="")
+                    self.history_before = payload.get("before")
+                    if payload.get("messages"):
+                        self.show_history(payload["messages"])
+                    else:
+                        print("📜 Pas de messages plus anciens")
+                    if self.current_room:
+                        print(f"[{self.pseudo}] > ", end="", flush=True)
                 
-                elif msg_type == "USER_KICKED":
-                    username = payload.get("username")
-                    print(f"\r\033[K⚠️  {username} a été kické")
-                    print(f"[{self.pseudo}] > ", end="", flush=True)
+                elif msg_type == "RESUMED":
+                    self.apply_resumed(payload)
+                    if self.current_room:
+                        print(f"[{self.pseudo}] > ", end="", flush=True)
                 
                 elif msg_type == "KICKED":
                     reason = payload.get("reason", "Vous avez été déconnecté")
@@ -331,19 +460,98 @@ class FileShareClient:
                     if self.current_room:
                         print(f"[{self.pseudo}] > ", end="", flush=True)
                 
-                elif msg_type == "FILE_SHARED":
-                    filename = payload.get("filename")
-                    uploader = payload.get("uploader")
-                    size = payload.get("size")
-                    size_mb = size / (1024 * 1024)
-                    print(f"\r\033[K📎 {uploader} a partagé '{filename}' ({size_mb:.2f} MB)")
-                    print(f"[{self.pseudo}] > ", end="", flush=True)
+                elif msg_type == "ERROR" and payload.get("code") == "RATE_LIMITED":
+                    # Message de chat ou demande P2P refusé: rien n'a été diffusé
+                    print(f"\r\033[K⏳ Trop de messages, réessaie dans {payload.get('retry_after', 1):.1f}s")
+                    if self.current_room:
+                        print(f"[{self.pseudo}] > ", end="", flush=True)
                 
             except Exception as e:
                 if self.listening:
                     print(f"\n❌ Erreur de réception: {e}")
                 break
     
+    def receive_room_event(self, msg_type, payload):
+        """Événement de room reçu en direct: ignorer les doublons, rattraper les trous"""
+        seq = payload.get("seq")
+        if seq is not None and self.last_seq is not None:
+            if seq <= self.last_seq:
+                # Déjà reçu (rejoué par RESUMED)
+                return
+            if seq > self.last_seq + 1:
+                # Événements perdus (client lent): demander ceux qui manquent
+                self.missing_seqs.update(range(self.last_seq + 1, seq))
+                self.send_message("RESUME", {
+                    "session_token": self.session_token,
+                    "room_id": self.current_room,
+                    "epoch": self.room_epoch,
+                    "last_seq": self.last_seq
+                })
+        if seq is not None:
+            self.last_seq = seq
+        self.show_room_event(msg_type, payload)
+    
+    def show_room_event(self, msg_type, payload):
+        """Afficher un événement de room (MESSAGE, USER_JOINED, FILE_SHARED...)"""
+        if msg_type == "MESSAGE":
+            username = payload.get("username")
+            message = payload.get("message")
+            print(f"\r\033[K💬 {username}: {message}")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+        
+        elif msg_type == "USER_JOINED":
+            username = payload.get("username")
+            print(f"\r\033[K✅ {username} a rejoint la room")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+        
+        elif msg_type == "USER_LEFT":
+            username = payload.get("username")
+            print(f"\r\033[K👋 {username} a quitté la room")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+        
+        elif msg_type == "USER_KICKED":
+            username = payload.get("username")
+            print(f"\r\033[K⚠️  {username} a été kické")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+        
+        elif msg_type == "FILE_SHARED":
+            filename = payload.get("filename")
+            uploader = payload.get("uploader")
+            size = payload.get("size")
+            size_mb = size / (1024 * 1024)
+            print(f"\r\033[K📎 {uploader} a partagé '{filename}' ({size_mb:.2f} MB)")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+        
+        elif msg_type == "FILE_DELETED":
+            filename = payload.get("filename")
+            uploader = payload.get("uploader")
+            print(f"\r\033[K🗑️  {uploader} a supprimé '{filename}'")
+            print(f"[{self.pseudo}] > ", end="", flush=True)
+    
+    def show_history(self, messages):
+        """Afficher des messages passés de la room (du plus ancien au plus récent)"""
+        if not messages:
+            return
+        print(f"📜 {len(messages)} message(s) précédent(s):")
+        for message in messages:
+            time_str = message.get("timestamp", "")[11:16]
+            print(f"   [{time_str}] {message.get('username')}: {message.get('message')}")
+        if self.history_before is not None:
+            print("   (/history pour remonter plus loin)")
+        print()
+    
+    def request_history(self):
+        """Demander les messages plus anciens que ceux déjà affichés"""
+        if self.history_before is None:
+            print("📜 Pas de messages plus anciens")
+            return
+        self.send_message("HISTORY", {
+            "session_token": self.session_token,
+            "room_id": self.current_room,
+            "before": self.history_before,
+            "limit": self.HISTORY_PAGE_SIZE
+        })
+    
     def send_chat_message(self, message):
         """Envoyer un message dans la room"""
         if not self.session_token or not self.current_room:
@@ -396,9 +604,10 @@ class FileShareClient:
     
     def listen_p2p_messages(self, peer_username, p2p_socket):
         """Écouter les messages P2P d'un pair"""
+        reader = FrameReader(p2p_socket)
         while self.running:
             try:
-                message = self.receive_message_from_socket(p2p_socket)
+                message = self.receive_message_from_socket(reader)
                 if not message:
                     print(f"\r\033[K❌ {peer_username} s'est déconnecté du P2P")
                     break
@@ -425,31 +634,13 @@ class FileShareClient:
         except:
             pass
     
-    def receive_message_from_socket(self, sock):
-        """Recevoir un message d'un socket spécifique"""
+    def receive_message_from_socket(self, reader):
+        """Recevoir un message d'une connexion P2P (via son FrameReader)"""
         try:
-            # Lire l'en-tête de taille (4 octets)
-            size_header = b''
-            while len(size_header) < 4:
-                chunk = sock.recv(4 - len(size_header))
-                if not chunk:
-                    return None
-                size_header += chunk
-            
-            # Décoder la taille du message
-            message_size = struct.unpack('>I', size_header)[0]
-            
-            # Lire exactement message_size octets
-            message_bytes = b''
-            while len(message_bytes) < message_size:
-                chunk = sock.recv(message_size - len(message_bytes))
-                if not chunk:
-                    return None
-                message_bytes += chunk
-            
-            # Décoder et parser le JSON
-            message_str = message_bytes.decode('utf-8')
-            return json.loads(message_str)
+            message_bytes = reader.read_frame()
+            if message_bytes is None:
+                return None
+            return decode_body(message_bytes)
         except Exception as e:
             return None
     
@@ -461,24 +652,11 @@ class FileShareClient:
         
         p2p_socket = self.p2p_connections[peer_username]
         
-        msg = {
-            "type": "P2P_MESSAGE",
-            "payload": {
-                "message": message
-            },
-            "timestamp": datetime.now().isoformat()
-        }
+        msg = make_message("P2P_MESSAGE", {"message": message})
         
         try:
-            # Encoder le message JSON en UTF-8
-            message_json = json.dumps(msg)
-            message_bytes = message_json.encode('utf-8')
-            
-            # Créer l'en-tête de taille (4 octets, int 32 bits, big-endian)
-            size_header = struct.pack('>I', len(message_bytes))
-            
-            # Envoyer l'en-tête puis les données
-            p2p_socket.sendall(size_header + message_bytes)
+            # Trame JSON (les connexions P2P ne négocient pas de codec)
+            p2p_socket.sendall(encode_frame(msg))
             print(f"✅ Message P2P envoyé à {peer_username}")
         except Exception as e:
             print(f"❌ Erreur d'envoi P2P: {e}")
@@ -519,10 +697,15 @@ class FileShareClient:
                         print("❌ Usage: /msg username message")
                     continue
                 
+                if message.strip().lower() == '/history':
+                    self.request_history()
+                    continue
+                
                 if message.strip().lower() == '/help':
                     print("\n📋 Commandes disponibles:")
                     print("  /p2p username    - Demander connexion P2P")
                     print("  /msg username text - Envoyer message P2P")
+                    print("  /history         - Afficher les messages plus anciens")
                     print("  quit             - Quitter la room\n")
                     continue
                 
@@ -571,7 +754,8 @@ class FileShareClient:
         print("4. ⬆️  Partager un fichier dans la room")
         print("5. ⬇️  Télécharger un fichier de la room")
         print("6. 🔄 Synchroniser la room")
-        print("7. 🚪 Déconnexion")
+        print("7. 🗑️  Supprimer un de mes fichiers")
+        print("8. 🚪 Déconnexion")
         print("="*50)
     
     def list_room_files(self):
@@ -641,61 +825,199 @@ class FileShareClient:
             print("❌ Ce n'est pas un fichier!")
             return
         
+        self.send_file(file_path)
+    
+    def send_file(self, file_path):
+        """Envoyer un fichier dans la room (retourne True si l'upload a réussi)"""
         filename = os.path.basename(file_path)
         file_size = os.path.getsize(file_path)
         
         if file_size > 100 * 1024 * 1024:
             print("❌ Fichier trop volumineux! (max 100 MB)")
-            return
+            return False
         
         size_mb = file_size / (1024 * 1024)
-        print(f"\n⏳ Envoi de '{filename}' ({size_mb:.2f} MB)...")
         
-        # Envoyer la requête d'upload
-        self.send_message("UPLOAD_FILE", {
+        # Le serveur stocke les contenus par SHA-256: inutile de renvoyer ce qu'il a déjà
+        file_hash = self.compute_hash(file_path)
+        if self.check_upload(file_hash, file_size):
+            print(f"\n♻️  '{filename}' est déjà sur le serveur, aucun envoi nécessaire")
+        else:
+            print(f"\n⏳ Envoi de '{filename}' ({size_mb:.2f} MB)...")
+        
+        upload_id = None
+        attempts = 0
+        
+        while True:
+            try:
+                if upload_id is None:
+                    # Envoyer la requête d'upload
+                    self.send_message("UPLOAD_FILE", {
+                        "session_token": self.session_token,
+                        "filename": filename,
+                        "size": file_size,
+                        "hash": file_hash
+                    })
+                else:
+                    # Reprendre là où le serveur s'est arrêté
+                    self.send_message("UPLOAD_RESUME", {
+                        "session_token": self.session_token,
+                        "upload_id": upload_id
+                    })
+                
+                # Attendre confirmation (un autre membre peut arriver ou partir entre-temps)
+                response = self.receive_response()
+                if response is None:
+                    raise ConnectionError("Connexion perdue")
+                if response["type"] == "UPLOAD_COMPLETE":
+                    # Contenu déjà stocké (ou envoyé au même moment par un autre client)
+                    print(f"✅ Fichier '{filename}' partagé dans la room!")
+                    return True
+                if response["type"] == "ERROR" and response["payload"].get("code") == "RATE_LIMITED":
+                    # Trop d'uploads rapprochés: redemander après le délai indiqué
+                    retry_after = response["payload"].get("retry_after", 1)
+                    print(f"⏳ Trop d'uploads, nouvel essai dans {retry_after:.1f}s")
+                    time.sleep(retry_after)
+                    continue
+                if (response["type"] == "ERROR" and upload_id is not None
+                        and response["payload"].get("code") == "UPLOAD_IN_PROGRESS"):
+                    # Le serveur n'a pas encore libéré l'upload de l'ancienne connexion
+                    attempts += 1
+                    if attempts > self.MAX_UPLOAD_RETRIES:
+                        print("❌ L'upload est toujours en cours sur le serveur")
+                        return False
+                    time.sleep(min(2 ** (attempts - 1), 10))
+                    continue
+                if response["type"] != "UPLOAD_READY":
+                    print("❌ Le serveur n'est pas prêt à recevoir")
+                    return False
+                
+                upload_id = response['payload']['upload_id']
+                offset = response['payload'].get('offset', 0)
+                if offset:
+                    print(f"🔄 Reprise à {offset / (1024 * 1024):.2f} MB")
+                
+                self.send_upload_data(file_path, offset, file_size)
+                
+                print("\n⏳ Attente de confirmation...")
+                
+                # Attendre confirmation finale
+                response = self.receive_response()
+                if response is None:
+                    raise ConnectionError("Connexion perdue")
+                if response["type"] == "UPLOAD_COMPLETE":
+                    print(f"✅ Fichier '{filename}' partagé dans la room!")
+                    return True
+                print("❌ Erreur lors de l'upload")
+                return False
+            
+            except (ConnectionError, OSError) as e:
+                attempts += 1
+                if upload_id is None or attempts > self.MAX_UPLOAD_RETRIES:
+                    print(f"\n❌ Erreur d'upload: {e}")
+                    return False
+                
+                print(f"\n🔄 Connexion perdue, reprise de l'upload ({attempts}/{self.MAX_UPLOAD_RETRIES})...")
+                time.sleep(min(2 ** (attempts - 1), 10))
+                if not self.reconnect():
+                    print("❌ Reconnexion impossible, upload abandonné")
+                    return False
+    
+    def compute_hash(self, file_path):
+        """SHA-256 du fichier, lu dans le buffer de transfert réutilisable"""
+        digest = hashlib.sha256()
+        view = memoryview(self.transfer_buffer)
+        with open(file_path, 'rb') as f:
+            while True:
+                n = f.readinto(view)
+                if not n:
+                    break
+                digest.update(view[:n])
+        return digest.hexdigest()
+    
+    def check_upload(self, file_hash, file_size):
+        """Demander au serveur s'il possède déjà ce contenu (UPLOAD_CHECK)"""
+        self.send_message("UPLOAD_CHECK", {
             "session_token": self.session_token,
-            "filename": filename,
+            "hash": file_hash,
             "size": file_size
         })
-        
-        # Attendre confirmation
         response = self.receive_message()
-        if not response or response["type"] != "UPLOAD_READY":
-            print("❌ Le serveur n'est pas prêt à recevoir")
-            return
-        
-        # Envoyer le fichier par chunks
-        try:
-            with open(file_path, 'rb') as f:
-                sent = 0
-                while sent < file_size:
-                    chunk = f.read(8192)
-                    if not chunk:
-                        break
-                    
-                    # Envoyer la taille du chunk (8 octets)
-                    chunk_size = struct.pack('!Q', len(chunk))
-                    self.socket.sendall(chunk_size)
-                    
-                    # Envoyer le chunk
-                    self.socket.sendall(chunk)
-                    sent += len(chunk)
-                    
-                    # Afficher progression
-                    progress = (sent / file_size) * 100
-                    print(f"\r⏳ Progression: {progress:.1f}%", end="", flush=True)
+        return bool(response and response["type"] == "UPLOAD_CHECK_RESULT"
+                    and response["payload"].get("exists"))
+    
+    def send_upload_data(self, file_path, offset, file_size):
+        """Envoyer le fichier à partir de offset, par gros chunks lus dans le buffer réutilisable"""
+        view = memoryview(self.transfer_buffer)
+        # Aucune trame (PONG) ne doit s'intercaler entre les chunks
+        with self.send_lock, open(file_path, 'rb') as f:
+            f.seek(offset)
+            sent = offset
+            while sent < file_size:
+                n = f.readinto(view[:file_size - sent])
+                if not n:
+                    break
+                
+                # Envoyer la taille du chunk (8 octets) puis le chunk
+                self.socket.sendall(CHUNK_HEADER.pack(n))
+                self.socket.sendall(view[:n])
+                sent += n
+                
+                # Afficher progression
+                progress = (sent / file_size) * 100
+                print(f"\r⏳ Progression: {progress:.1f}%", end="", flush=True)
+    
+    def choose_room_file(self, action):
+        """Afficher les fichiers de la room page par page et en faire choisir un (retourne son entrée ou None)"""
+        files = []
+        cursor = None
+        while True:
+            # 1. Récupérer la page suivante des fichiers de la room
+            payload = {
+                "session_token": self.session_token,
+                "limit": self.FILES_PAGE_SIZE
+            }
+            if cursor:
+                payload["cursor"] = cursor
+            self.send_message("LIST_ROOM_FILES", payload)
+            response = self.receive_message()
+            if not response or response["type"] != "ROOM_FILES_LIST":
+                break
             
-            print("\n⏳ Attente de confirmation...")
+            page = response['payload']['files']
+            cursor = response['payload'].get('next_cursor')
+            if not page:
+                break
             
-            # Attendre confirmation finale
-            response = self.receive_message()
-            if response and response["type"] == "UPLOAD_COMPLETE":
-                print(f"✅ Fichier '{filename}' partagé dans la room!")
-            else:
-                print("❌ Erreur lors de l'upload")
+            if not files:
+                print(f"\n📁 Fichiers disponibles dans #{self.current_room_name} "
+                      f"({response['payload'].get('total', len(page))}) :")
+                print("-" * 70)
+            for idx, file in enumerate(page, len(files) + 1):
+                size_mb = file['size'] / (1024 * 1024)
+                print(f"{idx}. {file['filename']:30} | {size_mb:>6.2f} MB | par {file['uploader']}")
+            files.extend(page)
+            
+            # 2. Demander à l'utilisateur de choisir (ou d'afficher la page suivante)
+            print("-" * 70)
+            prompt = f"\nNuméro du fichier à {action}"
+            choix = input(prompt + (" (Entrée = page suivante): " if cursor else ": ")).strip()
+            if not choix and cursor:
+                continue
+            try:
+                choix = int(choix)
+                if choix < 1 or choix > len(files):
+                    print("❌ Numéro invalide!")
+                    return None
+            except Exception:
+                print("❌ Entrée invalide!")
+                return None
+            
+            return files[choix-1]
         
-        except Exception as e:
-            print(f"\n❌ Erreur d'upload: {e}")
+        if not files:
+            print(f"\n📁 Aucun fichier à {action} dans #{self.current_room_name}")
+        return None
     
     def download_file(self):
         """Télécharger un fichier de la room (avec affichage de la liste)"""
@@ -703,103 +1025,200 @@ class FileShareClient:
             print("❌ Non connecté à une room!")
             return
         
-        # 1. Récupérer la liste des fichiers de la room
-        self.send_message("LIST_ROOM_FILES", {
-            "session_token": self.session_token
-        })
-        response = self.receive_message()
-        files = []
-        if response and response["type"] == "ROOM_FILES_LIST":
-            files = response['payload']['files']
-        
-        if not files:
-            print(f"\n📁 Aucun fichier à télécharger dans #{self.current_room_name}")
+        file = self.choose_room_file("télécharger")
+        if file is None:
             return
         
-        print(f"\n📁 Fichiers disponibles dans #{self.current_room_name} :")
-        print("-" * 70)
-        for idx, file in enumerate(files, 1):
-            size_mb = file['size'] / (1024 * 1024)
-            print(f"{idx}. {file['filename']:30} | {size_mb:>6.2f} MB | par {file['uploader']}")
-        print("-" * 70)
-        
-        # 2. Demander à l'utilisateur de choisir
-        choix = input("\nNuméro du fichier à télécharger: ").strip()
-        try:
-            choix = int(choix)
-            if choix < 1 or choix > len(files):
-                print("❌ Numéro invalide!")
-                return
-        except Exception:
-            print("❌ Entrée invalide!")
+        print(f"\n⏳ Téléchargement de '{file['filename']}'...")
+        # Par identifiant: plusieurs fichiers de la room peuvent porter ce nom
+        self.fetch_file(file['filename'], file_id=file.get('file_id'))
+    
+    def delete_file(self):
+        """Supprimer un fichier que l'on a partagé dans la room"""
+        if not self.session_token or not self.current_room:
+            print("❌ Non connecté à une room!")
             return
         
-        filename = files[choix-1]['filename']
-        print(f"\n⏳ Téléchargement de '{filename}'...")
+        file = self.choose_room_file("supprimer")
+        if file is None:
+            return
+        filename = file['filename']
         
-        # Envoyer la requête de download
-        self.send_message("DOWNLOAD_FILE", {
+        self.send_message("DELETE_FILE", {
             "session_token": self.session_token,
-            "filename": filename
+            "filename": filename,
+            "file_id": file.get('file_id')
         })
-        
-        # Attendre confirmation
         response = self.receive_message()
-        if not response or response["type"] != "DOWNLOAD_READY":
-            if response and response["type"] == "ERROR":
-                print(f"❌ Erreur: {response['payload']['error']}")
-            else:
-                print("❌ Fichier introuvable")
-            return
-        
-        file_size = response['payload']['size']
-        download_path = f"downloads_{filename}"
+        if response and response["type"] == "FILE_DELETED":
+            print(f"🗑️  Fichier '{filename}' supprimé de la room")
+        elif response and response["type"] == "ERROR":
+            print(f"❌ Erreur: {response['payload']['error']}")
+    
+    def request_download(self, filename, mode="stream", offset=0, length=None, file_id=None, if_range=None):
+        """Envoyer DOWNLOAD_FILE (plage optionnelle) et retourner la réponse du serveur"""
+        payload = {
+            "session_token": self.session_token,
+            "filename": filename,
+            "mode": mode,
+            "offset": offset
+        }
+        if length is not None:
+            payload["length"] = length
+        if file_id is not None:
+            payload["file_id"] = file_id
+        if if_range is not None:
+            payload["if_range"] = if_range
+        
+        self.send_message("DOWNLOAD_FILE", payload)
+        return self.receive_response()
+    
+    def fetch_file(self, filename, destination_dir="downloads", mode="stream", file_id=None):
+        """Télécharger un fichier de la room (retourne le chemin local ou None)
         
+        Les données arrivent dans <fichier>.part, et le file_id du fichier servi
+        dans <fichier>.part.id: un téléchargement interrompu reprend à la fin du
+        .part au prochain appel, seulement si le serveur sert encore ce fichier.
+        """
         # Créer le dossier downloads s'il n'existe pas
-        os.makedirs("downloads", exist_ok=True)
-        download_path = os.path.join("downloads", filename)
-        
-        # Recevoir le fichier par chunks
-        try:
-            received = 0
-            with open(download_path, 'wb') as f:
-                while received < file_size:
-                    # Lire la taille du chunk (8 octets)
-                    chunk_size_data = self.socket.recv(8)
-                    if not chunk_size_data or len(chunk_size_data) < 8:
-                        break
-                    
-                    chunk_size = struct.unpack('!Q', chunk_size_data)[0]
-                    
-                    # Lire le chunk
-                    chunk_data = b''
-                    while len(chunk_data) < chunk_size:
-                        remaining = chunk_size - len(chunk_data)
-                        data = self.socket.recv(min(8192, remaining))
-                        if not data:
-                            break
-                        chunk_data += data
-                    
-                    f.write(chunk_data)
-                    received += len(chunk_data)
-                    
-                    # Afficher progression
-                    progress = (received / file_size) * 100
-                    print(f"\r⏳ Progression: {progress:.1f}%", end="", flush=True)
+        os.makedirs(destination_dir, exist_ok=True)
+        download_path = os.path.join(destination_dir, filename)
+        part_path = download_path + ".part"
+        id_path = part_path + ".id"
+        # Réponse et flux de données lus d'un bloc: le keep-alive ne lit rien entre les deux
+        with self.recv_lock:
+            offset, part_file_id = 0, None
+            try:
+                with open(id_path, encoding="utf-8") as f:
+                    part_file_id = f.read().strip()
+                offset = os.path.getsize(part_path)
+            except OSError:
+                # .part d'origine inconnue (ou absent): il ne peut pas être complété
+                pass
+            
+            # Envoyer la requête de download (mode stream: un seul bloc envoyé par sendfile) ;
+            # if_range: le serveur renvoie tout le fichier s'il ne sert plus celui du .part
+            response = self.request_download(filename, mode, offset, file_id=file_id,
+                                             if_range=part_file_id if offset else None)
+            if offset and response and response["type"] == "ERROR" \
+                    and response["payload"].get("code") == "INVALID_RANGE":
+                # Le .part ne correspond plus au fichier distant: tout reprendre
+                response = self.request_download(filename, mode, 0, file_id=file_id)
+            
+            # Attendre confirmation
+            if not response or response["type"] != "DOWNLOAD_READY":
+                if response and response["type"] == "ERROR":
+                    print(f"❌ Erreur: {response['payload']['error']}")
+                else:
+                    print("❌ Fichier introuvable")
+                return None
+            
+            file_size = response['payload']['size']
+            offset = response['payload'].get('offset', 0)
+            length = response['payload'].get('length', file_size - offset)
+            transfer_mode = response['payload'].get('mode', 'chunked')
+            
+            if offset:
+                print(f"🔄 Reprise du téléchargement à {offset / (1024 * 1024):.2f} MB")
+            elif part_file_id and os.path.exists(part_path):
+                print("🔄 Le fichier a changé sur le serveur, téléchargement depuis le début")
+            
+            def show_progress(received):
+                progress = ((offset + received) / file_size) * 100 if file_size else 100
+                print(f"\r⏳ Progression: {progress:.1f}%", end="", flush=True)
+            
+            try:
+                if not offset:
+                    with open(id_path, 'w', encoding="utf-8") as f:
+                        f.write(response['payload'].get('file_id') or "")
+                with open(part_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    f.truncate()
+                    if transfer_mode == "stream":
+                        received = self.receive_stream(f, show_progress)
+                    else:
+                        received = self.receive_chunks(f, length, show_progress)
+                
+                if received == length:
+                    os.replace(part_path, download_path)
+                    os.remove(id_path)
+                    print(f"\n✅ Fichier téléchargé: {download_path}")
+                    return download_path
+                
+                print(f"\n❌ Téléchargement incomplet ({offset + received}/{file_size} octets), "
+                      f"reprise possible")
+            
+            except Exception as e:
+                print(f"\n❌ Erreur de téléchargement: {e}")
+            return None
+    
+    def fetch_range(self, filename, offset, length):
+        """Lire seulement une plage d'un fichier de la room (retourne les octets ou None)"""
+        # Réponse et flux de données lus d'un bloc: le keep-alive ne lit rien entre les deux
+        with self.recv_lock:
+            response = self.request_download(filename, "stream", offset, length)
+            if not response or response["type"] != "DOWNLOAD_READY":
+                return None
             
-            if received == file_size:
-                print(f"\n✅ Fichier téléchargé: {download_path}")
+            length = response['payload'].get('length', response['payload']['size'])
+            data = io.BytesIO()
+            if response['payload'].get('mode') == "stream":
+                received = self.receive_stream(data)
             else:
-                print(f"\n❌ Téléchargement incomplet ({received}/{file_size} octets)")
-                os.remove(download_path)
-        
-        except Exception as e:
-            print(f"\n❌ Erreur de téléchargement: {e}")
-            if os.path.exists(download_path):
-                os.remove(download_path)
+                received = self.receive_chunks(data, length)
+            
+            return data.getvalue() if received == length else None
+    
+    def receive_stream(self, f, progress=None):
+        """Recevoir un fichier envoyé en un seul bloc (mode stream)"""
+        header = recv_exact(self.reader, CHUNK_HEADER.size)
+        if header is None:
+            return 0
+        length = CHUNK_HEADER.unpack(header)[0]
+        return recv_to_file(self.reader, f, length, self.transfer_buffer, progress)
+    
+    def receive_chunks(self, f, file_size, progress=None):
+        """Recevoir un fichier envoyé par chunks de 8 KB (mode historique)"""
+        received = 0
+        while received < file_size:
+            # Lire la taille du chunk (8 octets)
+            chunk_size_data = recv_exact(self.reader, CHUNK_HEADER.size)
+            if chunk_size_data is None:
+                break
+            
+            chunk_size = CHUNK_HEADER.unpack(chunk_size_data)[0]
+            
+            # Lire le chunk
+            chunk_received = recv_to_file(self.reader, f, chunk_size, self.transfer_buffer)
+            received += chunk_received
+            if chunk_received < chunk_size:
+                break
+            
+            if progress:
+                progress(received)
+        return received
+    
+    def apply_sync_data(self, payload):
+        """Mettre à jour l'état local de la room avec un SYNC_DATA (complet ou différence)"""
+        state = self.room_sync.get(payload["room_id"])
+        if payload.get("full", True) or state is None:
+            state = self.room_sync[payload["room_id"]] = {
+                "files": {f["file_id"]: f for f in payload.get("files", [])},
+                "members": set(payload.get("members", []))
+            }
+        else:
+            for f in payload.get("files_added", []):
+                state["files"][f["file_id"]] = f
+            for file_id in payload.get("files_removed", []):
+                state["files"].pop(file_id, None)
+            state["members"].update(payload.get("members_joined", []))
+            state["members"].difference_update(payload.get("members_left", []))
+        state["epoch"] = payload.get("epoch")
+        state["version"] = payload.get("version")
+        return state
     
     def sync_room(self):
-        """Synchroniser la room - Démonstration d'une action avec séquence d'états"""
+        """Synchroniser la room: séquence d'états, seule la différence depuis la dernière synchro est reçue"""
         if not self.session_token or not self.current_room:
             print("❌ Non connecté à une room!")
             return
@@ -807,10 +1226,13 @@ class FileShareClient:
         print(f"\n🔄 Synchronisation de #{self.current_room_name}...")
         print("Cette action passe par plusieurs états intermédiaires:\n")
         
-        # Envoyer la requête de synchronisation
-        self.send_message("SYNC_ROOM", {
-            "session_token": self.session_token
-        })
+        # Envoyer la requête de synchronisation (avec le curseur de la précédente)
+        request = {"session_token": self.session_token}
+        previous = self.room_sync.get(self.current_room)
+        if previous and previous.get("version") is not None:
+            request["since_version"] = previous["version"]
+            request["epoch"] = previous["epoch"]
+        self.send_message("SYNC_ROOM", request)
         
         # Recevoir et traiter les états de la séquence
         state_count = 0
@@ -840,13 +1262,18 @@ class FileShareClient:
                 print(f"📊 ÉTAT 3/4 : Réception des données")
                 print(f"   ├─ State: {state}")
                 print(f"   ├─ Room: {payload.get('room_name')}")
-                files = payload.get('files', [])
-                members = payload.get('members', [])
+                room_state = self.apply_sync_data(payload)
                 total_size = payload.get('total_files_size', 0)
                 
-                print(f"   ├─ Fichiers synchronisés: {len(files)}")
+                if payload.get('full', True):
+                    print(f"   ├─ État complet (version {payload.get('version')})")
+                else:
+                    print(f"   ├─ Différence → version {payload.get('version')}: "
+                          f"+{len(payload.get('files_added', []))} / -{len(payload.get('files_removed', []))} fichiers, "
+                          f"+{len(payload.get('members_joined', []))} / -{len(payload.get('members_left', []))} membres")
+                print(f"   ├─ Fichiers: {len(room_state['files'])}")
                 print(f"   ├─ Taille totale: {total_size / (1024*1024):.2f} MB")
-                print(f"   └─ Membres actifs: {', '.join(members)}\n")
+                print(f"   └─ Membres actifs: {', '.join(sorted(room_state['members']))}\n")
                 state_count += 1
             
             elif msg_type == "SYNC_COMPLETE":
@@ -924,6 +1351,8 @@ class FileShareClient:
             elif choice == "6":
                 self.sync_room()
             elif choice == "7":
+                self.delete_file()
+            elif choice == "8":
                 self.send_message("LOGOUT", {"session_token": self.session_token})
                 print(f"\n👋 À bientôt {self.pseudo}!")
                 self.running = False
@@ -0,0 +1,2 @@
+# test_multi_clients.py est un script à lancer contre un serveur démarré (python test_multi_clients.py)
+collect_ignore = ["test_multi_clients.py"]
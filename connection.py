@@ -0,0 +1,573 @@
+"""
+Adaptateurs de connexion utilisés par le serveur
+
+Les handlers du serveur manipulent un objet "socket-like" (send_frame,
+sendall, recv, close, codec). Chaque connexion possède une file sortante bornée
+vidée par son propre writer (un thread en mode threaded, une tâche asyncio
+en mode async) : un client lent ne bloque jamais l'émetteur d'un broadcast.
+
+Le writer regroupe toutes les trames en attente et les envoie en un seul
+appel système (sendmsg / writelines), sans les concaténer.
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from protocol import MAX_FRAME_SIZE, FrameReader
+
+
+# Politiques appliquées quand la file sortante d'un client lent est pleine
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Nombre max de buffers par appel sendmsg
+try:
+    IOV_MAX = min(os.sysconf("SC_IOV_MAX"), 1024)
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
+
+class _Frame:
+    """Trame du protocole en attente d'envoi (peut être abandonnée)
+
+    parts: buffers de la trame (en-tête, corps) envoyés tels quels.
+    """
+    __slots__ = ("parts", "key")
+
+    def __init__(self, parts, key):
+        self.parts = parts
+        self.key = key
+
+
+class _RawWrite:
+    """Données brutes (flux de fichier) : jamais abandonnées, l'appelant attend"""
+    __slots__ = ("data", "done", "error")
+
+    def __init__(self, data):
+        self.data = data
+        self.done = threading.Event()
+        self.error = None
+
+
+class _FileWrite(_RawWrite):
+    """Portion de fichier envoyée sans copie (sendfile)"""
+    __slots__ = ("file", "offset", "count")
+
+    def __init__(self, file, offset, count):
+        super().__init__(b'')
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+
+class OutboundQueue:
+    """File bornée de trames sortantes d'une connexion"""
+
+    def __init__(self, max_frames=256, policy="drop_oldest"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Politique inconnue: {policy}")
+
+        self.max_frames = max_frames
+        self.policy = policy
+        self.items = deque()
+        # Trames retenues pendant un flux binaire (begin_stream / end_stream):
+        # elles ne doivent pas s'intercaler dans les données du fichier
+        self.held = None
+        self.frame_count = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.on_ready = None  # Callback de réveil du writer (mode async)
+
+        # Compteurs exposés au dashboard
+        self.sent_frames = 0
+        self.writes = 0  # Appels d'écriture du writer (plusieurs trames par appel)
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def put_frame(self, parts, key=None):
+        """Ajouter une trame (retourne False si le client doit être déconnecté)"""
+        with self.condition:
+            if self.closed:
+                return True
+
+            if self.frame_count >= self.max_frames:
+                if self.policy == "disconnect":
+                    self.dropped += 1
+                    return False
+
+                if self.policy == "coalesce" and key is not None and self._replace_frame(key, parts):
+                    self.coalesced += 1
+                    return True
+
+                self._drop_oldest_frame()
+
+            frame = _Frame(parts, key)
+            self.frame_count += 1
+            self.max_depth = max(self.max_depth, self.frame_count)
+            if self.held is not None:
+                self.held.append(frame)
+                return True
+            self.items.append(frame)
+            self.condition.notify()
+
+        if self.on_ready:
+            self.on_ready()
+        return True
+
+    def begin_stream(self, parts):
+        """Ajouter la trame qui annonce un flux binaire, retenir les trames suivantes"""
+        with self.condition:
+            if self.closed:
+                return
+            self.items.append(_Frame(parts, None))
+            self.frame_count += 1
+            self.held = deque()
+            self.condition.notify()
+
+        if self.on_ready:
+            self.on_ready()
+
+    def end_stream(self):
+        """Fin du flux binaire: les trames retenues partent à sa suite"""
+        with self.condition:
+            if self.held is None:
+                return
+            self.items.extend(self.held)
+            self.held = None
+            self.condition.notify()
+
+        if self.on_ready:
+            self.on_ready()
+
+    def put_raw(self, data):
+        """Ajouter des données brutes ordonnées avec les trames"""
+        return self._put_stream(_RawWrite(data))
+
+    def put_file(self, file, offset, count):
+        """Ajouter une portion de fichier à envoyer par sendfile"""
+        return self._put_stream(_FileWrite(file, offset, count))
+
+    def _put_stream(self, item):
+        with self.condition:
+            if self.closed:
+                item.error = ConnectionError("Connexion fermée")
+                item.done.set()
+                return item
+            self.items.append(item)
+            self.condition.notify()
+
+        if self.on_ready:
+            self.on_ready()
+        return item
+
+    def _queues(self):
+        return (self.items,) if self.held is None else (self.items, self.held)
+
+    def _replace_frame(self, key, parts):
+        """Remplacer la trame en attente de même clé par la plus récente"""
+        for queue in self._queues():
+            for item in queue:
+                if isinstance(item, _Frame) and item.key == key:
+                    item.parts = parts
+                    return True
+        return False
+
+    def _drop_oldest_frame(self):
+        for queue in self._queues():
+            for item in queue:
+                if isinstance(item, _Frame):
+                    queue.remove(item)
+                    self.frame_count -= 1
+                    self.dropped += 1
+                    return
+
+    def pop_batch(self):
+        """Retirer tous les éléments en attente (non bloquant)"""
+        with self.condition:
+            return self._take_all()
+
+    def wait_batch(self):
+        """Attendre des éléments ; retourne [] quand la file est fermée et vide"""
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            return self._take_all()
+
+    def only_frames(self):
+        """Vrai si aucune écriture brute (transfert en attente d'envoi) n'est en file"""
+        with self.condition:
+            return all(isinstance(item, _Frame) for item in self.items)
+
+    def _take_all(self):
+        batch = list(self.items)
+        self.items.clear()
+        self.frame_count = len(self.held) if self.held is not None else 0
+        return batch
+
+    def mark_sent(self, count, writes=1):
+        with self.condition:
+            self.sent_frames += count
+            self.writes += writes
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        if self.on_ready:
+            self.on_ready()
+
+    def fail_pending(self, error):
+        """Libérer les appelants en attente sur des écritures brutes"""
+        with self.condition:
+            pending = self._take_all()
+        for item in pending:
+            if isinstance(item, _RawWrite):
+                item.error = error
+                item.done.set()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": self.frame_count,
+                "max_depth": self.max_depth,
+                "sent": self.sent_frames,
+                "writes": self.writes,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "policy": self.policy
+            }
+
+
+def _fail_raw(batch, error):
+    """Libérer les écritures brutes d'un lot interrompu"""
+    for item in batch:
+        if isinstance(item, _RawWrite) and not item.done.is_set():
+            item.error = error
+            item.done.set()
+
+
+def _wait_raw(item):
+    """Attendre qu'une écriture brute soit sur le fil (ou en échec)"""
+    item.done.wait()
+    if item.error:
+        raise item.error
+
+
+def _send_vectored(sock, buffers):
+    """Envoyer des buffers sans les concaténer (retourne le nombre d'appels système)
+
+    sendmsg peut n'écrire qu'une partie: l'envoi reprend au premier octet non
+    parti. Sans sendmsg (Windows), les buffers sont joints en un seul sendall.
+    """
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b''.join(buffers))
+        return 1
+
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+    index = 0
+    calls = 0
+    while index < len(views):
+        sent = sock.sendmsg(views[index:index + IOV_MAX])
+        calls += 1
+        while index < len(views) and sent >= len(views[index]):
+            sent -= len(views[index])
+            index += 1
+        if sent:
+            views[index] = views[index][sent:]
+    return calls
+
+
+class ThreadedConnection:
+    """Connexion client du mode threaded : socket + thread writer dédié"""
+
+    # Délai max pour vider la file avant une fermeture forcée
+    CLOSE_TIMEOUT = 2.0
+
+    def __init__(self, sock, address, max_queue=256, policy="drop_oldest", max_frame_size=MAX_FRAME_SIZE,
+                 flush_window=0.0):
+        self.socket = sock
+        self.address = address
+        # Attente optionnelle (secondes) avant d'écrire des trames, pour en grouper davantage
+        self.flush_window = flush_window
+        self.codec = "json"  # Codec des trames, négocié par HELLO
+        self.throttle = 0  # Secondes sans lire la connexion après un refus RATE_LIMITED
+        # Lecture bufferisée: les trames et les flux binaires passent par le même buffer
+        self.reader = FrameReader(sock, max_frame_size)
+        self.outbound = OutboundQueue(max_queue, policy)
+        self.closed = False
+        self._shutdown_done = False
+        self._shutdown_lock = threading.Lock()
+
+        self.writer_thread = threading.Thread(
+            target=self._writer_loop,
+            name=f"Writer-{address[0]}:{address[1]}",
+            daemon=True
+        )
+        self.writer_thread.start()
+
+    def send_frame(self, parts, key=None):
+        """Mettre une trame (liste de buffers) en file (ne bloque jamais)"""
+        if not self.outbound.put_frame(parts, key):
+            print(f"🐢 Client lent déconnecté: {self.address}")
+            self.close(flush=False)
+
+    def begin_stream(self, parts):
+        """Envoyer la trame qui annonce un flux binaire (les suivantes attendent end_stream)"""
+        self.outbound.begin_stream(parts)
+
+    def end_stream(self):
+        self.outbound.end_stream()
+
+    def sendall(self, data):
+        """Envoyer des données brutes dans l'ordre de la file (bloquant)"""
+        if self.closed:
+            raise ConnectionError("Connexion fermée")
+        _wait_raw(self.outbound.put_raw(data))
+
+    def sendfile(self, file, offset=0, count=None):
+        """Envoyer une portion de fichier sans copie en espace utilisateur (bloquant)"""
+        if self.closed:
+            raise ConnectionError("Connexion fermée")
+        _wait_raw(self.outbound.put_file(file, offset, count))
+
+    def read_frame(self):
+        """Corps de la prochaine trame (None si la connexion se ferme)"""
+        return self.reader.read_frame()
+
+    def recv(self, bufsize):
+        return self.reader.recv(bufsize)
+
+    def recv_into(self, buffer, nbytes=0):
+        return self.reader.recv_into(buffer, nbytes)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def _writer_loop(self):
+        batch = []
+        try:
+            while True:
+                batch = self.outbound.wait_batch()
+                if not batch:
+                    break
+
+                # Trafic de chat: laisser arriver les trames suivantes pour les grouper
+                if self.flush_window and self.outbound.only_frames() and \
+                        all(isinstance(item, _Frame) for item in batch):
+                    time.sleep(self.flush_window)
+                    batch += self.outbound.pop_batch()
+
+                frames = 0
+                writes = 0
+                buffers = []
+                for item in batch:
+                    if isinstance(item, _Frame):
+                        buffers.extend(item.parts)
+                        frames += 1
+                        continue
+
+                    # Écriture brute: vider d'abord les trames qui la précèdent
+                    if buffers:
+                        writes += _send_vectored(self.socket, buffers)
+                        buffers = []
+                    if isinstance(item, _FileWrite):
+                        self.socket.sendfile(item.file, item.offset, item.count)
+                    else:
+                        self.socket.sendall(item.data)
+                    writes += 1
+                    item.done.set()
+
+                if buffers:
+                    writes += _send_vectored(self.socket, buffers)
+                self.outbound.mark_sent(frames, writes)
+        except OSError:
+            pass
+        finally:
+            error = ConnectionError("Connexion fermée")
+            _fail_raw(batch, error)
+            self.outbound.fail_pending(error)
+            self._shutdown_socket()
+
+    def _shutdown_socket(self):
+        with self._shutdown_lock:
+            if self._shutdown_done:
+                return
+            self._shutdown_done = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+    def close(self, flush=True):
+        """Fermer la connexion ; flush=True laisse le writer vider la file"""
+        if not self.closed:
+            self.closed = True
+            self.outbound.close()
+
+        if not flush:
+            self._shutdown_socket()
+        elif threading.current_thread() is not self.writer_thread:
+            # Fermeture forcée si le client ne lit plus
+            timer = threading.Timer(self.CLOSE_TIMEOUT, self._shutdown_socket)
+            timer.daemon = True
+            timer.start()
+
+
+class AsyncConnection:
+    """Connexion client gérée par la boucle asyncio (mode async)"""
+
+    def __init__(self, reader, writer, loop, max_queue=256, policy="drop_oldest", flush_window=0.0):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.flush_window = flush_window
+        self.address = writer.get_extra_info("peername")
+        self.codec = "json"  # Codec des trames, négocié par HELLO
+        self.throttle = 0  # Secondes sans lire la connexion après un refus RATE_LIMITED
+        self.closed = False
+        # La connexion est créée dans le thread de la boucle d'événements
+        self._loop_thread_id = threading.get_ident()
+
+        self.outbound = OutboundQueue(max_queue, policy)
+        self._wakeup = asyncio.Event()
+        self.outbound.on_ready = self._notify_writer
+        self.writer_task = loop.create_task(self._writer_loop())
+
+    def in_loop_thread(self):
+        """Vrai si l'appel est fait depuis le thread de la boucle"""
+        return threading.get_ident() == self._loop_thread_id
+
+    def _notify_writer(self):
+        if self.in_loop_thread():
+            self._wakeup.set()
+        else:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def send_frame(self, parts, key=None):
+        """Mettre une trame (liste de buffers) en file (ne bloque jamais)"""
+        if not self.outbound.put_frame(parts, key):
+            print(f"🐢 Client lent déconnecté: {self.address}")
+            self.close(flush=False)
+
+    def begin_stream(self, parts):
+        """Envoyer la trame qui annonce un flux binaire (les suivantes attendent end_stream)"""
+        self.outbound.begin_stream(parts)
+
+    def end_stream(self):
+        self.outbound.end_stream()
+
+    def sendall(self, data):
+        """Envoyer des données brutes dans l'ordre de la file"""
+        if self.closed:
+            raise ConnectionError("Connexion fermée")
+
+        item = self.outbound.put_raw(data)
+        # Depuis un thread de transfert: attendre l'écriture (contre-pression)
+        if not self.in_loop_thread():
+            _wait_raw(item)
+
+    def sendfile(self, file, offset=0, count=None):
+        """Envoyer une portion de fichier via loop.sendfile (depuis un thread de transfert)"""
+        if self.closed:
+            raise ConnectionError("Connexion fermée")
+        _wait_raw(self.outbound.put_file(file, offset, count))
+
+    async def _writer_loop(self):
+        batch = []
+        try:
+            while True:
+                # Une fois la file fermée on vide le reste sans attendre
+                if not self.outbound.closed:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+
+                if self.flush_window and not self.outbound.closed and self.outbound.only_frames():
+                    await asyncio.sleep(self.flush_window)
+
+                batch = self.outbound.pop_batch()
+                if not batch and self.outbound.closed:
+                    break
+
+                frames = 0
+                writes = 0
+                buffers = []
+                for item in batch:
+                    if isinstance(item, _Frame):
+                        buffers.extend(item.parts)
+                        frames += 1
+                        continue
+
+                    # Écriture brute: passer d'abord les trames qui la précèdent au transport
+                    if buffers:
+                        self.writer.writelines(buffers)
+                        writes += 1
+                        buffers = []
+                    if isinstance(item, _FileWrite):
+                        await self.writer.drain()
+                        await self.loop.sendfile(self.writer.transport, item.file, item.offset, item.count)
+                    else:
+                        self.writer.write(item.data)
+                        await self.writer.drain()
+                    writes += 1
+                    item.done.set()
+
+                if buffers:
+                    self.writer.writelines(buffers)
+                    writes += 1
+                await self.writer.drain()
+                self.outbound.mark_sent(frames, writes)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            error = ConnectionError("Connexion fermée")
+            _fail_raw(batch, error)
+            self.outbound.fail_pending(error)
+            self.writer.close()
+
+    def recv(self, bufsize):
+        """Lire jusqu'à bufsize octets (uniquement depuis un thread de transfert)"""
+        if self.in_loop_thread():
+            raise RuntimeError("recv bloquant interdit dans la boucle d'événements")
+
+        future = asyncio.run_coroutine_threadsafe(self.reader.read(bufsize), self.loop)
+        try:
+            return future.result()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return b''
+
+    def recv_into(self, buffer, nbytes=0):
+        """Lire dans un buffer existant (uniquement depuis un thread de transfert)"""
+        view = memoryview(buffer)
+        data = self.recv(nbytes or len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def fileno(self):
+        sock = self.writer.get_extra_info("socket")
+        return sock.fileno() if sock is not None else -1
+
+    def close(self, flush=True):
+        """Fermer la connexion (depuis n'importe quel thread)"""
+        if not self.closed:
+            self.closed = True
+            self.outbound.close()
+
+        if self.in_loop_thread():
+            self._schedule_abort(0 if not flush else ThreadedConnection.CLOSE_TIMEOUT)
+        else:
+            self.loop.call_soon_threadsafe(
+                self._schedule_abort, 0 if not flush else ThreadedConnection.CLOSE_TIMEOUT
+            )
+
+    def _schedule_abort(self, delay):
+        # Fermeture forcée si le writer n'a pas pu vider la file à temps
+        if delay:
+            self.loop.call_later(delay, self.writer.transport.abort)
+        else:
+            self.writer.transport.abort()
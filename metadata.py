@@ -0,0 +1,321 @@
+"""
+Stockage persistant des métadonnées du serveur (SQLite, mode WAL)
+
+Utilisateurs, sessions et fichiers partagés survivent à un redémarrage.
+Les écritures sont mises en file et validées par lots par un thread dédié :
+REGISTER ou la fin d'un upload ne paient jamais un commit (ni un fsync).
+Rien n'est chargé en entier au démarrage : un utilisateur, une session ou
+la liste des fichiers d'une room sont lus à la première utilisation.
+"""
+
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    email TEXT,
+    user_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username);
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    room_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    uploader TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    hash TEXT,
+    upload_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_room ON files (room_id, filename);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+"""
+
+FILE_COLUMNS = ("file_id", "room_id", "filename", "uploader", "size", "path", "hash", "upload_date")
+
+# Valeur en attente marquant une suppression pas encore validée
+_DELETED = object()
+
+
+class MetadataStore:
+    """Base SQLite avec écritures groupées en arrière-plan"""
+
+    # Délai max avant qu'une écriture soit validée
+    FLUSH_INTERVAL = 0.05
+    # Un lot refusé (base verrouillée, disque plein...) est retenté après RETRY_INTERVAL ;
+    # après MAX_FLUSH_RETRIES échecs, ses écritures sont rejouées une par une et
+    # celles qui échouent encore sont abandonnées
+    RETRY_INTERVAL = 1.0
+    MAX_FLUSH_RETRIES = 5
+
+    def __init__(self, path):
+        self.path = path
+
+        # Connexion d'écriture: utilisée seulement par le thread writer (et close)
+        self.write_db = sqlite3.connect(path, check_same_thread=False)
+        self.write_db.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL ne synchronise le disque qu'aux checkpoints
+        self.write_db.execute("PRAGMA synchronous=NORMAL")
+        self.write_db.executescript(SCHEMA)
+        # Bases créées avant l'expiration des sessions
+        columns = [row[1] for row in self.write_db.execute("PRAGMA table_info(sessions)")]
+        if "created" not in columns:
+            self.write_db.execute("ALTER TABLE sessions ADD COLUMN created REAL")
+        self.write_db.commit()
+        self.write_lock = threading.Lock()
+
+        # Connexion de lecture: le mode WAL permet de lire pendant un lot d'écriture
+        self.read_db = sqlite3.connect(path, check_same_thread=False)
+        self.read_lock = threading.Lock()
+
+        # Écritures pas encore validées, et dernière valeur connue par clé
+        # (une lecture doit voir une écriture même avant son commit)
+        self.pending = []  # [(sql, params)]
+        self.pending_values = {}  # {(table, clé): valeur ou _DELETED}
+        self.pending_lock = threading.Lock()
+        self.failed_flushes = 0  # Échecs consécutifs du lot en attente
+        self.dropped_writes = 0
+
+        # Nombre d'utilisateurs tenu à jour par save_user: le compter ne valide pas le lot en cours
+        self.user_count = self.write_db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        self.users_lock = threading.Lock()
+
+        self.running = True
+        self.wakeup = threading.Event()
+        self.writer_thread = threading.Thread(target=self._writer_loop, name="Metadata-Writer", daemon=True)
+        self.writer_thread.start()
+
+    # --- Écritures (mises en file) ---
+
+    def _queue(self, sql, params, table=None, key=None, value=None):
+        with self.pending_lock:
+            self.pending.append((sql, params))
+            if table is not None:
+                self.pending_values[(table, key)] = value
+        self.wakeup.set()
+
+    def save_user(self, username, user):
+        with self.users_lock:
+            created = self.load_user(username) is None
+            self._queue(
+                "INSERT OR REPLACE INTO users (username, password, email, user_id) VALUES (?, ?, ?, ?)",
+                (username, user["password"], user.get("email"), user["user_id"]),
+                "users", username, user
+            )
+            if created:
+                self.user_count += 1
+
+    def save_session(self, token, username, created):
+        self._queue(
+            "INSERT OR REPLACE INTO sessions (token, username, created) VALUES (?, ?, ?)",
+            (token, username, created),
+            "sessions", token, (username, created)
+        )
+
+    def delete_session(self, token):
+        self._queue("DELETE FROM sessions WHERE token = ?", (token,), "sessions", token, _DELETED)
+
+    def purge_sessions(self, created_before):
+        """Supprimer les sessions créées avant created_before (et celles sans date)"""
+        self._queue("DELETE FROM sessions WHERE created IS NULL OR created < ?", (created_before,))
+
+    def add_file(self, room_id, file_metadata):
+        row = {column: file_metadata.get(column) for column in FILE_COLUMNS}
+        row["room_id"] = room_id
+        self._queue(
+            f"INSERT OR REPLACE INTO files ({', '.join(FILE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in FILE_COLUMNS)})",
+            tuple(row[column] for column in FILE_COLUMNS),
+            "files", row["file_id"], row
+        )
+
+    def delete_file(self, file_id):
+        self._queue("DELETE FROM files WHERE file_id = ?", (file_id,), "files", file_id, _DELETED)
+
+    def _writer_loop(self):
+        while self.running:
+            self.wakeup.wait()
+            # Laisser les écritures suivantes rejoindre le lot
+            self.wakeup.clear()
+            time.sleep(self.FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                # Le thread ne doit pas mourir: les écritures suivantes ne seraient plus validées
+                print(f"❌ Erreur du writer de la base: {e}")
+            if self.pending:
+                # Lot reporté: réessayer sans attendre une nouvelle écriture
+                time.sleep(self.RETRY_INTERVAL)
+                self.wakeup.set()
+
+    def flush(self, retry=True):
+        """Valider toutes les écritures en attente en une transaction
+
+        Si la transaction échoue, le lot est remis en tête de file (retry) ;
+        sinon, ou après MAX_FLUSH_RETRIES échecs, ses écritures sont rejouées
+        une par une et celles qui échouent sont abandonnées.
+        """
+        with self.write_lock:
+            with self.pending_lock:
+                batch = self.pending
+                written = dict(self.pending_values)
+                self.pending = []
+            if not batch:
+                return
+
+            try:
+                with self.write_db:
+                    for sql, params in batch:
+                        self.write_db.execute(sql, params)
+                self.failed_flushes = 0
+            except sqlite3.Error as e:
+                self.failed_flushes += 1
+                if retry and self.failed_flushes < self.MAX_FLUSH_RETRIES:
+                    print(f"⚠️  Écriture en base reportée ({len(batch)} écritures): {e}")
+                    # Les valeurs en attente restent visibles en lecture
+                    with self.pending_lock:
+                        self.pending[:0] = batch
+                    return
+                print(f"⚠️  Lot refusé par la base ({e}), écritures rejouées une par une")
+                self.failed_flushes = 0
+                self._execute_each(batch)
+
+            # Les lectures peuvent désormais passer par la base
+            with self.pending_lock:
+                for key, value in written.items():
+                    if self.pending_values.get(key) is value:
+                        del self.pending_values[key]
+
+    def _execute_each(self, batch):
+        """Valider chaque écriture seule, abandonner celles que la base refuse"""
+        for sql, params in batch:
+            try:
+                with self.write_db:
+                    self.write_db.execute(sql, params)
+            except sqlite3.Error as e:
+                self.dropped_writes += 1
+                print(f"❌ Écriture en base abandonnée ({sql.split(' (')[0]}): {e}")
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        self.writer_thread.join()
+        self.flush(retry=False)
+        self.write_db.close()
+        self.read_db.close()
+
+    # --- Lectures ---
+
+    def _pending(self, table, key):
+        with self.pending_lock:
+            return self.pending_values.get((table, key))
+
+    def _query(self, sql, params=()):
+        with self.read_lock:
+            return self.read_db.execute(sql, params).fetchall()
+
+    def load_user(self, username):
+        value = self._pending("users", username)
+        if value is not None:
+            return None if value is _DELETED else value
+
+        rows = self._query("SELECT password, email, user_id FROM users WHERE username = ?", (username,))
+        if not rows:
+            return None
+        password, email, user_id = rows[0]
+        return {"password": password, "email": email, "user_id": user_id}
+
+    def load_session(self, token):
+        """(pseudo, heure de création) de la session, ou None"""
+        value = self._pending("sessions", token)
+        if value is not None:
+            return None if value is _DELETED else value
+
+        rows = self._query("SELECT username, created FROM sessions WHERE token = ?", (token,))
+        return rows[0] if rows else None
+
+    def count_users(self):
+        return self.user_count
+
+    def load_room_files(self, room_id):
+        """Fichiers d'une room, dans l'ordre de partage (écritures en attente comprises)"""
+        # Relevé avant la lecture: une écriture validée entre les deux est vue au moins une fois
+        with self.pending_lock:
+            pending = {key: value for (table, key), value in self.pending_values.items() if table == "files"}
+
+        rows = self._query(
+            f"SELECT {', '.join(FILE_COLUMNS)} FROM files WHERE room_id = ? ORDER BY rowid",
+            (room_id,)
+        )
+        rows = {row[0]: dict(zip(FILE_COLUMNS, row)) for row in rows}
+        for file_id, value in pending.items():
+            if value is _DELETED or value["room_id"] != room_id:
+                rows.pop(file_id, None)
+            else:
+                rows[file_id] = value
+
+        files = []
+        for row in rows.values():
+            file_metadata = dict(row)
+            del file_metadata["room_id"]
+            files.append(file_metadata)
+        return files
+
+    def blob_references(self):
+        """Nombre d'entrées de room par hash (compteurs du store de blobs)"""
+        return dict(self._query("SELECT hash, COUNT(*) FROM files WHERE hash IS NOT NULL GROUP BY hash"))
+
+
+class StoredDict(dict):
+    """dict servant de cache devant la base: lecture à la demande, écriture différée"""
+
+    def __init__(self, load, save, delete=None, count=None):
+        super().__init__()
+        self._load = load
+        self._save = save
+        self._delete = delete
+        self._count = count
+
+    def __missing__(self, key):
+        value = self._load(key)
+        if value is None:
+            raise KeyError(key)
+        return dict.setdefault(self, key, value)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._save(key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        dict.__delitem__(self, key)
+        self._delete(key)
+
+    def __len__(self):
+        return self._count() if self._count else dict.__len__(self)
+
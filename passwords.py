@@ -0,0 +1,169 @@
+"""
+Hachage des mots de passe (scrypt), hors des threads de connexion
+
+Un scrypt coûte des dizaines de millisecondes de CPU : il est calculé dans un
+pool de processus borné, pour qu'une rafale de LOGIN (tous les clients qui se
+reconnectent après une coupure) n'occupe pas le processus qui relaie le chat.
+
+- Admission : au plus max_pending calculs sont confiés au pool, les suivants
+  attendent leur tour (ils ne sont jamais refusés)
+- Cache : une vérification réussie est retenue cache_ttl secondes, sous un
+  condensé salé (mot de passe + hash stocké) ; un client qui se reconnecte
+  dans ce délai ne repaie pas le KDF
+
+Les anciens hash (SHA-256 sans sel) restent acceptés ; le serveur les
+remplace par un hash scrypt à la connexion suivante.
+"""
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Paramètres des nouveaux hash (~50 ms et 16 Mo par calcul) ; chaque hash stocké garde les siens
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+
+
+def _scrypt(password, salt, n, r, p, dklen=32):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=dklen)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password):
+    """Hash stocké: "scrypt$n$r$p$sel$hash" (sel et hash en base64)"""
+    salt = os.urandom(SALT_SIZE)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return "$".join(["scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P), _b64(salt), _b64(digest)])
+
+
+def is_legacy(stored):
+    """Ancien hash SHA-256 hexadécimal, sans sel"""
+    return not stored.startswith("scrypt$")
+
+
+def needs_rehash(stored):
+    """Hash à remplacer à la prochaine connexion réussie (ancien format ou paramètres plus faibles)"""
+    if is_legacy(stored):
+        return True
+    return stored.split("$")[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+def verify_password(password, stored):
+    if is_legacy(stored):
+        return hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest())
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p), len(expected))
+    except ValueError:
+        # Hash stocké illisible
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+class PasswordHasher:
+    """KDF dans un pool de processus, avec file d'admission et cache des vérifications"""
+
+    def __init__(self, workers=None, max_pending=None, cache_ttl=60, cache_size=10_000):
+        # workers=0: calcul dans le thread appelant (pas de pool)
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        self.workers = workers
+        self.max_pending = max_pending or max(1, workers) * 2
+        self.pool = None  # Créé au premier calcul: un serveur jamais utilisé ne lance aucun processus
+        self.closed = False
+        self.admission = threading.BoundedSemaphore(self.max_pending)
+
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # {condensé: expiration}, dans l'ordre d'expiration
+        self.cache_key = os.urandom(32)  # Sel des condensés, propre à ce démarrage
+        self.lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.computed = 0
+        self.cache_hits = 0
+
+    def _run(self, func, *args):
+        """Exécuter un calcul KDF, après avoir attendu une place si max_pending sont en cours"""
+        with self.lock:
+            self.waiting += 1
+        with self.admission:
+            with self.lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                if not self.workers:
+                    return func(*args)
+                return self._pool().submit(func, *args).result()
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.computed += 1
+
+    def _pool(self):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("PasswordHasher fermé")
+            if self.pool is None:
+                # spawn: jamais de fork d'un processus qui a déjà des threads
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def verify(self, password, stored):
+        if is_legacy(stored):
+            # SHA-256: rien à déporter
+            return verify_password(password, stored)
+
+        key = hmac.new(self.cache_key, f"{stored}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+        now = time.monotonic()
+        with self.lock:
+            expires = self.cache.get(key)
+            if expires is not None and expires > now:
+                self.cache_hits += 1
+                return True
+
+        if not self._run(verify_password, password, stored):
+            return False
+
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = now + self.cache_ttl
+            # Les plus anciens expirent en premier
+            while self.cache and (len(self.cache) > self.cache_size or next(iter(self.cache.values())) <= now):
+                self.cache.popitem(last=False)
+        return True
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "waiting": self.waiting,
+                "running": self.running,
+                "computed": self.computed,
+                "cache_hits": self.cache_hits,
+                "cached": len(self.cache)
+            }
@@ -0,0 +1,211 @@
+"""
+Fonctions du protocole partagées par le serveur et le client
+
+Messages: trame = taille du corps sur 4 octets (big-endian) + corps. Le corps
+est en JSON, ou dans un codec binaire (MessagePack, CBOR) négocié par HELLO.
+
+Transferts de fichiers: chaque bloc binaire est précédé d'un en-tête de
+8 octets (taille, big-endian). En mode "stream" le fichier entier est envoyé
+comme un seul bloc, lu directement dans un buffer réutilisable.
+"""
+
+import json
+import struct
+import time
+from datetime import datetime
+from functools import partial
+
+# Codecs binaires optionnels: sans ces paquets, la connexion reste en JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+# Version annoncée dans HELLO / HELLO_ACK
+PROTOCOL_VERSION = 2
+
+# En-tête de trame des messages (4 octets, unsigned int, big-endian)
+FRAME_HEADER = struct.Struct('>I')
+
+# Taille max du corps d'une trame: un en-tête aberrant ferme la connexion
+# au lieu de faire attendre (et allouer) des gigaoctets
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Taille d'une lecture de FrameReader (plusieurs trames par appel système)
+FRAME_READ_SIZE = 64 * 1024
+
+
+# En-tête de bloc binaire (8 octets, unsigned long long, big-endian)
+CHUNK_HEADER = struct.Struct('!Q')
+
+# Taille des blocs du mode historique "chunked"
+CHUNK_SIZE = 8192
+
+# Taille du buffer de réception réutilisé pendant un transfert
+TRANSFER_BUFFER_SIZE = 1024 * 1024
+
+
+def _json_encode(message):
+    return json.dumps(message).encode('utf-8')
+
+
+# Codecs disponibles: {nom: (encode, decode)}
+CODECS = {"json": (_json_encode, json.loads)}
+if msgpack is not None:
+    CODECS["msgpack"] = (partial(msgpack.packb, use_bin_type=True), partial(msgpack.unpackb, raw=False))
+if cbor2 is not None:
+    CODECS["cbor"] = (cbor2.dumps, cbor2.loads)
+
+# Ordre de préférence lors de la négociation (le plus compact d'abord)
+CODEC_PREFERENCE = [name for name in ("msgpack", "cbor", "json") if name in CODECS]
+
+
+def choose_codec(offered):
+    """Premier codec de nos préférences proposé par le pair (JSON par défaut)"""
+    for name in CODEC_PREFERENCE:
+        if name in offered:
+            return name
+    return "json"
+
+
+def make_message(message_type, payload, codec="json"):
+    """Enveloppe d'un message (horodatage ISO en JSON, epoch en binaire)"""
+    return {
+        "type": message_type,
+        "payload": payload,
+        "timestamp": datetime.now().isoformat() if codec == "json" else time.time()
+    }
+
+
+def encode_frame_parts(message, codec="json"):
+    """Encoder un message en (en-tête de taille, corps), sans les concaténer"""
+    body = CODECS[codec][0](message)
+    return (FRAME_HEADER.pack(len(body)), body)
+
+
+def encode_frame(message, codec="json"):
+    """Encoder un message en trame: en-tête de taille + corps"""
+    header, body = encode_frame_parts(message, codec)
+    return header + body
+
+
+def decode_body(data, codec="json"):
+    """Décoder le corps d'une trame
+
+    Un corps JSON commence toujours par '{' (octet qui ne peut pas débuter une
+    map MessagePack ou CBOR) : une trame JSON reste lisible après la bascule.
+    """
+    if codec == "json" or data[:1] == b'{':
+        return json.loads(data)
+    return CODECS[codec][1](data)
+
+
+class FrameTooLargeError(ValueError):
+    """En-tête annonçant une trame plus grande que la limite autorisée"""
+
+
+class FrameReader:
+    """Lecture bufferisée des trames d'une connexion
+
+    Chaque recv lit jusqu'à FRAME_READ_SIZE octets : les trames complètes déjà
+    présentes dans le buffer sont ensuite rendues sans nouvel appel système.
+    Les trames sont découpées à la demande (jamais à l'avance) car les octets
+    qui suivent une trame peuvent être un flux binaire de fichier : recv et
+    recv_into vident d'abord le buffer, ce qui permet d'utiliser le reader
+    à la place du socket pour les transferts.
+    """
+
+    def __init__(self, sock, max_frame_size=MAX_FRAME_SIZE, read_size=FRAME_READ_SIZE):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self.read_size = read_size
+        self.buffer = bytearray()
+
+    def read_frame(self):
+        """Corps de la prochaine trame (None si la connexion se ferme)"""
+        while True:
+            needed = FRAME_HEADER.size
+            if len(self.buffer) >= needed:
+                size = FRAME_HEADER.unpack_from(self.buffer)[0]
+                if size > self.max_frame_size:
+                    raise FrameTooLargeError(
+                        f"Trame trop grande ({size} octets, max {self.max_frame_size})"
+                    )
+                needed += size
+                if len(self.buffer) >= needed:
+                    with memoryview(self.buffer) as view:
+                        body = bytes(view[FRAME_HEADER.size:needed])
+                    # Suppression en tête de bytearray: pas de recopie du reste
+                    del self.buffer[:needed]
+                    return body
+
+            # Grosse trame: lire ce qui manque en peu d'appels (sans dépasser 1 MB)
+            data = self.sock.recv(min(max(self.read_size, needed - len(self.buffer)), TRANSFER_BUFFER_SIZE))
+            if not data:
+                return None
+            self.buffer += data
+
+    def recv(self, bufsize):
+        """Comme socket.recv, en servant d'abord les octets déjà bufferisés"""
+        if not self.buffer:
+            return self.sock.recv(bufsize)
+        data = bytes(self.buffer[:bufsize])
+        del self.buffer[:bufsize]
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        """Comme socket.recv_into, en servant d'abord les octets déjà bufferisés"""
+        if not self.buffer:
+            return self.sock.recv_into(buffer, nbytes)
+        view = memoryview(buffer)
+        n = min(nbytes or len(view), len(self.buffer))
+        view[:n] = self.buffer[:n]
+        del self.buffer[:n]
+        return n
+
+
+def recv_exact_into(sock, view):
+    """Remplir entièrement view depuis le socket (False si la connexion se ferme)"""
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:], total - received)
+        if n == 0:
+            return False
+        received += n
+    return True
+
+
+def recv_exact(sock, size):
+    """Lire exactement size octets (None si la connexion se ferme)"""
+    data = bytearray(size)
+    if not recv_exact_into(sock, memoryview(data)):
+        return None
+    return bytes(data)
+
+
+def recv_to_file(sock, file, length, buffer, progress=None, digest=None):
+    """Recevoir length octets directement dans un fichier via un buffer réutilisable
+
+    digest (optionnel) est mis à jour avec les données au fil de la réception.
+    Retourne le nombre d'octets reçus (inférieur à length si la connexion se ferme).
+    """
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        n = sock.recv_into(view, min(len(view), length - received))
+        if n == 0:
+            break
+        file.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        received += n
+        if progress:
+            progress(received)
+    return received
@@ -0,0 +1,116 @@
+"""
+Limitation de débit par seaux à jetons (token buckets)
+
+Un client qui envoie SEND_MESSAGE en boucle coûte O(taille de la room) envois
+par trame : sans limite, une seule connexion peut saturer le serveur. Chaque
+type de requête (chat, upload, p2p) a ses seaux par connexion, par pseudo et
+par room ; une requête n'est acceptée que si tous ses seaux ont un jeton, et
+ne consomme rien sinon. Un refus indique dans combien de secondes réessayer.
+
+Les seaux d'une connexion sont libérés à sa fermeture ; ceux des pseudos et
+des rooms, une fois pleins (inactifs), sont libérés quand leur nombre dépasse
+max_buckets.
+"""
+
+import threading
+import time
+
+
+# {type: {portée: (jetons par seconde, capacité)}}, portées: "connection", "user", "room"
+DEFAULT_RATE_LIMITS = {
+    "chat": {"connection": (5, 10), "user": (10, 20), "room": (50, 100)},
+    "upload": {"connection": (1, 3), "user": (2, 5), "room": (5, 10)},
+    "p2p": {"connection": (1, 5), "user": (2, 10)}
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1):
+        """Secondes avant que cost jetons soient disponibles (0 = tout de suite)"""
+        missing = cost - self.tokens
+        return missing / self.rate if missing > 0 else 0
+
+
+class RateLimiter:
+    """Seaux à jetons par type de requête et par connexion, pseudo et room"""
+
+    def __init__(self, limits=DEFAULT_RATE_LIMITS, max_buckets=10_000, clock=time.monotonic):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.clock = clock
+        # {(type, portée): {clé: TokenBucket}}
+        self.buckets = {(kind, scope): {} for kind, scopes in limits.items() for scope in scopes}
+        # Taille de chaque table à partir de laquelle chercher des seaux à libérer
+        self.prune_at = dict.fromkeys(self.buckets, max_buckets)
+        self.lock = threading.Lock()
+        self.allowed = {kind: 0 for kind in limits}
+        self.limited = {kind: dict.fromkeys(scopes, 0) for kind, scopes in limits.items()}
+
+    def acquire(self, kind, connection=None, user=None, room=None, cost=1):
+        """Prendre cost jetons dans chaque seau de kind ; retourne 0, ou les secondes à attendre"""
+        scopes = self.limits.get(kind)
+        if not scopes:
+            return 0
+        keys = {"connection": connection, "user": user, "room": room}
+        now = self.clock()
+
+        with self.lock:
+            buckets = []
+            for scope, (rate, capacity) in scopes.items():
+                key = keys.get(scope)
+                if key is None:
+                    continue
+                table = self.buckets[(kind, scope)]
+                bucket = table.get(key)
+                if bucket is None:
+                    if len(table) >= self.prune_at[(kind, scope)]:
+                        self._prune(table, now)
+                        # Tous actifs: ne pas reparcourir la table à chaque nouvelle clé
+                        self.prune_at[(kind, scope)] = max(self.max_buckets, 2 * len(table))
+                    bucket = table[key] = TokenBucket(rate, capacity, now)
+                bucket.refill(now)
+                buckets.append((scope, bucket))
+
+            # Le seau le plus en retard décide ; aucun jeton pris en cas de refus
+            wait, scope = max(((bucket.wait_time(cost), scope) for scope, bucket in buckets), default=(0, None))
+            if wait:
+                self.limited[kind][scope] += 1
+                return wait
+            for _, bucket in buckets:
+                bucket.tokens -= cost
+            self.allowed[kind] += 1
+            return 0
+
+    def forget(self, connection):
+        """Connexion fermée: libérer ses seaux"""
+        with self.lock:
+            for (kind, scope), table in self.buckets.items():
+                if scope == "connection":
+                    table.pop(connection, None)
+
+    def _prune(self, table, now):
+        """Libérer les seaux pleins (inactifs depuis capacity / rate secondes) (lock tenu)"""
+        for key, bucket in list(table.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del table[key]
+
+    def stats(self):
+        """{type: {"allowed": n, "limited": {portée: n}}}"""
+        with self.lock:
+            return {
+                kind: {"allowed": self.allowed[kind], "limited": dict(self.limited[kind])}
+                for kind in self.limits
+            }
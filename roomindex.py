@@ -0,0 +1,325 @@
+"""
+Index des fichiers de chaque room, chargé à la demande
+
+La liste des fichiers d'une room n'est construite qu'au premier accès
+(LIST_ROOM_FILES, DOWNLOAD_FILE, SYNC_ROOM...) : entrées persistées (base,
+ou journal des blobs sans base) + fichiers présents dans uploads/<room_id>.
+
+Le résultat du parcours du dossier est mis en cache dans
+uploads/.manifests/<room_id>.json avec le mtime du dossier : tant que
+le dossier n'a pas changé, le manifeste est relu sans aucun stat.
+
+Les index des rooms sans connexion sont libérés (du moins récemment
+utilisé au plus récent) quand leur taille estimée dépasse le budget.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime
+
+
+# Taille mémoire estimée d'une entrée (dict + chaînes)
+ENTRY_SIZE_ESTIMATE = 600
+
+# Clés des index triés (LIST_ROOM_FILES): le file_id final rend chaque clé unique
+SORT_KEYS = {
+    "name": lambda f: (f["filename"], f["file_id"]),
+    "size": lambda f: (f["size"], f["file_id"]),
+    "date": lambda f: (f["upload_date"], f["file_id"]),
+    "uploader": lambda f: (f["uploader"], f["upload_date"], f["file_id"]),
+}
+
+# Format des manifestes: un manifeste d'une autre version est reconstruit
+# (2: file_id = SHA-1 complet du nom, 8 caractères entraient en collision)
+MANIFEST_VERSION = 2
+
+# Plus grand caractère: borne haute des plages par préfixe
+_MAX_CHAR = "\U0010ffff"
+
+
+class InvalidCursorError(ValueError):
+    """Curseur de pagination illisible ou créé pour un autre tri"""
+
+
+def encode_cursor(sort, descending, key):
+    """Curseur opaque: la clé de tri du dernier fichier renvoyé"""
+    data = json.dumps([sort, descending, list(key)], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort, descending):
+    try:
+        cursor_sort, cursor_descending, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (AttributeError, ValueError, TypeError, UnicodeError):
+        raise InvalidCursorError("curseur illisible")
+    if cursor_sort != sort or cursor_descending != descending or not isinstance(key, list):
+        raise InvalidCursorError("curseur créé pour un autre tri")
+    return tuple(key)
+
+
+def disk_file_id(filename):
+    """Identifiant stable d'un fichier trouvé dans le dossier d'une room"""
+    return hashlib.sha1(filename.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+class RoomFiles:
+    """Fichiers d'une room, dans l'ordre de partage, indexés par identifiant et par nom
+
+    Chaque entrée a un "file_id" unique (l'upload_id, ou disk_file_id pour un
+    fichier trouvé dans le dossier). Plusieurs entrées peuvent porter le même nom.
+    """
+
+    def __init__(self, files=()):
+        self.by_id = {}  # {file_id: entrée} (ordre d'insertion = ordre de partage)
+        self.by_name = {}  # {filename: [entrées, de la plus ancienne à la plus récente]}
+        self.sorted = {}  # {tri: [clés triées]}, construit au premier LIST trié puis maintenu
+        self.total_size = 0
+        self.lock = threading.Lock()
+        for file_metadata in files:
+            self.append(file_metadata)
+
+    def append(self, file_metadata):
+        with self.lock:
+            self.by_id[file_metadata["file_id"]] = file_metadata
+            self.by_name.setdefault(file_metadata["filename"], []).append(file_metadata)
+            self.total_size += file_metadata["size"]
+            for sort, keys in self.sorted.items():
+                insort(keys, SORT_KEYS[sort](file_metadata))
+
+    def remove(self, file_metadata):
+        """Retirer une entrée (ValueError si elle n'y est plus)"""
+        with self.lock:
+            if self.by_id.get(file_metadata["file_id"]) is not file_metadata:
+                raise ValueError("fichier absent de la room")
+            del self.by_id[file_metadata["file_id"]]
+            self.total_size -= file_metadata["size"]
+            same_name = self.by_name[file_metadata["filename"]]
+            same_name.remove(file_metadata)
+            if not same_name:
+                del self.by_name[file_metadata["filename"]]
+            for sort, keys in self.sorted.items():
+                key = SORT_KEYS[sort](file_metadata)
+                del keys[bisect_left(keys, key)]
+
+    def get(self, file_id):
+        return self.by_id.get(file_id)
+
+    def named(self, filename):
+        """Entrées portant ce nom, de la plus ancienne à la plus récente"""
+        with self.lock:
+            return list(self.by_name.get(filename, ()))
+
+    def find(self, filename):
+        """Entrée la plus récente portant ce nom (ou None)"""
+        with self.lock:
+            same_name = self.by_name.get(filename)
+            return same_name[-1] if same_name else None
+
+    def page(self, sort="date", descending=False, after=None, limit=None,
+             uploader=None, min_size=None, max_size=None, prefix=None):
+        """Une page de fichiers triés et filtrés
+
+        after est la clé de tri du dernier fichier de la page précédente.
+        Retourne (entrées, clé du dernier fichier si la liste continue, sinon None).
+        Un filtre portant sur la clé de tri réduit la plage par dichotomie ;
+        les autres sont vérifiés sur les fichiers parcourus.
+        """
+        key_of = SORT_KEYS[sort]
+        with self.lock:
+            keys = self.sorted.get(sort)
+            if keys is None:
+                keys = self.sorted[sort] = sorted(key_of(f) for f in self.by_id.values())
+
+            low, high = 0, len(keys)
+            if sort == "name" and prefix:
+                low = bisect_left(keys, (prefix,))
+                high = bisect_left(keys, (prefix + _MAX_CHAR,))
+            elif sort == "size":
+                if min_size is not None:
+                    low = bisect_left(keys, (min_size,))
+                if max_size is not None:
+                    high = bisect_left(keys, (max_size + 1,))
+            elif sort == "uploader" and uploader is not None:
+                low = bisect_left(keys, (uploader,))
+                high = bisect_left(keys, (uploader, _MAX_CHAR))
+
+            if after is not None:
+                if descending:
+                    high = min(high, bisect_left(keys, after))
+                else:
+                    low = max(low, bisect_right(keys, after))
+
+            positions = range(high - 1, low - 1, -1) if descending else range(low, high)
+            entries = []
+            last_key = None
+            for position in positions:
+                if limit is not None and len(entries) >= limit:
+                    return entries, last_key
+                f = self.by_id[keys[position][-1]]
+                if ((uploader is not None and f["uploader"] != uploader)
+                        or (min_size is not None and f["size"] < min_size)
+                        or (max_size is not None and f["size"] > max_size)
+                        or (prefix and not f["filename"].startswith(prefix))):
+                    continue
+                entries.append(f)
+                last_key = keys[position]
+            return entries, None
+
+    def __iter__(self):
+        # Copie: les handlers itèrent pendant que d'autres threads ajoutent/retirent
+        with self.lock:
+            return iter(list(self.by_id.values()))
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class RoomFileIndex(dict):
+    """Fichiers par room: {room_id: RoomFiles}, chargés au premier accès
+
+    load_stored(room_id) retourne les entrées persistées (ou None sans base) ;
+    is_idle(room_id) dit si la room peut être libérée (aucune connexion).
+    """
+
+    def __init__(self, upload_dir, rooms, load_stored=None, is_idle=None, budget=64 * 1024 * 1024):
+        super().__init__()
+        self.upload_dir = upload_dir
+        self.rooms = rooms  # Seules les rooms existantes sont indexées
+        self.load_stored = load_stored
+        self.is_idle = is_idle or (lambda room_id: True)
+        self.budget = budget
+        self.manifest_dir = os.path.join(upload_dir, ".manifests")
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.last_used = OrderedDict()  # {room_id: None}, du moins au plus récemment utilisé
+        self.loads = 0
+        self.scans = 0
+        self.evictions = 0
+
+    def __missing__(self, room_id):
+        if room_id not in self.rooms:
+            raise KeyError(room_id)
+
+        with self.lock:
+            # Un autre thread a pu charger la room pendant l'attente du lock
+            if dict.__contains__(self, room_id):
+                return self[room_id]
+            files = self.load(room_id)
+            dict.__setitem__(self, room_id, files)
+            self.last_used[room_id] = None
+            self.evict(keep=room_id)
+            return files
+
+    def __getitem__(self, room_id):
+        files = dict.__getitem__(self, room_id)
+        # Pas de lock: move_to_end est atomique (GIL), l'ordre n'est qu'indicatif
+        try:
+            self.last_used.move_to_end(room_id)
+        except KeyError:
+            pass
+        return files
+
+    def get(self, room_id, default=None):
+        try:
+            return self[room_id]
+        except KeyError:
+            return default
+
+    def is_loaded(self, room_id):
+        """Vrai si la room est en mémoire (y accéder ne lit pas le disque)"""
+        return dict.__contains__(self, room_id)
+
+    def load(self, room_id):
+        """Entrées persistées puis fichiers du dossier de la room"""
+        self.loads += 1
+        stored = self.load_stored(room_id) if self.load_stored else None
+        files = RoomFiles(stored or ())
+        known = {f["path"] for f in files}
+        for file_metadata in self.scan(room_id):
+            if file_metadata["path"] not in known:
+                files.append(file_metadata)
+        return files
+
+    def manifest_path(self, room_id):
+        return os.path.join(self.manifest_dir, f"{room_id}.json")
+
+    def scan(self, room_id):
+        """Fichiers du dossier de la room (manifeste réutilisé si le dossier n'a pas changé)"""
+        room_dir = os.path.join(self.upload_dir, room_id)
+        try:
+            mtime = os.stat(room_dir).st_mtime_ns
+        except OSError:
+            return []
+
+        try:
+            with open(self.manifest_path(room_id), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("mtime_ns") == mtime:
+                return manifest["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        self.scans += 1
+        files = []
+        with os.scandir(room_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                files.append({
+                    "filename": entry.name,
+                    "uploader": "",
+                    "size": stat.st_size,
+                    "path": entry.path,
+                    "hash": None,
+                    "upload_date": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                    "file_id": disk_file_id(entry.name)
+                })
+        files.sort(key=lambda f: f["upload_date"])
+
+        # Écriture atomique, hors du dossier de la room (sinon son mtime changerait)
+        tmp_path = self.manifest_path(room_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "mtime_ns": mtime, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path(room_id))
+        return files
+
+    def evictable(self, room_id):
+        """Une room se recharge à l'identique si toutes ses entrées sont persistées"""
+        if not self.is_idle(room_id):
+            return False
+        if self.load_stored:
+            return True
+        # Sans base, les fichiers uploadés n'existent qu'en mémoire
+        room_dir = os.path.join(self.upload_dir, room_id)
+        return all(os.path.dirname(f["path"]) == room_dir for f in dict.get(self, room_id, ()))
+
+    def memory_estimate(self):
+        return sum(len(files) for files in dict.values(self)) * ENTRY_SIZE_ESTIMATE
+
+    def evict(self, keep=None):
+        """Libérer les rooms inactives les moins récemment utilisées (self.lock tenu)"""
+        if self.memory_estimate() <= self.budget:
+            return
+        for room_id in list(self.last_used):
+            if room_id == keep or not self.evictable(room_id):
+                continue
+            dict.__delitem__(self, room_id)
+            del self.last_used[room_id]
+            self.evictions += 1
+            if self.memory_estimate() <= self.budget:
+                return
+
+    def stats(self):
+        return {
+            "loaded_rooms": dict.__len__(self),
+            "entries": sum(len(files) for files in dict.values(self)),
+            "loads": self.loads,
+            "scans": self.scans,
+            "evictions": self.evictions
+        }
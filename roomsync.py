@@ -0,0 +1,169 @@
+"""
+Versions et événements des rooms, pour rattraper ce qui a été manqué
+
+Chaque room porte une version qui augmente à chaque fichier ajouté ou
+supprimé et à chaque membre arrivé ou parti. Les derniers changements
+sont gardés dans un journal borné : un client qui envoie la version de
+sa dernière synchronisation ne reçoit que la différence, ou un état
+complet si son curseur est plus ancien que le journal.
+
+Chaque événement diffusé dans une room (MESSAGE, USER_JOINED, USER_LEFT,
+FILE_SHARED...) reçoit aussi un numéro de séquence propre à la room ; les
+derniers sont gardés dans un anneau pour RESUME après une reconnexion.
+
+Les derniers messages de chat de chaque room sont aussi gardés, dans la
+limite d'un budget mémoire, pour qu'un client qui arrive voie ce qui a été
+dit avant lui (JOIN_SUCCESS, HISTORY).
+
+L'epoch identifie l'instance du serveur : versions et séquences repartent
+de 0 à chaque démarrage, un curseur d'une autre epoch est trop ancien.
+"""
+
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+
+
+# Taille mémoire estimée d'un message hors chaînes (dict + objets str)
+MESSAGE_OVERHEAD = 400
+
+
+class RoomChanges:
+    """Version d'une room et journal de ses derniers changements
+
+    Non thread-safe: l'appelant tient le lock des rooms.
+    """
+
+    def __init__(self, max_changes=1000):
+        self.version = 0
+        self.changes = deque(maxlen=max_changes)  # [(version, "file" | "member", "added" | "removed", valeur)]
+
+    def record(self, kind, op, value):
+        self.version += 1
+        self.changes.append((self.version, kind, op, value))
+        return self.version
+
+    def since(self, version):
+        """Différence depuis version, ou None si le journal ne remonte pas jusque-là
+
+        Plusieurs changements du même fichier (ou membre) se résument au dernier.
+        """
+        if version > self.version:
+            return None
+        oldest = self.changes[0][0] if self.changes else self.version + 1
+        if version < oldest - 1:
+            return None
+
+        files = {}  # {file_id: ("added", infos) ou ("removed", None)}
+        members = {}  # {pseudo: "added" | "removed"}
+        for change_version, kind, op, value in self.changes:
+            if change_version <= version:
+                continue
+            if kind == "file":
+                files[value["file_id"]] = (op, value)
+            else:
+                members[value] = op
+
+        return {
+            "files_added": [value for op, value in files.values() if op == "added"],
+            "files_removed": [file_id for file_id, (op, _) in files.items() if op == "removed"],
+            "members_joined": [username for username, op in members.items() if op == "added"],
+            "members_left": [username for username, op in members.items() if op == "removed"]
+        }
+
+
+class RoomEvents:
+    """Séquence des événements d'une room et anneau des plus récents
+
+    lock (réentrant) est tenu pendant la numérotation ET la mise en file
+    des trames : les membres reçoivent les événements dans l'ordre des numéros.
+    """
+
+    def __init__(self, max_events=1000):
+        self.seq = 0
+        self.events = deque(maxlen=max_events)  # [(seq, type, payload)]
+        self.lock = threading.RLock()
+
+    def record(self, message_type, payload):
+        """Numéroter un événement (lock tenu), retourne le payload complété par seq"""
+        self.seq += 1
+        payload = dict(payload, seq=self.seq)
+        self.events.append((self.seq, message_type, payload))
+        return payload
+
+    def since(self, seq):
+        """Événements après seq, ou None si l'anneau ne remonte plus jusque-là (lock tenu)"""
+        if seq > self.seq:
+            return None
+        oldest = self.events[0][0] if self.events else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return [
+            {"type": message_type, "payload": payload}
+            for event_seq, message_type, payload in self.events
+            if event_seq > seq
+        ]
+
+
+def message_size(message):
+    """Taille mémoire estimée d'un message de chat"""
+    return MESSAGE_OVERHEAD + sum(
+        len(key) + len(value) for key, value in message.items() if isinstance(value, str)
+    )
+
+
+class RoomHistory:
+    """Derniers messages de chat d'une room, bornés en octets (estimés)
+
+    Chaque message reçoit une position croissante ; une page d'historique
+    indique la position à passer en before pour remonter plus loin.
+    """
+
+    def __init__(self, budget=256 * 1024):
+        self.budget = budget
+        self.messages = deque()  # [(position, message, taille)], positions consécutives
+        self.next_position = 1
+        self.size = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def append(self, message):
+        size = message_size(message)
+        with self.lock:
+            self.messages.append((self.next_position, message, size))
+            self.next_position += 1
+            self.size += size
+            # Les plus anciens sortent ; le plus récent reste même s'il dépasse le budget
+            while self.size > self.budget and len(self.messages) > 1:
+                _, _, evicted_size = self.messages.popleft()
+                self.size -= evicted_size
+                self.evicted += 1
+
+    def page(self, before=None, limit=50):
+        """Jusqu'à limit messages antérieurs à la position before (les plus récents si None)
+
+        Retourne (messages du plus ancien au plus récent, position à passer en
+        before pour la page précédente, ou None si rien de plus ancien n'est gardé).
+        """
+        with self.lock:
+            if not self.messages:
+                return [], None
+            first = self.messages[0][0]
+            end = len(self.messages) if before is None else max(0, min(before - first, len(self.messages)))
+            start = max(0, end - limit)
+            page = list(islice(self.messages, start, end))
+        return [message for _, message, _ in page], (page[0][0] if page and start > 0 else None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "messages": len(self.messages),
+                "bytes": self.size,
+                "budget": self.budget,
+                "evicted": self.evicted
+            }
+
+
+def new_epoch():
+    return uuid.uuid4().hex[:8]
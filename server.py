@@ -4,69 +4,261 @@ import threading
 import hashlib
 import uuid
 import os
-import struct
+import sys
+import time
 import flet as ft
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from chatlog import ChatLog
+from connection import AsyncConnection, ThreadedConnection
+from metadata import MetadataStore, StoredDict
+from passwords import PasswordHasher, needs_rehash
+from protocol import (
+    CHUNK_HEADER, CHUNK_SIZE, CODEC_PREFERENCE, FRAME_HEADER, MAX_FRAME_SIZE, PROTOCOL_VERSION,
+    TRANSFER_BUFFER_SIZE, FrameTooLargeError, choose_codec, decode_body, encode_frame_parts, make_message,
+    recv_exact_into, recv_to_file
+)
+from ratelimit import DEFAULT_RATE_LIMITS, RateLimiter
+from roomindex import SORT_KEYS, InvalidCursorError, RoomFileIndex, RoomFiles, decode_cursor, encode_cursor
+from roomsync import RoomChanges, RoomEvents, RoomHistory, new_epoch
+from sessions import SessionStore
+from storage import BlobStore, RoomReferences, hash_file, is_valid_hash
+from timingwheel import TimingWheel
+
+
+# Messages dont le traitement lit/écrit un flux binaire ou attend:
+# en mode async ils sont exécutés dans le pool de threads de transfert
+BLOCKING_MESSAGE_TYPES = {"UPLOAD_FILE", "UPLOAD_RESUME", "DOWNLOAD_FILE"}
+
+# Octets transférés entre deux mises à jour de last_seen pendant un upload ou
+# un download: un transfert qui n'avance plus est inactif comme une connexion muette
+# (avec idle_timeout à 90 s, un transfert à moins de ~700 o/s est fermé)
+TRANSFER_PROGRESS_BYTES = 64 * 1024
+
+# Tranche de fichier par sendfile en mode stream: l'avancement est suivi entre deux
+# (plus petit, le débit baisse ; un download stream à moins de ~11 Ko/s est fermé)
+SENDFILE_SLICE = 1024 * 1024
+
+# Délai max (secondes) pour que le receveur d'un upload repris par UPLOAD_RESUME
+# depuis une nouvelle connexion de la même session se termine
+UPLOAD_TAKEOVER_TIMEOUT = 10
+
+# Attente max (secondes) d'un upload identique en cours avant de recevoir le
+# contenu soi-même (l'autre client peut être bloqué ou très lent)
+BLOB_CLAIM_WAIT = 30
+
+# Messages qui attendent le KDF des mots de passe: en mode async ils passent
+# par un pool de threads séparé, une rafale de LOGIN ne bloque ni la boucle
+# ni les transferts
+AUTH_MESSAGE_TYPES = {"REGISTER", "LOGIN"}
+
+# Messages qui lisent l'index des fichiers de la room de la connexion: en mode
+# async ils passent par le pool des transferts si la room n'est pas encore chargée
+# (lecture de la base ou du manifeste, parcours du dossier)
+ROOM_FILES_MESSAGE_TYPES = {"LIST_ROOM_FILES", "SYNC_ROOM"}
+
+# Seuil du buffer de lecture asyncio: assez grand pour que les uploads
+# lisent de gros blocs par aller-retour avec la boucle
+STREAM_READER_LIMIT = 256 * 1024
+
+# Réponses "d'état" : sous la politique coalesce, seule la plus récente
+# en attente dans la file d'un client lent est conservée
+COALESCABLE_MESSAGE_TYPES = {"PONG", "ROOMS_LIST", "ROOM_FILES_LIST", "FILE_LIST"}
+
+# Taille max d'une page de LIST_ROOM_FILES
+MAX_PAGE_SIZE = 500
+
+# Nombre max de messages d'historique par réponse (HISTORY, JOIN_SUCCESS)
+MAX_HISTORY_PAGE = 100
+
 
 class FileShareServer:
-    def __init__(self, host='0.0.0.0', port=5555):
+    def __init__(self, host='0.0.0.0', port=5555, mode="threaded", backlog=128, transfer_workers=16,
+                 outbound_queue_size=256, slow_consumer_policy="drop_oldest",
+                 partial_upload_ttl=24 * 3600, max_frame_size=MAX_FRAME_SIZE, flush_window=0.0,
+                 metadata_db=None, chat_log_dir="chat_logs", chat_fsync="group",
+                 file_index_budget=64 * 1024 * 1024, history_budget=256 * 1024, kdf_workers=None,
+                 session_idle_ttl=30 * 60, session_ttl=7 * 24 * 3600,
+                 heartbeat_interval=30, idle_timeout=90, rate_limits=DEFAULT_RATE_LIMITS):
         self.host = host
         self.port = port
+        self.mode = mode  # "threaded" (un thread par client) ou "async" (boucle asyncio)
+        self.backlog = backlog
+        self.transfer_workers = transfer_workers
+        # File sortante bornée par client et politique quand elle déborde:
+        # "drop_oldest", "coalesce" ou "disconnect"
+        self.outbound_queue_size = outbound_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        # Taille max d'une trame reçue (au-delà, la connexion est fermée)
+        self.max_frame_size = max_frame_size
+        # Délai (secondes) laissé au writer pour grouper les trames de chat en
+        # un seul envoi (0 = écrire dès qu'une trame est en file)
+        self.flush_window = flush_window
         self.socket = None
+        self.loop = None
+        self.async_server = None
+        self.transfer_executor = None
+        self.auth_executor = None
         self.clients = {}  # {socket: {"pseudo": "", "session_token": "", "room": ""}}
+        # Index maintenus avec self.clients (protégés par clients_lock)
+        self.connections_by_user = {}  # {username: {socket: None}} (ordre de connexion)
+        self.connections_by_address = {}  # {(ip, port): socket}
         self.users = {}  # {username: {"password": hash, "email": "", "user_id": ""}}
-        self.sessions = {}  # {token: username}
+        
+        # Échéances du serveur (expiration des sessions...), une roue pour toutes
+        # (son thread démarre avec le serveur ; les échéances prises avant attendent)
+        self.timers = TimingWheel(tick=1.0)
+        
+        # {token: username}: une session expire après session_idle_ttl secondes
+        # sans connexion liée ni utilisation, et session_ttl secondes après le LOGIN
+        self.session_idle_ttl = session_idle_ttl
+        self.session_ttl = session_ttl
+        self.sessions = SessionStore(self.timers, session_idle_ttl, session_ttl)
+        
+        # PING envoyé après heartbeat_interval secondes de silence d'une connexion,
+        # fermée après idle_timeout secondes sans aucune trame (0 = désactivé)
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.pings_sent = 0
+        self.reaped_connections = 0
+        
+        # Débit max du chat, des uploads et des P2P par connexion, pseudo et room
+        # (seaux à jetons, voir ratelimit.DEFAULT_RATE_LIMITS ; None = pas de limite)
+        self.rate_limiter = RateLimiter(rate_limits) if rate_limits else None
         self.running = False
         self.clients_lock = threading.Lock()  # Lock pour accès thread-safe aux clients
+        self.users_lock = threading.Lock()  # Vérification + création d'un compte (REGISTER)
+        
+        # Hachage des mots de passe (scrypt) dans un pool de processus borné,
+        # kdf_workers processus (0 = dans le thread de la connexion)
+        self.passwords = PasswordHasher(kdf_workers)
         
         # Stockage des fichiers par room
-        self.files_by_room = {}  # {room_id: [{"filename": "", "uploader": "", "size": 0, "path": ""}]}
         self.upload_dir = "uploads"
         
         # Créer le dossier uploads s'il n'existe pas
         if not os.path.exists(self.upload_dir):
             os.makedirs(self.upload_dir)
         
+        # Contenus stockés une seule fois (SHA-256), référencés par les rooms
+        self.blobs = BlobStore(os.path.join(self.upload_dir, ".blobs"))
+        
+        # Uploads interrompus: {upload_id}.part + {upload_id}.json, repris par UPLOAD_RESUME
+        self.partial_dir = os.path.join(self.upload_dir, ".partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.partial_upload_ttl = partial_upload_ttl
+        self.last_partial_sweep = 0
+        self.active_uploads = {}  # {upload_id: connexion qui le reçoit}
+        self.uploads_lock = threading.Lock()
+        self.upload_released = threading.Condition(self.uploads_lock)
+        self.expire_partial_uploads()
+        
         # Rooms en dur
         self.rooms = {
             "general": {
                 "name": "Général",
                 "description": "Discussions générales et partage de fichiers",
-                "members": []
+                "members": {}
             },
             "projets": {
                 "name": "Projets",
                 "description": "Espace dédié aux projets collaboratifs",
-                "members": []
+                "members": {}
             },
             "tech": {
                 "name": "Tech",
                 "description": "Discussions techniques et code",
-                "members": []
+                "members": {}
             },
             "random": {
                 "name": "Random",
                 "description": "Pour tout le reste!",
-                "members": []
+                "members": {}
             }
         }
         
-        # Initialiser la liste de fichiers pour chaque room
+        # Index des connexions présentes dans chaque room: {room_id: set(connexions)}
+        # "members" compte les connexions par pseudo: {username: nb_connexions}
+        self.room_connections = {}
+        self.rooms_lock = threading.Lock()
+        
+        # Version de chaque room et derniers changements (SYNC_ROOM incrémental),
+        # protégés par rooms_lock ; l'epoch distingue les versions de ce démarrage
+        self.room_changes = {room_id: RoomChanges() for room_id in self.rooms}
+        self.epoch = new_epoch()
+        # Numéros de séquence et derniers événements diffusés dans chaque room (RESUME)
+        # Ordre des locks: clients_lock, puis lock des événements, puis rooms_lock
+        self.room_events = {room_id: RoomEvents() for room_id in self.rooms}
+        # Derniers messages de chat de chaque room (HISTORY), history_budget octets estimés par room
+        self.room_history = {room_id: RoomHistory(history_budget) for room_id in self.rooms}
+        
+        # Créer le dossier de chaque room (ses fichiers sont indexés à la demande)
         for room_id in self.rooms.keys():
-            self.files_by_room[room_id] = []
+            self.room_connections[room_id] = set()
             room_dir = os.path.join(self.upload_dir, room_id)
             if not os.path.exists(room_dir):
                 os.makedirs(room_dir)
         
+        # Base SQLite optionnelle: utilisateurs, sessions et fichiers persistent
+        # entre deux démarrages, chargés à la demande (rien n'est lu en entier)
+        self.metadata = None
+        if metadata_db:
+            self.metadata = MetadataStore(metadata_db)
+            self.users = StoredDict(self.metadata.load_user, self.metadata.save_user,
+                                    count=self.metadata.count_users)
+            self.sessions = SessionStore(self.timers, session_idle_ttl, session_ttl,
+                                         load=self.metadata.load_session, save=self.metadata.save_session,
+                                         delete=self.metadata.delete_session)
+            # Les sessions trop anciennes ne seront jamais relues: les supprimer de la base
+            self.metadata.purge_sessions(time.time() - session_ttl)
+        
+        # Entrées des rooms vers les blobs: en base, ou sans base dans un journal par
+        # room à côté des blobs (sinon elles disparaîtraient au redémarrage)
+        self.stored_files = self.metadata or RoomReferences(os.path.join(self.blobs.root, "rooms"))
+        self.blobs.refs.update(self.stored_files.blob_references())
+        
+        # Fichiers par room: {room_id: [{"filename": "", "uploader": "", "size": 0, "path": "", "hash": ""}]}
+        # Chargés au premier accès (entrées persistées + dossier uploads/<room_id>), rooms inactives
+        # libérées au-delà de file_index_budget octets estimés
+        self.files_by_room = RoomFileIndex(
+            self.upload_dir, self.rooms,
+            load_stored=self.stored_files.load_room_files,
+            is_idle=lambda room_id: not self.room_connections[room_id],
+            budget=file_index_budget
+        )
+        
+        # Journal des messages de chat par room (None = désactivé), rejoué au démarrage
+        # chat_fsync: "always" (fsync par message), "group" (commit groupé) ou "never"
+        # Un chemin relatif part du dossier courant au lancement, comme uploads/
+        self.chat_log = ChatLog(os.path.abspath(chat_log_dir), fsync_policy=chat_fsync) if chat_log_dir else None
+        # Messages qui touchent toujours le disque: en mode async ils passent par le
+        # pool des transferts plutôt que par la boucle (UPLOAD_CHECK lit le store de
+        # blobs, DELETE_FILE supprime le blob et écrit la référence ; avec un fsync
+        # par message, SEND_MESSAGE bloque aussi sur le disque)
+        self.disk_message_types = {"UPLOAD_CHECK", "DELETE_FILE"}
+        if self.chat_log and chat_fsync == "always":
+            self.disk_message_types.add("SEND_MESSAGE")
+        
+        # L'historique repart des derniers messages journalisés
+        if self.chat_log:
+            for room_id, history in self.room_history.items():
+                for message in self.chat_log.recent(room_id):
+                    history.append(message)
+        
     def start(self):
         """Démarrer le serveur"""
+        self.timers.start()
+        if self.mode == "async":
+            self.start_async()
+            return
+        
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.host, self.port))
-            self.socket.listen(5)
+            self.socket.listen(self.backlog)
             self.running = True
             
             print(f"✅ Serveur démarré sur {self.host}:{self.port}")
@@ -82,10 +274,17 @@ class FileShareServer:
                     
                     print(f"🔌 Nouvelle connexion: {address} (Total: {num_clients + 1} client(s))")
                     
+                    # Chaque connexion a sa file sortante et son thread writer
+                    connection = ThreadedConnection(
+                        client_socket, address,
+                        self.outbound_queue_size, self.slow_consumer_policy, self.max_frame_size,
+                        self.flush_window
+                    )
+                    
                     # Créer un thread pour gérer le client
                     client_thread = threading.Thread(
                         target=self.handle_client,
-                        args=(client_socket, address),
+                        args=(connection, address),
                         name=f"Client-{address[0]}:{address[1]}"
                     )
                     client_thread.daemon = True
@@ -101,58 +300,203 @@ class FileShareServer:
             if self.socket:
                 self.socket.close()
     
-    def send_message(self, client_socket, message_type, payload):
-        """Envoyer un message à un client"""
-        message = {
-            "type": message_type,
-            "payload": payload,
-            "timestamp": datetime.now().isoformat()
-        }
+    def start_async(self):
+        """Démarrer le serveur en mode async (une boucle pour toutes les connexions)"""
         try:
-            # Encoder le message JSON en UTF-8
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
-            
-            # Créer l'en-tête de taille (4 octets, int 32 bits, big-endian)
-            size_header = struct.pack('>I', len(message_bytes))
+            asyncio.run(self.serve_async())
+        except Exception as e:
+            print(f"❌ Erreur de démarrage: {e}")
+    
+    async def serve_async(self):
+        """Boucle principale du mode async"""
+        self.loop = asyncio.get_running_loop()
+        self.transfer_executor = ThreadPoolExecutor(
+            max_workers=self.transfer_workers,
+            thread_name_prefix="Transfer"
+        )
+        # Un thread par calcul KDF admis: les LOGIN en trop attendent dans la file de ce pool
+        self.auth_executor = ThreadPoolExecutor(
+            max_workers=self.passwords.max_pending,
+            thread_name_prefix="Auth"
+        )
+        self.async_server = await asyncio.start_server(
+            self.handle_async_client,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=True,
+            limit=STREAM_READER_LIMIT
+        )
+        self.running = True
+        
+        print(f"✅ Serveur démarré sur {self.host}:{self.port}")
+        print("⏳ En attente de connexions...\n")
+        print("💡 Le serveur utilise une boucle asyncio unique pour toutes les connexions\n")
+        
+        try:
+            async with self.async_server:
+                await self.async_server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.transfer_executor.shutdown(wait=False)
+            self.auth_executor.shutdown(wait=False)
+    
+    async def receive_message_async(self, reader, codec="json"):
+        """Recevoir un message d'un client (mode async)"""
+        try:
+            # Le StreamReader bufferise déjà les lectures: seule la taille max est à vérifier
+            size_header = await reader.readexactly(FRAME_HEADER.size)
+            message_size = FRAME_HEADER.unpack(size_header)[0]
+            if message_size > self.max_frame_size:
+                raise FrameTooLargeError(
+                    f"Trame trop grande ({message_size} octets, max {self.max_frame_size})"
+                )
+            message_bytes = await reader.readexactly(message_size)
+            return decode_body(message_bytes, codec)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        except Exception as e:
+            print(f"❌ Erreur de réception: {e}")
+            return None
+    
+    def needs_disk(self, client_socket, message_type):
+        """Vrai si le message lit ou écrit le disque (mode async: pool des transferts)"""
+        if message_type in self.disk_message_types:
+            return True
+        if message_type in ROOM_FILES_MESSAGE_TYPES:
+            room_id = self.clients.get(client_socket, {}).get("room")
+            return room_id is not None and not self.files_by_room.is_loaded(room_id)
+        return False
+    
+    async def handle_async_client(self, reader, writer):
+        """Gérer un client connecté (mode async)"""
+        client_socket = AsyncConnection(
+            reader, writer, self.loop,
+            self.outbound_queue_size, self.slow_consumer_policy, self.flush_window
+        )
+        address = client_socket.address
+        
+        with self.clients_lock:
+            num_clients = len(self.clients)
+            self.register_client(client_socket, address)
+        
+        print(f"🔌 Nouvelle connexion: {address} (Total: {num_clients + 1} client(s))")
+        
+        try:
+            while self.running:
+                message = await self.receive_message_async(reader, client_socket.codec)
+                
+                if not message:
+                    break
+                
+                transfer = message.get("type") in BLOCKING_MESSAGE_TYPES
+                self.touch_client(client_socket, transfer)
+                
+                # Les transferts bloquants passent par le pool de threads,
+                # la connexion attend la fin avant de lire le message suivant
+                if transfer:
+                    keep_open = await self.loop.run_in_executor(
+                        self.transfer_executor, self.dispatch_message, client_socket, message
+                    )
+                    self.touch_client(client_socket)
+                elif message.get("type") in AUTH_MESSAGE_TYPES:
+                    keep_open = await self.loop.run_in_executor(
+                        self.auth_executor, self.dispatch_message, client_socket, message
+                    )
+                elif self.needs_disk(client_socket, message.get("type")):
+                    keep_open = await self.loop.run_in_executor(
+                        self.transfer_executor, self.dispatch_message, client_socket, message
+                    )
+                else:
+                    keep_open = self.dispatch_message(client_socket, message)
+                
+                if not keep_open:
+                    break
+                
+                # Requête refusée (RATE_LIMITED): ne plus lire la connexion jusqu'au prochain
+                # jeton, sans monopoliser la boucle avec des trames qui seraient refusées
+                if client_socket.throttle:
+                    await asyncio.sleep(client_socket.throttle)
+                    client_socket.throttle = 0
+        
+        except asyncio.CancelledError:
+            pass
+        
+        except Exception as e:
+            print(f"❌ Erreur avec {address}: {e}")
+        
+        finally:
+            self.remove_client(client_socket, address)
+    
+    def send_message(self, client_socket, message_type, payload, begin_stream=False):
+        """Mettre un message dans la file sortante d'un client
+        
+        begin_stream: le message annonce un flux binaire ; les messages suivants
+        sont retenus jusqu'à client_socket.end_stream()
+        """
+        codec = client_socket.codec
+        try:
+            # Encoder dans le codec négocié par la connexion (JSON par défaut),
+            # avec l'en-tête de taille (4 octets, int 32 bits, big-endian) à part
+            parts = encode_frame_parts(make_message(message_type, payload, codec), codec)
             
-            # Envoyer l'en-tête puis les données
-            client_socket.sendall(size_header + message_bytes)
+            # Le writer de la connexion envoie la trame (groupée avec les autres
+            # trames en attente), sans bloquer l'appelant
+            if begin_stream:
+                client_socket.begin_stream(parts)
+                return
+            key = message_type if message_type in COALESCABLE_MESSAGE_TYPES else None
+            client_socket.send_frame(parts, key)
         except Exception as e:
             print(f"❌ Erreur d'envoi: {e}")
     
+    def send_to_connections(self, connections, message_type, payload):
+        """Envoyer le même message à plusieurs connexions
+        
+        La trame est encodée une seule fois par codec utilisé (JSON, msgpack...)
+        et les mêmes buffers immuables sont déposés dans chaque file sortante:
+        une room de 500 membres coûte un encodage, pas 500.
+        """
+        frames = {}  # {codec: (en-tête, corps)}
+        key = message_type if message_type in COALESCABLE_MESSAGE_TYPES else None
+        for client_socket in connections:
+            codec = client_socket.codec
+            try:
+                parts = frames.get(codec)
+                if parts is None:
+                    parts = frames[codec] = encode_frame_parts(make_message(message_type, payload, codec), codec)
+                client_socket.send_frame(parts, key)
+            except Exception as e:
+                print(f"❌ Erreur d'envoi: {e}")
+    
     def receive_message(self, client_socket):
         """Recevoir un message d'un client"""
         try:
-            # Lire l'en-tête de taille (4 octets)
-            size_header = b''
-            while len(size_header) < 4:
-                chunk = client_socket.recv(4 - len(size_header))
-                if not chunk:
-                    return None
-                size_header += chunk
-            
-            # Décoder la taille du message
-            message_size = struct.unpack('>I', size_header)[0]
-            
-            # Lire exactement message_size octets
-            message_bytes = b''
-            while len(message_bytes) < message_size:
-                chunk = client_socket.recv(message_size - len(message_bytes))
-                if not chunk:
-                    return None
-                message_bytes += chunk
+            # Trame suivante, souvent déjà dans le buffer de lecture de la connexion
+            message_bytes = client_socket.read_frame()
+            if message_bytes is None:
+                return None
             
-            # Décoder et parser le JSON
-            message_str = message_bytes.decode('utf-8')
-            return json.loads(message_str)
+            # Décoder le corps (JSON ou codec négocié)
+            return decode_body(message_bytes, client_socket.codec)
         except Exception as e:
             print(f"❌ Erreur de réception: {e}")
             return None
     
-    def hash_password(self, password):
-        """Hasher un mot de passe"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def handle_hello(self, client_socket, payload):
+        """Négocier la version du protocole et le codec des trames suivantes"""
+        codec = choose_codec(payload.get("codecs", []))
+        
+        # La réponse part encore dans l'ancien codec, la bascule se fait juste après
+        self.send_message(client_socket, "HELLO_ACK", {
+            "version": PROTOCOL_VERSION,
+            "codec": codec,
+            "codecs": CODEC_PREFERENCE
+        })
+        client_socket.codec = codec
+        
+        print(f"🤝 {client_socket.address} protocole v{payload.get('version', 1)}, codec {codec}")
     
     def handle_register(self, client_socket, payload):
         """Gérer l'inscription d'un utilisateur"""
@@ -178,13 +522,24 @@ class FileShareServer:
             print(f"⚠️  Inscription refusée: pseudo {username} déjà existant")
             return
         
+        # Le KDF est calculé hors du lock: le pseudo est revérifié ensuite
+        password_hash = self.passwords.hash(password)
+        
         # Créer l'utilisateur
         user_id = str(uuid.uuid4())
-        self.users[username] = {
-            "password": self.hash_password(password),
-            "email": email,
-            "user_id": user_id
-        }
+        with self.users_lock:
+            if username in self.users:
+                self.send_message(client_socket, "REGISTER_ERROR", {
+                    "error": "Ce pseudo est déjà pris!",
+                    "code": "USERNAME_EXISTS"
+                })
+                print(f"⚠️  Inscription refusée: pseudo {username} déjà existant")
+                return
+            self.users[username] = {
+                "password": password_hash,
+                "email": email,
+                "user_id": user_id
+            }
         
         self.send_message(client_socket, "REGISTER_SUCCESS", {
             "user_id": user_id,
@@ -209,7 +564,8 @@ class FileShareServer:
             print(f"⚠️  Connexion refusée: utilisateur {username} introuvable")
             return
         
-        if self.users[username]["password"] != self.hash_password(password):
+        stored = self.users[username]["password"]
+        if not self.passwords.verify(password, stored):
             self.send_message(client_socket, "LOGIN_ERROR", {
                 "error": "Mot de passe incorrect",
                 "code": "INVALID_CREDENTIALS"
@@ -217,16 +573,16 @@ class FileShareServer:
             print(f"⚠️  Connexion refusée: mot de passe incorrect pour {username}")
             return
         
+        # Ancien hash SHA-256 (ou paramètres plus faibles): remplacé par un hash scrypt
+        if needs_rehash(stored):
+            self.users[username] = dict(self.users[username], password=self.passwords.hash(password))
+        
         # Créer une session
         session_token = str(uuid.uuid4())
         self.sessions[session_token] = username
         
         # Enregistrer le client de façon thread-safe
-        with self.clients_lock:
-            existing = self.clients.get(client_socket, {})
-            existing["pseudo"] = username
-            existing["session_token"] = session_token
-            self.clients[client_socket] = existing
+        self.bind_session(client_socket, username, session_token)
         
         self.send_message(client_socket, "LOGIN_SUCCESS", {
             "user_id": self.users[username]["user_id"],
@@ -236,6 +592,23 @@ class FileShareServer:
         
         print(f"✅ Connexion réussie: {username} (Thread: {threading.current_thread().name})")
     
+    def bind_session(self, client_socket, username, session_token):
+        """Associer une session (pseudo + token) à une connexion"""
+        with self.clients_lock:
+            existing = self.clients.get(client_socket, {})
+            previous = existing.get("pseudo")
+            if previous and previous != username:
+                self.unindex_user(client_socket, previous)
+            # La session n'expire pas par inactivité tant qu'une connexion lui est liée
+            previous_token = existing.get("session_token")
+            if previous_token and previous_token != session_token:
+                self.sessions.unbind(previous_token, client_socket)
+            self.sessions.bind(session_token, client_socket)
+            existing["pseudo"] = username
+            existing["session_token"] = session_token
+            self.clients[client_socket] = existing
+            self.index_user(client_socket, username)
+    
     def handle_list_files(self, client_socket, payload):
         """Gérer la demande de liste de fichiers"""
         session_token = payload.get("session_token")
@@ -267,10 +640,8 @@ class FileShareServer:
             # Retirer de la room si présent
             if client_socket in self.clients and "room" in self.clients[client_socket]:
                 room_id = self.clients[client_socket]["room"]
-                if room_id and room_id in self.rooms:
-                    if username in self.rooms[room_id]["members"]:
-                        self.rooms[room_id]["members"].remove(username)
-                        print(f"👋 {username} a quitté la room {room_id}")
+                if room_id and self.leave_room_index(client_socket, username, room_id):
+                    print(f"👋 {username} a quitté la room {room_id}")
             
             del self.sessions[session_token]
             print(f"🚪 Déconnexion: {username}")
@@ -324,32 +695,114 @@ class FileShareServer:
             })
             return
         
+        # Nombre de messages récents à joindre à JOIN_SUCCESS (0 = aucun)
+        history = payload.get("history", 0)
+        if not isinstance(history, int) or history < 0:
+            self.send_message(client_socket, "ERROR", {
+                "error": "history doit être un entier positif",
+                "code": "INVALID_DATA"
+            })
+            return
+        
+        # Connexion rétablie avec un token existant (reconnexion): lier la session
+        if self.clients.get(client_socket, {}).get("pseudo") != username:
+            self.bind_session(client_socket, username, session_token)
+        
         # Retirer de l'ancienne room si présent
         if client_socket in self.clients and "room" in self.clients[client_socket]:
             old_room = self.clients[client_socket]["room"]
-            if old_room and old_room in self.rooms:
-                if username in self.rooms[old_room]["members"]:
-                    self.rooms[old_room]["members"].remove(username)
+            if old_room:
+                self.leave_room_index(client_socket, username, old_room)
         
-        # Ajouter à la nouvelle room
-        if username not in self.rooms[room_id]["members"]:
-            self.rooms[room_id]["members"].append(username)
-        
-        self.clients[client_socket]["room"] = room_id
+        self.join_room(client_socket, username, room_id, history)
+    
+    def join_room(self, client_socket, username, room_id, history=0):
+        """Ajouter la connexion à la room, notifier les membres et confirmer (JOIN_SUCCESS)
         
-        self.send_message(client_socket, "JOIN_SUCCESS", {
-            "room_id": room_id,
-            "room_name": self.rooms[room_id]["name"],
-            "members": self.rooms[room_id]["members"]
-        })
+        Sous le lock des événements de la room: aucun événement ne s'intercale,
+        last_seq de JOIN_SUCCESS est le dernier numéro que le client n'a pas à recevoir
+        et les history derniers messages joints sont exactement ceux d'avant son arrivée.
+        """
+        with self.room_events[room_id].lock:
+            # Ajouter à la nouvelle room
+            self.join_room_index(client_socket, username, room_id)
+            
+            self.clients[client_socket]["room"] = room_id
+            
+            # Notifier les autres membres de la room
+            seq = self.broadcast_to_room(room_id, "USER_JOINED", {
+                "username": username,
+                "room_id": room_id
+            }, exclude_socket=client_socket)
+            
+            response = {
+                "room_id": room_id,
+                "room_name": self.rooms[room_id]["name"],
+                "members": self.get_room_members(room_id),
+                "epoch": self.epoch,
+                "last_seq": seq
+            }
+            if history:
+                messages, before = self.room_history[room_id].page(limit=min(history, MAX_HISTORY_PAGE))
+                response["history"] = messages
+                response["history_before"] = before
+            
+            self.send_message(client_socket, "JOIN_SUCCESS", response)
         
         print(f"🚪 {username} a rejoint la room {room_id}")
+    
+    def handle_resume(self, client_socket, payload):
+        """(Re)joindre une room après une reconnexion et rejouer les événements manqués"""
+        session_token = payload.get("session_token")
+        room_id = payload.get("room_id")
+        last_seq = payload.get("last_seq")
         
-        # Notifier les autres membres de la room
-        self.broadcast_to_room(room_id, "USER_JOINED", {
-            "username": username,
-            "room_id": room_id
-        }, exclude_socket=client_socket)
+        if session_token not in self.sessions:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Session invalide",
+                "code": "INVALID_SESSION"
+            })
+            return
+        
+        username = self.sessions[session_token]
+        
+        if room_id not in self.rooms:
+            self.send_message(client_socket, "JOIN_ERROR", {
+                "error": "Room introuvable",
+                "code": "ROOM_NOT_FOUND"
+            })
+            return
+        
+        # Connexion rétablie avec un token existant (reconnexion): lier la session
+        if self.clients.get(client_socket, {}).get("pseudo") != username:
+            self.bind_session(client_socket, username, session_token)
+        
+        current_room = self.clients.get(client_socket, {}).get("room")
+        if current_room and current_room != room_id:
+            self.leave_room_index(client_socket, username, current_room)
+        
+        events = self.room_events[room_id]
+        with events.lock:
+            # Événements manqués, puis entrée dans la room: rien ne s'intercale
+            missed = None
+            if isinstance(last_seq, int) and payload.get("epoch") == self.epoch:
+                missed = events.since(last_seq)
+            
+            if current_room != room_id:
+                self.join_room(client_socket, username, room_id)
+            
+            self.send_message(client_socket, "RESUMED", {
+                "room_id": room_id,
+                "epoch": self.epoch,
+                "last_seq": events.seq,
+                "events": missed or [],
+                "gap": missed is None
+            })
+        
+        if missed is None:
+            print(f"⚠️  [{room_id}] Reprise impossible pour {username} (seq {last_seq}): synchronisation complète requise")
+        else:
+            print(f"🔁 [{room_id}] {username} reprend après seq {last_seq}: {len(missed)} événement(s) rejoué(s)")
     
     def handle_send_message(self, client_socket, payload):
         """Gérer l'envoi d'un message dans une room"""
@@ -381,27 +834,129 @@ class FileShareServer:
             })
             return
         
+        # Chaque message coûte O(membres) envois: limiter avant de diffuser
+        if not self.check_rate_limit(client_socket, "chat", username, room_id):
+            return
+        
         print(f"💬 [{room_id}] {username}: {message_text}")
         
-        # Diffuser le message à tous les membres de la room
-        self.broadcast_to_room(room_id, "MESSAGE", {
+        message = {
             "username": username,
             "message": message_text,
             "room_id": room_id,
             "timestamp": datetime.now().isoformat()
-        })
+        }
+        
+        # Journal, historique et diffusion sous le lock des événements: le journal suit
+        # l'ordre des seq, et un client qui rejoint la room reçoit le message soit dans
+        # son historique, soit en direct
+        with self.room_events[room_id].lock:
+            if self.chat_log:
+                self.chat_log.append(room_id, message)
+            self.room_history[room_id].append(message)
+            self.broadcast_to_room(room_id, "MESSAGE", message)
+        
+        # fsync ("always") et compression hors du lock: la room n'attend pas le disque
+        if self.chat_log:
+            self.chat_log.commit(room_id)
     
-    def broadcast_to_room(self, room_id, message_type, payload, exclude_socket=None):
-        """Envoyer un message à tous les membres d'une room"""
+    def handle_history(self, client_socket, payload):
+        """Gérer une demande d'historique: messages antérieurs à before, du plus ancien au plus récent"""
+        session_token = payload.get("session_token")
+        
+        if session_token not in self.sessions:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Session invalide",
+                "code": "INVALID_SESSION"
+            })
+            return
+        
+        # Room courante par défaut
+        room_id = payload.get("room_id") or self.clients.get(client_socket, {}).get("room")
+        
         if room_id not in self.rooms:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Room introuvable",
+                "code": "ROOM_NOT_FOUND"
+            })
             return
         
-        members = self.rooms[room_id]["members"]
+        before = payload.get("before")
+        limit = payload.get("limit", 50)
         
-        for client_socket, client_data in self.clients.items():
-            if client_data.get("room") == room_id:
-                if exclude_socket is None or client_socket != exclude_socket:
-                    self.send_message(client_socket, message_type, payload)
+        if ((before is not None and not isinstance(before, int))
+                or not isinstance(limit, int) or limit < 1):
+            self.send_message(client_socket, "ERROR", {
+                "error": "Paramètres d'historique invalides",
+                "code": "INVALID_DATA"
+            })
+            return
+        
+        messages, next_before = self.room_history[room_id].page(before, min(limit, MAX_HISTORY_PAGE))
+        
+        self.send_message(client_socket, "HISTORY_DATA", {
+            "room_id": room_id,
+            "messages": messages,
+            "before": next_before
+        })
+    
+    def history_stats(self):
+        """Mémoire de l'historique de chaque room: {room_id: {"messages", "bytes", "budget", "evicted"}}"""
+        return {room_id: history.stats() for room_id, history in self.room_history.items()}
+    
+    def join_room_index(self, client_socket, username, room_id):
+        """Ajouter une connexion à l'index de la room"""
+        with self.rooms_lock:
+            self.room_connections[room_id].add(client_socket)
+            members = self.rooms[room_id]["members"]
+            if username not in members:
+                self.room_changes[room_id].record("member", "added", username)
+            members[username] = members.get(username, 0) + 1
+    
+    def leave_room_index(self, client_socket, username, room_id):
+        """Retirer une connexion de l'index de la room (False si elle n'y était pas)"""
+        with self.rooms_lock:
+            connections = self.room_connections.get(room_id)
+            if connections is None or client_socket not in connections:
+                return False
+            
+            connections.discard(client_socket)
+            members = self.rooms[room_id]["members"]
+            remaining = members.get(username, 0) - 1
+            if remaining > 0:
+                members[username] = remaining
+            else:
+                members.pop(username, None)
+                self.room_changes[room_id].record("member", "removed", username)
+            return True
+    
+    def get_room_members(self, room_id):
+        """Liste des pseudos présents dans une room"""
+        with self.rooms_lock:
+            return list(self.rooms[room_id]["members"])
+    
+    def get_room_connections(self, room_id):
+        """Copie des connexions présentes dans une room"""
+        with self.rooms_lock:
+            return list(self.room_connections.get(room_id, ()))
+    
+    def broadcast_to_room(self, room_id, message_type, payload, exclude_socket=None):
+        """Envoyer un événement à tous les membres d'une room (retourne son numéro de séquence)"""
+        if room_id not in self.rooms:
+            return None
+        
+        events = self.room_events[room_id]
+        with events.lock:
+            # Numéroté et mis en file sous le même lock: l'ordre des numéros est l'ordre reçu
+            payload = events.record(message_type, payload)
+            
+            # Coût proportionnel à la taille de la room, pas au nombre de clients
+            self.send_to_connections(
+                [client_socket for client_socket in self.get_room_connections(room_id)
+                 if exclude_socket is None or client_socket != exclude_socket],
+                message_type, payload
+            )
+            return payload["seq"]
     
     def handle_p2p_request(self, client_socket, payload):
         """Gérer une demande de connexion P2P entre deux clients"""
@@ -417,6 +972,9 @@ class FileShareServer:
         
         requester_username = self.sessions[session_token]
         
+        if not self.check_rate_limit(client_socket, "p2p", requester_username):
+            return
+        
         # Trouver le socket et l'adresse du demandeur
         requester_address = None
         with self.clients_lock:
@@ -434,11 +992,9 @@ class FileShareServer:
         target_address = None
         
         with self.clients_lock:
-            for sock, client_info in self.clients.items():
-                if client_info.get("pseudo") == target_username:
-                    target_socket = sock
-                    target_address = client_info.get("address")
-                    break
+            target_socket = self.find_user_connection(target_username)
+            if target_socket is not None:
+                target_address = self.clients[target_socket].get("address")
         
         if not target_socket or not target_address:
             self.send_message(client_socket, "P2P_ERROR", {
@@ -470,6 +1026,7 @@ class FileShareServer:
         session_token = payload.get("session_token")
         filename = payload.get("filename")
         file_size = payload.get("size")
+        blob_hash = payload.get("hash")  # Optionnel: SHA-256 annoncé par le client
         
         if session_token not in self.sessions:
             self.send_message(client_socket, "ERROR", {
@@ -504,90 +1061,385 @@ class FileShareServer:
             })
             return
         
-        # Créer un nom de fichier unique
+        if blob_hash is not None and not is_valid_hash(blob_hash):
+            self.send_message(client_socket, "ERROR", {
+                "error": "Hash invalide (SHA-256 hexadécimal attendu)",
+                "code": "INVALID_DATA"
+            })
+            return
+        
+        if not self.check_rate_limit(client_socket, "upload", username, room_id):
+            return
+        
+        # Identifiant unique de l'upload
         file_id = str(uuid.uuid4())[:8]
-        safe_filename = f"{file_id}_{filename}"
-        file_path = os.path.join(self.upload_dir, room_id, safe_filename)
         
         print(f"📤 [{room_id}] {username} upload '{filename}' ({file_size} octets)")
         
-        # Signaler que le serveur est prêt à recevoir
-        self.send_message(client_socket, "UPLOAD_READY", {
+        self.expire_partial_uploads()
+        
+        upload = {
             "upload_id": file_id,
-            "ready": True
+            "filename": filename,
+            "hash": blob_hash,
+            "uploader": username,
+            "room_id": room_id,
+            "size": file_size,
+            "created": time.time()
+        }
+        self.save_partial_upload(upload)
+        self.run_upload(client_socket, upload)
+    
+    def handle_upload_resume(self, client_socket, payload):
+        """Reprendre un upload interrompu là où le serveur s'est arrêté"""
+        session_token = payload.get("session_token")
+        upload_id = payload.get("upload_id")
+        
+        if session_token not in self.sessions:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Session invalide",
+                "code": "INVALID_SESSION"
+            })
+            return
+        
+        username = self.sessions[session_token]
+        upload = self.load_partial_upload(upload_id)
+        
+        if not upload or upload["uploader"] != username:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Upload introuvable ou expiré",
+                "code": "UPLOAD_NOT_FOUND"
+            })
+            return
+        
+        if not self.check_rate_limit(client_socket, "upload", username, upload["room_id"]):
+            return
+        
+        print(f"🔄 [{upload['room_id']}] {username} reprend l'upload '{upload['filename']}'")
+        self.run_upload(client_socket, upload, session_token)
+    
+    def check_rate_limit(self, client_socket, kind, username, room_id=None):
+        """Prendre un jeton de kind ("chat", "upload", "p2p") ; sinon répondre RATE_LIMITED et retourner False"""
+        if self.rate_limiter is None:
+            return True
+        
+        retry_after = self.rate_limiter.acquire(kind, connection=client_socket, user=username, room=room_id)
+        if not retry_after:
+            return True
+        
+        # La boucle de lecture de la connexion fait une pause de retry_after
+        client_socket.throttle = retry_after
+        self.send_message(client_socket, "ERROR", {
+            "error": f"Trop de requêtes, réessayez dans {retry_after:.1f}s",
+            "code": "RATE_LIMITED",
+            "retry_after": round(retry_after, 3)
+        })
+        return False
+    
+    def handle_upload_check(self, client_socket, payload):
+        """Indiquer si un contenu est déjà stocké (le client peut alors éviter l'envoi)"""
+        session_token = payload.get("session_token")
+        blob_hash = payload.get("hash")
+        size = payload.get("size")
+        
+        if session_token not in self.sessions:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Session invalide",
+                "code": "INVALID_SESSION"
+            })
+            return
+        
+        if not is_valid_hash(blob_hash) or not isinstance(size, int):
+            self.send_message(client_socket, "ERROR", {
+                "error": "Hash ou taille invalide",
+                "code": "INVALID_DATA"
+            })
+            return
+        
+        self.send_message(client_socket, "UPLOAD_CHECK_RESULT", {
+            "hash": blob_hash,
+            "size": size,
+            "exists": self.blobs.exists(blob_hash, size)
         })
+    
+    def partial_upload_paths(self, upload_id):
+        """Chemins du fichier partiel et de ses métadonnées"""
+        base = os.path.join(self.partial_dir, upload_id)
+        return base + ".part", base + ".json"
+    
+    def save_partial_upload(self, upload):
+        _, meta_path = self.partial_upload_paths(upload["upload_id"])
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(upload, f)
+    
+    def load_partial_upload(self, upload_id):
+        """Métadonnées d'un upload partiel (None si inconnu)"""
+        if not upload_id or not upload_id.isalnum():
+            return None
+        _, meta_path = self.partial_upload_paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def expire_partial_uploads(self, force=False):
+        """Supprimer les uploads partiels abandonnés (au plus une fois par minute)"""
+        now = time.time()
+        if not force and now - self.last_partial_sweep < 60:
+            return
+        self.last_partial_sweep = now
+        
+        for entry in os.scandir(self.partial_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            upload_id = entry.name[:-5]
+            part_path, meta_path = self.partial_upload_paths(upload_id)
+            
+            # Dernière activité: écriture de données ou des métadonnées
+            last_activity = entry.stat().st_mtime
+            if os.path.exists(part_path):
+                last_activity = max(last_activity, os.path.getmtime(part_path))
+            
+            with self.uploads_lock:
+                if upload_id in self.active_uploads or now - last_activity < self.partial_upload_ttl:
+                    continue
+            
+            for path in (part_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"🗑️  Upload partiel expiré: {upload_id}")
+    
+    def acquire_upload(self, client_socket, upload_id, session_token=None):
+        """Devenir la connexion qui reçoit upload_id (False s'il est reçu par une autre)"""
+        with self.uploads_lock:
+            holder = self.active_uploads.get(upload_id)
+            if holder is None:
+                self.active_uploads[upload_id] = client_socket
+                return True
+        
+        if session_token is None:
+            return False
+        with self.clients_lock:
+            holder_info = self.clients.get(holder)
+        if holder_info is not None:
+            if holder_info.get("session_token") != session_token:
+                return False
+            # Ancienne connexion de la même session: son receveur se termine à la fermeture
+            print(f"♻️  Upload {upload_id} repris par une nouvelle connexion, fermeture de {holder_info['address']}")
+            self.remove_client(holder, holder_info["address"])
+            holder.close(flush=False)
+        # Sinon la connexion est déjà fermée (inactive) et son receveur se termine
+        
+        with self.uploads_lock:
+            released = self.upload_released.wait_for(
+                lambda: upload_id not in self.active_uploads, UPLOAD_TAKEOVER_TIMEOUT
+            )
+            if released:
+                self.active_uploads[upload_id] = client_socket
+            return released
+    
+    def run_upload(self, client_socket, upload, session_token=None):
+        """Recevoir (ou compléter) un upload dans son fichier partiel
+        
+        Avec session_token (UPLOAD_RESUME), un upload encore reçu par une autre
+        connexion de la même session est repris: cette connexion, coupée côté
+        client sans que le serveur le sache, est fermée.
+        """
+        upload_id = upload["upload_id"]
+        blob_hash = upload.get("hash")
+        part_path, _ = self.partial_upload_paths(upload_id)
         
-        # Recevoir les données binaires
+        if not self.acquire_upload(client_socket, upload_id, session_token):
+            self.send_message(client_socket, "ERROR", {
+                "error": "Cet upload est déjà en cours",
+                "code": "UPLOAD_IN_PROGRESS"
+            })
+            return
+        
+        claimed = False
         try:
-            received = 0
-            with open(file_path, 'wb') as f:
-                while received < file_size:
-                    # Lire la taille du chunk (8 octets)
-                    chunk_size_data = client_socket.recv(8)
-                    if not chunk_size_data or len(chunk_size_data) < 8:
-                        break
-                    
-                    chunk_size = struct.unpack('!Q', chunk_size_data)[0]
-                    
-                    # Lire le chunk
-                    chunk_data = b''
-                    while len(chunk_data) < chunk_size:
-                        remaining = chunk_size - len(chunk_data)
-                        data = client_socket.recv(min(8192, remaining))
-                        if not data:
-                            break
-                        chunk_data += data
-                    
-                    f.write(chunk_data)
-                    received += len(chunk_data)
+            # Contenu déjà stocké: rien à transférer. Si un upload identique est
+            # en cours, l'attendre puis réutiliser son blob (ou prendre le relais) ;
+            # au-delà de BLOB_CLAIM_WAIT le contenu est reçu sans attendre
+            deadline = time.monotonic() + BLOB_CLAIM_WAIT
+            while blob_hash:
+                if self.publish_existing_blob(client_socket, upload):
+                    return
+                event = self.blobs.claim(blob_hash)
+                if event is None:
+                    claimed = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"⌛ [{upload['room_id']}] '{upload['filename']}': upload identique toujours en cours, réception directe")
+                    break
+                print(f"⏳ [{upload['room_id']}] '{upload['filename']}': upload identique en cours, attente")
+                event.wait(remaining)
             
-            if received == file_size:
-                # Enregistrer les métadonnées
-                file_metadata = {
-                    "filename": filename,
-                    "safe_filename": safe_filename,
-                    "uploader": username,
-                    "size": file_size,
-                    "path": file_path,
-                    "upload_date": datetime.now().isoformat()
-                }
-                self.files_by_room[room_id].append(file_metadata)
-                
-                # Confirmer l'upload
-                self.send_message(client_socket, "UPLOAD_COMPLETE", {
-                    "upload_id": file_id,
-                    "filename": filename,
-                    "success": True
-                })
-                
-                print(f"✅ [{room_id}] Fichier '{filename}' uploadé par {username}")
-                
-                # Notifier tous les membres de la room
-                self.broadcast_to_room(room_id, "FILE_SHARED", {
-                    "filename": filename,
-                    "uploader": username,
-                    "size": file_size,
-                    "room_id": room_id,
-                    "timestamp": datetime.now().isoformat()
-                })
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            
+            # Le SHA-256 est calculé pendant la réception (préfixe déjà reçu relu une fois)
+            if offset:
+                digest = hash_file(part_path, bytearray(TRANSFER_BUFFER_SIZE), length=offset)
             else:
-                os.remove(file_path)
+                digest = hashlib.sha256()
+            
+            # Signaler que le serveur est prêt à recevoir (à partir de offset)
+            self.send_message(client_socket, "UPLOAD_READY", {
+                "upload_id": upload_id,
+                "ready": True,
+                "offset": offset
+            })
+            
+            # Recevoir les données binaires à la suite du fichier partiel
+            with open(part_path, 'ab') as f:
+                received = offset + self.receive_upload_data(
+                    client_socket, f, upload["size"] - offset, digest
+                )
+            
+            if received == upload["size"]:
+                self.finish_upload(client_socket, upload, digest.hexdigest())
+            else:
+                # Le fichier partiel est conservé pour UPLOAD_RESUME
+                print(f"⏸️  [{upload['room_id']}] Upload '{upload['filename']}' interrompu "
+                      f"({received}/{upload['size']} octets)")
                 self.send_message(client_socket, "ERROR", {
                     "error": "Transfert incomplet",
-                    "code": "TRANSFER_INCOMPLETE"
+                    "code": "TRANSFER_INCOMPLETE",
+                    "upload_id": upload_id,
+                    "offset": received
                 })
         
         except Exception as e:
             print(f"❌ Erreur d'upload: {e}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
             self.send_message(client_socket, "ERROR", {
                 "error": f"Erreur d'upload: {str(e)}",
-                "code": "UPLOAD_ERROR"
+                "code": "UPLOAD_ERROR",
+                "upload_id": upload_id
             })
+        
+        finally:
+            if claimed:
+                self.blobs.release_claim(blob_hash)
+            with self.uploads_lock:
+                if self.active_uploads.get(upload_id) is client_socket:
+                    del self.active_uploads[upload_id]
+                    self.upload_released.notify_all()
+    
+    def finish_upload(self, client_socket, upload, blob_hash):
+        """Ranger un upload complet dans le store puis le publier dans sa room"""
+        part_path, meta_path = self.partial_upload_paths(upload["upload_id"])
+        
+        if upload.get("hash") and upload["hash"] != blob_hash:
+            os.remove(part_path)
+            os.remove(meta_path)
+            print(f"⚠️  [{upload['room_id']}] Upload '{upload['filename']}' rejeté: hash différent de celui annoncé")
+            self.send_message(client_socket, "ERROR", {
+                "error": "Le contenu reçu ne correspond pas au hash annoncé",
+                "code": "HASH_MISMATCH",
+                "upload_id": upload["upload_id"]
+            })
+            return
+        
+        file_path = self.blobs.store(part_path, blob_hash)
+        os.remove(meta_path)
+        self.publish_file(client_socket, upload, blob_hash, file_path)
+    
+    def publish_existing_blob(self, client_socket, upload):
+        """Publier un upload dont le contenu est déjà stocké (retourne False sinon)"""
+        file_path = self.blobs.link(upload["hash"], upload["size"])
+        if file_path is None:
+            return False
+        
+        # Un éventuel début d'upload (reprise) devient inutile
+        for path in self.partial_upload_paths(upload["upload_id"]):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        print(f"♻️  [{upload['room_id']}] '{upload['filename']}' déjà stocké, aucun transfert")
+        self.publish_file(client_socket, upload, upload["hash"], file_path, deduplicated=True)
+        return True
+    
+    def publish_file(self, client_socket, upload, blob_hash, file_path, deduplicated=False):
+        """Ajouter l'entrée (référence vers le blob) dans la room et notifier"""
+        room_id = upload["room_id"]
+        filename = upload["filename"]
+        username = upload["uploader"]
+        
+        # Enregistrer les métadonnées
+        file_metadata = {
+            "filename": filename,
+            "uploader": username,
+            "size": upload["size"],
+            "path": file_path,
+            "hash": blob_hash,
+            "upload_date": datetime.now().isoformat(),
+            "file_id": upload["upload_id"]
+        }
+        self.files_by_room[room_id].append(file_metadata)
+        self.stored_files.add_file(room_id, file_metadata)
+        with self.rooms_lock:
+            self.room_changes[room_id].record("file", "added", self.file_info(file_metadata))
+        
+        # Confirmer l'upload
+        self.send_message(client_socket, "UPLOAD_COMPLETE", {
+            "upload_id": upload["upload_id"],
+            "filename": filename,
+            "hash": blob_hash,
+            "deduplicated": deduplicated,
+            "success": True
+        })
+        
+        print(f"✅ [{room_id}] Fichier '{filename}' uploadé par {username}")
+        
+        # Notifier tous les membres de la room
+        self.broadcast_to_room(room_id, "FILE_SHARED", {
+            "file_id": upload["upload_id"],
+            "filename": filename,
+            "uploader": username,
+            "size": upload["size"],
+            "room_id": room_id,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    def receive_upload_data(self, client_socket, f, length, digest=None):
+        """Recevoir les chunks d'un upload directement dans le fichier f
+        
+        Un seul buffer est alloué pour tout le transfert: les en-têtes et les
+        données sont lus par recv_into (lectures partielles gérées) puis
+        écrits sans copie intermédiaire (et ajoutés à digest s'il est fourni).
+        Retourne le nombre d'octets reçus.
+        """
+        buffer = bytearray(TRANSFER_BUFFER_SIZE)
+        header = memoryview(bytearray(CHUNK_HEADER.size))
+        received = 0
+        progress = self.transfer_progress(client_socket)
+        
+        while received < length:
+            # Lire la taille du chunk (8 octets, même en plusieurs morceaux)
+            if not recv_exact_into(client_socket, header):
+                break
+            
+            chunk_size = CHUNK_HEADER.unpack(header)[0]
+            if chunk_size > length - received:
+                print(f"⚠️  Chunk invalide ({chunk_size} octets) pour {f.name}")
+                break
+            
+            # Lire le chunk directement vers le fichier
+            chunk_received = recv_to_file(client_socket, f, chunk_size, buffer, digest=digest,
+                                          progress=lambda done: progress(received + done))
+            received += chunk_received
+            if chunk_received < chunk_size:
+                break
+        
+        return received
     
     def handle_list_room_files(self, client_socket, payload):
-        """Lister les fichiers de la room actuelle"""
+        """Lister les fichiers de la room actuelle (page triée et filtrée)
+        
+        Sans "limit" ni "cursor", tous les fichiers sont renvoyés (ancien format).
+        """
         session_token = payload.get("session_token")
         
         if session_token not in self.sessions:
@@ -608,28 +1460,64 @@ class FileShareServer:
         
         room_id = self.clients[client_socket]["room"]
         
-        files = self.files_by_room.get(room_id, [])
+        files = self.files_by_room.get(room_id, RoomFiles())
         
-        # Formater les infos des fichiers
-        files_info = [
-            {
-                "filename": f["filename"],
-                "uploader": f["uploader"],
-                "size": f["size"],
-                "upload_date": f["upload_date"]
-            }
-            for f in files
-        ]
+        sort = payload.get("sort", "date")
+        descending = payload.get("order") == "desc"
+        limit = payload.get("limit")
+        cursor = payload.get("cursor")
+        filters = {name: payload.get(name) for name in ("uploader", "min_size", "max_size", "prefix")}
+        
+        if (sort not in SORT_KEYS
+                or (limit is not None and (not isinstance(limit, int) or limit < 1))
+                or any(filters[name] is not None and not isinstance(filters[name], int)
+                       for name in ("min_size", "max_size"))
+                or any(filters[name] is not None and not isinstance(filters[name], str)
+                       for name in ("uploader", "prefix"))):
+            self.send_message(client_socket, "ERROR", {
+                "error": f"Paramètres de liste invalides (tris: {', '.join(SORT_KEYS)})",
+                "code": "INVALID_DATA"
+            })
+            return
+        
+        if limit is not None or cursor is not None:
+            limit = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        
+        try:
+            after = decode_cursor(cursor, sort, descending) if cursor is not None else None
+            page, last_key = files.page(sort, descending, after, limit, **filters)
+        except (InvalidCursorError, TypeError):
+            self.send_message(client_socket, "ERROR", {
+                "error": "Curseur de pagination invalide",
+                "code": "INVALID_CURSOR"
+            })
+            return
+        
+        files_info = [self.file_info(f) for f in page]
         
         self.send_message(client_socket, "ROOM_FILES_LIST", {
             "room_id": room_id,
-            "files": files_info
+            "files": files_info,
+            "total": len(files),
+            "next_cursor": encode_cursor(sort, descending, last_key) if last_key else None
         })
     
+    @staticmethod
+    def file_info(file_metadata):
+        """Infos d'un fichier envoyées aux clients (sans chemin ni hash)"""
+        return {
+            "file_id": file_metadata["file_id"],
+            "filename": file_metadata["filename"],
+            "uploader": file_metadata["uploader"],
+            "size": file_metadata["size"],
+            "upload_date": file_metadata["upload_date"]
+        }
+    
     def handle_download_file(self, client_socket, payload):
-        """Gérer le téléchargement d'un fichier de la room"""
+        """Gérer le téléchargement d'un fichier de la room (par file_id ou par nom)"""
         session_token = payload.get("session_token")
         filename = payload.get("filename")
+        file_id = payload.get("file_id")
         
         if session_token not in self.sessions:
             self.send_message(client_socket, "ERROR", {
@@ -649,12 +1537,9 @@ class FileShareServer:
         
         room_id = self.clients[client_socket]["room"]
         
-        # Trouver le fichier
-        file_metadata = None
-        for f in self.files_by_room.get(room_id, []):
-            if f["filename"] == filename:
-                file_metadata = f
-                break
+        # Trouver le fichier: par identifiant, sinon le plus récent portant ce nom
+        files = self.files_by_room.get(room_id, RoomFiles())
+        file_metadata = files.get(file_id) if file_id else files.find(filename)
         
         if not file_metadata:
             self.send_message(client_socket, "ERROR", {
@@ -664,6 +1549,7 @@ class FileShareServer:
             return
         
         file_path = file_metadata["path"]
+        filename = file_metadata["filename"]
         
         if not os.path.exists(file_path):
             self.send_message(client_socket, "ERROR", {
@@ -672,28 +1558,78 @@ class FileShareServer:
             })
             return
         
-        print(f"📥 [{room_id}] {username} télécharge '{filename}'")
+        # Mode de transfert négocié: "stream" (un seul bloc, sendfile) ou "chunked"
+        transfer_mode = "stream" if payload.get("mode") == "stream" else "chunked"
+        file_size = file_metadata["size"]
+        
+        # Plage optionnelle (reprise, lecture partielle): par défaut tout le fichier
+        offset = payload.get("offset", 0)
+        length = payload.get("length")
+        # if_range: file_id du fichier dont le client a déjà le début ; si ce n'est
+        # plus celui servi (ré-upload sous le même nom), tout le fichier est renvoyé
+        if_range = payload.get("if_range")
+        if if_range is not None and if_range != file_metadata["file_id"]:
+            offset, length = 0, None
+        if length is None:
+            length = file_size - offset if isinstance(offset, int) else None
+        
+        if (not isinstance(offset, int) or not isinstance(length, int)
+                or offset < 0 or length < 0 or offset > file_size):
+            self.send_message(client_socket, "ERROR", {
+                "error": f"Plage invalide (taille du fichier: {file_size} octets)",
+                "code": "INVALID_RANGE",
+                "size": file_size
+            })
+            return
+        
+        length = min(length, file_size - offset)
         
-        # Signaler que le serveur est prêt à envoyer
+        if offset or length != file_size:
+            print(f"📥 [{room_id}] {username} télécharge '{filename}' "
+                  f"[{offset}-{offset + length}] ({transfer_mode})")
+        else:
+            print(f"📥 [{room_id}] {username} télécharge '{filename}' ({transfer_mode})")
+        
+        # Signaler que le serveur est prêt à envoyer (avec la plage servie) ; les
+        # diffusions de la room attendent la fin des données binaires
         self.send_message(client_socket, "DOWNLOAD_READY", {
+            "file_id": file_metadata["file_id"],
             "filename": filename,
-            "size": file_metadata["size"]
-        })
+            "size": file_size,
+            "offset": offset,
+            "length": length,
+            "mode": transfer_mode
+        }, begin_stream=True)
         
-        # Envoyer les données binaires par chunks
         try:
             with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)
-                    if not chunk:
-                        break
-                    
-                    # Envoyer la taille du chunk (8 octets)
-                    chunk_size = struct.pack('!Q', len(chunk))
-                    client_socket.sendall(chunk_size)
-                    
-                    # Envoyer le chunk
-                    client_socket.sendall(chunk)
+                progress = self.transfer_progress(client_socket)
+                if transfer_mode == "stream":
+                    # Un seul bloc: en-tête de taille puis la plage sans copie,
+                    # par tranches pour suivre l'avancement
+                    client_socket.sendall(CHUNK_HEADER.pack(length))
+                    sent = 0
+                    while sent < length:
+                        count = min(SENDFILE_SLICE, length - sent)
+                        client_socket.sendfile(f, offset + sent, count)
+                        sent += count
+                        progress(sent)
+                else:
+                    # Envoyer les données binaires par chunks
+                    f.seek(offset)
+                    remaining = length
+                    while remaining > 0:
+                        chunk = f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        
+                        # Envoyer la taille du chunk (8 octets)
+                        client_socket.sendall(CHUNK_HEADER.pack(len(chunk)))
+                        
+                        # Envoyer le chunk
+                        client_socket.sendall(chunk)
+                        progress(length - remaining)
             
             print(f"✅ [{room_id}] Fichier '{filename}' téléchargé par {username}")
         
@@ -703,10 +1639,90 @@ class FileShareServer:
                 "error": f"Erreur de téléchargement: {str(e)}",
                 "code": "DOWNLOAD_ERROR"
             })
+        
+        finally:
+            client_socket.end_stream()
+    
+    def handle_delete_file(self, client_socket, payload):
+        """Supprimer un fichier de la room (réservé à celui qui l'a partagé)"""
+        session_token = payload.get("session_token")
+        filename = payload.get("filename")
+        file_id = payload.get("file_id")
+        
+        if session_token not in self.sessions:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Session invalide",
+                "code": "INVALID_SESSION"
+            })
+            return
+        
+        username = self.sessions[session_token]
+        
+        if client_socket not in self.clients or "room" not in self.clients[client_socket]:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Vous devez rejoindre une room d'abord",
+                "code": "NOT_IN_ROOM"
+            })
+            return
+        
+        room_id = self.clients[client_socket]["room"]
+        files = self.files_by_room.get(room_id, RoomFiles())
+        
+        # Par identifiant, sinon le plus récent de ses partages portant ce nom
+        if file_id:
+            file_metadata = files.get(file_id)
+            matches = [file_metadata] if file_metadata else []
+        else:
+            matches = files.named(filename)
+        file_metadata = next((f for f in reversed(matches) if f["uploader"] == username), None)
+        
+        if file_metadata is None:
+            self.send_message(client_socket, "ERROR", {
+                "error": "Seul l'auteur du partage peut supprimer ce fichier" if matches
+                         else "Fichier introuvable",
+                "code": "PERMISSION_DENIED" if matches else "FILE_NOT_FOUND"
+            })
+            return
+        
+        filename = file_metadata["filename"]
+        try:
+            files.remove(file_metadata)
+        except ValueError:
+            # Déjà supprimé par une requête concurrente
+            self.send_message(client_socket, "ERROR", {
+                "error": "Fichier introuvable",
+                "code": "FILE_NOT_FOUND"
+            })
+            return
+        
+        self.stored_files.delete_file(file_metadata["file_id"])
+        with self.rooms_lock:
+            self.room_changes[room_id].record("file", "removed", {"file_id": file_metadata["file_id"]})
+        
+        # Le blob n'est effacé du disque qu'avec sa dernière référence
+        if file_metadata.get("hash"):
+            self.blobs.release(file_metadata["hash"])
+        elif os.path.exists(file_metadata["path"]):
+            os.remove(file_metadata["path"])
+        
+        print(f"🗑️  [{room_id}] Fichier '{filename}' supprimé par {username}")
+        
+        notification = {
+            "file_id": file_metadata["file_id"],
+            "filename": filename,
+            "uploader": username,
+            "room_id": room_id,
+            "timestamp": datetime.now().isoformat()
+        }
+        # Le demandeur reçoit la confirmation avec le même numéro, sans qu'un autre événement s'intercale
+        with self.room_events[room_id].lock:
+            seq = self.broadcast_to_room(room_id, "FILE_DELETED", notification, exclude_socket=client_socket)
+            self.send_message(client_socket, "FILE_DELETED", dict(notification, seq=seq))
     
     def handle_sync_room(self, client_socket, payload):
-        """Gérer la synchronisation de la room (action avec séquence d'états)"""
+        """Gérer la synchronisation de la room (états de progression, différence depuis since_version)"""
         session_token = payload.get("session_token")
+        since_version = payload.get("since_version")
         
         if session_token not in self.sessions:
             self.send_message(client_socket, "ERROR", {
@@ -734,62 +1750,65 @@ class FileShareServer:
             "state": "preparing"
         })
         
-        import time
-        time.sleep(0.5)  # Simuler un traitement
+        # La version est lue avant l'état: un changement concurrent sera au
+        # pire renvoyé à la prochaine synchronisation (appliquer deux fois est sans effet)
+        with self.rooms_lock:
+            changes = self.room_changes[room_id]
+            version = changes.version
+            delta = None
+            if isinstance(since_version, int) and payload.get("epoch") == self.epoch:
+                delta = changes.since(since_version)
+            members = list(self.rooms[room_id]["members"])
         
-        # ÉTAT 2 : SYNC_READY - Prêt à envoyer les données
-        files = self.files_by_room.get(room_id, [])
-        members = self.rooms[room_id]["members"]
+        files = self.files_by_room.get(room_id, RoomFiles())
+        full = delta is None
         
+        # ÉTAT 2 : SYNC_READY - Prêt à envoyer les données
         self.send_message(client_socket, "SYNC_READY", {
-            "message": "Données prêtes",
+            "message": "Données prêtes" if full else "Différence prête",
             "state": "ready",
             "files_count": len(files),
-            "members_count": len(members)
+            "members_count": len(members),
+            "version": version,
+            "full": full
         })
         
-        time.sleep(0.3)
-        
-        # ÉTAT 3 : SYNC_DATA - Envoi des données de synchronisation
-        files_info = [
-            {
-                "filename": f["filename"],
-                "uploader": f["uploader"],
-                "size": f["size"],
-                "upload_date": f["upload_date"]
-            }
-            for f in files
-        ]
-        
-        self.send_message(client_socket, "SYNC_DATA", {
+        # ÉTAT 3 : SYNC_DATA - État complet, ou seulement les changements depuis since_version
+        data = {
             "state": "syncing",
             "room_id": room_id,
             "room_name": self.rooms[room_id]["name"],
-            "files": files_info,
-            "members": members,
-            "total_files_size": sum(f["size"] for f in files)
-        })
-        
-        time.sleep(0.3)
+            "epoch": self.epoch,
+            "version": version,
+            "full": full,
+            "total_files_size": files.total_size
+        }
+        if full:
+            data["files"] = [self.file_info(f) for f in files]
+            data["members"] = members
+            synced_files = len(data["files"])
+        else:
+            data.update(delta)
+            synced_files = len(delta["files_added"]) + len(delta["files_removed"])
+        self.send_message(client_socket, "SYNC_DATA", data)
         
         # ÉTAT 4 : SYNC_COMPLETE - Synchronisation terminée
         self.send_message(client_socket, "SYNC_COMPLETE", {
             "message": "Synchronisation terminée avec succès",
             "state": "completed",
-            "synced_files": len(files),
+            "synced_files": synced_files,
+            "version": version,
             "timestamp": datetime.now().isoformat()
         })
         
-        print(f"✅ [{room_id}] Synchronisation complétée pour {username}")
+        print(f"✅ [{room_id}] Synchronisation complétée pour {username} "
+              f"({'complète' if full else f'depuis v{since_version}'} → v{version})")
     
     def handle_client(self, client_socket, address):
         """Gérer un client connecté"""
         # Stocker l'adresse du client
         with self.clients_lock:
-            self.clients[client_socket] = {
-                "address": address,
-                "last_message_time": datetime.now()
-            }
+            self.register_client(client_socket, address)
         
         try:
             while self.running:
@@ -799,110 +1818,268 @@ class FileShareServer:
                     break
                 
                 # Mettre à jour le timestamp du dernier message
-                with self.clients_lock:
-                    if client_socket in self.clients:
-                        self.clients[client_socket]["last_message_time"] = datetime.now()
+                transfer = message.get("type") in BLOCKING_MESSAGE_TYPES
+                self.touch_client(client_socket, transfer)
                 
-                message_type = message.get("type")
-                payload = message.get("payload", {})
+                keep_open = self.dispatch_message(client_socket, message)
+                if transfer:
+                    self.touch_client(client_socket)
                 
-                # Router les messages
-                if message_type == "REGISTER":
-                    self.handle_register(client_socket, payload)
-                elif message_type == "LOGIN":
-                    self.handle_login(client_socket, payload)
-                elif message_type == "LIST_ROOMS":
-                    self.handle_list_rooms(client_socket, payload)
-                elif message_type == "JOIN_ROOM":
-                    self.handle_join_room(client_socket, payload)
-                elif message_type == "SEND_MESSAGE":
-                    self.handle_send_message(client_socket, payload)
-                elif message_type == "P2P_REQUEST":
-                    self.handle_p2p_request(client_socket, payload)
-                elif message_type == "UPLOAD_FILE":
-                    self.handle_upload_file(client_socket, payload)
-                elif message_type == "LIST_ROOM_FILES":
-                    self.handle_list_room_files(client_socket, payload)
-                elif message_type == "DOWNLOAD_FILE":
-                    self.handle_download_file(client_socket, payload)
-                elif message_type == "SYNC_ROOM":
-                    self.handle_sync_room(client_socket, payload)
-                elif message_type == "LIST_FILES":
-                    self.handle_list_files(client_socket, payload)
-                elif message_type == "LOGOUT":
-                    self.handle_logout(client_socket, payload)
+                if not keep_open:
                     break
-                elif message_type == "PING":
-                    self.send_message(client_socket, "PONG", {
-                        "timestamp": datetime.now().isoformat()
-                    })
-                else:
-                    self.send_message(client_socket, "ERROR", {
-                        "error": f"Type de message inconnu: {message_type}",
-                        "code": "INVALID_DATA"
-                    })
+                
+                # Requête refusée (RATE_LIMITED): ne plus lire la connexion jusqu'au prochain
+                # jeton, les trames en trop attendent dans les buffers TCP sans coûter de CPU
+                if client_socket.throttle:
+                    time.sleep(client_socket.throttle)
+                    client_socket.throttle = 0
         
         except Exception as e:
             print(f"❌ Erreur avec {address}: {e}")
         
         finally:
-            # Nettoyer le client
-            if client_socket in self.clients:
-                pseudo = self.clients[client_socket].get("pseudo", "Inconnu")
-                room_id = self.clients[client_socket].get("room")
-                
-                # Retirer de la room
-                if room_id and room_id in self.rooms:
-                    if pseudo in self.rooms[room_id]["members"]:
-                        self.rooms[room_id]["members"].remove(pseudo)
-                        # Notifier les autres membres
-                        self.broadcast_to_room(room_id, "USER_LEFT", {
-                            "username": pseudo,
-                            "room_id": room_id
-                        })
-                
-                print(f"🔌 Déconnexion: {pseudo} ({address})")
-                del self.clients[client_socket]
+            self.remove_client(client_socket, address)
+    
+    def dispatch_message(self, client_socket, message):
+        """Router un message vers son handler (retourne False pour fermer la connexion)"""
+        message_type = message.get("type")
+        payload = message.get("payload", {})
+        
+        # Router les messages
+        if message_type == "HELLO":
+            self.handle_hello(client_socket, payload)
+        elif message_type == "REGISTER":
+            self.handle_register(client_socket, payload)
+        elif message_type == "LOGIN":
+            self.handle_login(client_socket, payload)
+        elif message_type == "LIST_ROOMS":
+            self.handle_list_rooms(client_socket, payload)
+        elif message_type == "JOIN_ROOM":
+            self.handle_join_room(client_socket, payload)
+        elif message_type == "SEND_MESSAGE":
+            self.handle_send_message(client_socket, payload)
+        elif message_type == "P2P_REQUEST":
+            self.handle_p2p_request(client_socket, payload)
+        elif message_type == "UPLOAD_FILE":
+            self.handle_upload_file(client_socket, payload)
+        elif message_type == "UPLOAD_RESUME":
+            self.handle_upload_resume(client_socket, payload)
+        elif message_type == "UPLOAD_CHECK":
+            self.handle_upload_check(client_socket, payload)
+        elif message_type == "LIST_ROOM_FILES":
+            self.handle_list_room_files(client_socket, payload)
+        elif message_type == "DOWNLOAD_FILE":
+            self.handle_download_file(client_socket, payload)
+        elif message_type == "DELETE_FILE":
+            self.handle_delete_file(client_socket, payload)
+        elif message_type == "SYNC_ROOM":
+            self.handle_sync_room(client_socket, payload)
+        elif message_type == "RESUME":
+            self.handle_resume(client_socket, payload)
+        elif message_type == "HISTORY":
+            self.handle_history(client_socket, payload)
+        elif message_type == "LIST_FILES":
+            self.handle_list_files(client_socket, payload)
+        elif message_type == "LOGOUT":
+            self.handle_logout(client_socket, payload)
+            return False
+        elif message_type == "PING":
+            self.send_message(client_socket, "PONG", {
+                "timestamp": datetime.now().isoformat()
+            })
+        elif message_type == "PONG":
+            # Réponse à un PING du serveur: la trame a déjà mis à jour last_seen
+            pass
+        else:
+            self.send_message(client_socket, "ERROR", {
+                "error": f"Type de message inconnu: {message_type}",
+                "code": "INVALID_DATA"
+            })
+        
+        return True
+    
+    def remove_client(self, client_socket, address):
+        """Nettoyer un client déconnecté (room, liste des clients, socket)"""
+        with self.clients_lock:
+            client_info = self.unregister_client(client_socket)
+        
+        if client_info is not None:
+            pseudo = client_info.get("pseudo", "Inconnu")
+            room_id = client_info.get("room")
+            
+            # Retirer de la room
+            if room_id and self.leave_room_index(client_socket, pseudo, room_id):
+                # Notifier les autres membres
+                self.broadcast_to_room(room_id, "USER_LEFT", {
+                    "username": pseudo,
+                    "room_id": room_id
+                })
             
-            client_socket.close()
+            print(f"🔌 Déconnexion: {pseudo} ({address})")
+        
+        client_socket.close()
+    
+    def register_client(self, client_socket, address):
+        """Enregistrer une nouvelle connexion (appelant: clients_lock)"""
+        self.clients[client_socket] = {
+            "address": address,
+            "last_message_time": datetime.now(),
+            "last_seen": time.monotonic()
+        }
+        self.connections_by_address[address] = client_socket
+        self.schedule_heartbeat(client_socket, 0)
+    
+    def unregister_client(self, client_socket):
+        """Retirer une connexion de self.clients, des index, de sa session et du limiteur (appelant: clients_lock)
+        
+        Appelé une seule fois par connexion, par remove_client ou kick_client.
+        """
+        client_info = self.clients.pop(client_socket, None)
+        if client_info is None:
+            return None
+        
+        # Le délai d'inactivité de la session repart de la déconnexion
+        if client_info.get("session_token"):
+            self.sessions.unbind(client_info["session_token"], client_socket)
+        if self.rate_limiter:
+            self.rate_limiter.forget(client_socket)
+        if client_info.get("heartbeat"):
+            self.timers.cancel(client_info["heartbeat"])
+        if self.connections_by_address.get(client_info.get("address")) is client_socket:
+            del self.connections_by_address[client_info["address"]]
+        if client_info.get("pseudo"):
+            self.unindex_user(client_socket, client_info["pseudo"])
+        return client_info
+    
+    def touch_client(self, client_socket, transfer=False):
+        """Une trame vient d'être reçue ; transfer=True tant qu'un transfert bloquant est en cours"""
+        with self.clients_lock:
+            client_info = self.clients.get(client_socket)
+            if client_info is not None:
+                client_info["last_message_time"] = datetime.now()
+                client_info["last_seen"] = time.monotonic()
+                client_info["transfer"] = transfer
+    
+    def transfer_progress(self, client_socket):
+        """Retourne progress(total) à appeler pendant un transfert avec le nombre d'octets transférés
+        
+        last_seen est rafraîchi tous les TRANSFER_PROGRESS_BYTES octets: un transfert
+        qui avance n'est jamais inactif, un transfert bloqué (pair disparu) est fermé
+        après idle_timeout comme une connexion muette.
+        """
+        next_touch = TRANSFER_PROGRESS_BYTES
+        
+        def progress(total):
+            nonlocal next_touch
+            if total >= next_touch:
+                next_touch = total + TRANSFER_PROGRESS_BYTES
+                self.touch_client(client_socket, transfer=True)
+        
+        return progress
+    
+    def schedule_heartbeat(self, client_socket, silence):
+        """Programmer le minuteur d'une connexion muette depuis silence secondes (appelant: clients_lock)"""
+        delays = []
+        if self.heartbeat_interval:
+            # Au plus tard dans heartbeat_interval (un PING par intervalle de silence)
+            delays.append(self.heartbeat_interval - silence if silence < self.heartbeat_interval
+                          else self.heartbeat_interval)
+        if self.idle_timeout:
+            delays.append(self.idle_timeout - silence)
+        if delays:
+            self.clients[client_socket]["heartbeat"] = self.timers.schedule(
+                max(0, min(delays)), self.check_heartbeat, client_socket
+            )
+    
+    def check_heartbeat(self, client_socket):
+        """Échéance du minuteur d'une connexion: PING, fermeture si inactive, ou reprogrammation
+        
+        Une trame reçue ne touche pas la roue (elle met juste à jour last_seen) :
+        le minuteur est reprogrammé ici d'après le silence réel de la connexion.
+        """
+        with self.clients_lock:
+            client_info = self.clients.get(client_socket)
+            if client_info is None:
+                return
+            # Pendant un transfert, last_seen avance avec les octets transférés
+            silence = time.monotonic() - client_info["last_seen"]
+            if self.idle_timeout and silence >= self.idle_timeout:
+                address = client_info["address"]
+                self.reaped_connections += 1
+            else:
+                address = None
+                # Pas de PING au milieu d'un flux binaire (le client ne lit pas de trames)
+                if (self.heartbeat_interval and silence >= self.heartbeat_interval
+                        and not client_info.get("transfer")):
+                    self.send_message(client_socket, "PING", {
+                        "timestamp": datetime.now().isoformat()
+                    })
+                    self.pings_sent += 1
+                self.schedule_heartbeat(client_socket, silence)
+        
+        if address is not None:
+            # Même nettoyage qu'une déconnexion (room, USER_LEFT, session) ;
+            # la boucle de lecture de la connexion se termine sur la fermeture
+            print(f"💤 Connexion inactive depuis {int(silence)}s: {address}")
+            self.remove_client(client_socket, address)
+            client_socket.close(flush=False)
+    
+    def index_user(self, client_socket, username):
+        """Ajouter une connexion à l'index par pseudo (appelant: clients_lock)"""
+        self.connections_by_user.setdefault(username, {})[client_socket] = None
+    
+    def unindex_user(self, client_socket, username):
+        """Retirer une connexion de l'index par pseudo (appelant: clients_lock)"""
+        connections = self.connections_by_user.get(username)
+        if connections is None:
+            return
+        connections.pop(client_socket, None)
+        if not connections:
+            del self.connections_by_user[username]
+    
+    def find_user_connection(self, username):
+        """Connexion la plus récente d'un utilisateur, en O(1) (appelant: clients_lock)"""
+        connections = self.connections_by_user.get(username)
+        if not connections:
+            return None
+        return next(reversed(connections))
     
     def kick_client(self, client_address):
         """Kicker un client par son adresse (IP, port)"""
         with self.clients_lock:
-            for client_socket, client_info in list(self.clients.items()):
-                if client_info.get("address") == client_address:
-                    pseudo = client_info.get("pseudo", "Inconnu")
-                    room_id = client_info.get("room")
-                    
-                    # Notifier les autres membres de la room
-                    if room_id and room_id in self.rooms:
-                        if pseudo in self.rooms[room_id]["members"]:
-                            self.rooms[room_id]["members"].remove(pseudo)
-                            # Envoyer le message USER_KICKED aux autres
-                            self.broadcast_to_room(room_id, "USER_KICKED", {
-                                "username": pseudo,
-                                "room_id": room_id
-                            }, exclude_socket=client_socket)
-                    
-                    # Envoyer un message de kick au client
-                    try:
-                        self.send_message(client_socket, "KICKED", {
-                            "reason": "Vous avez été déconnecté par un administrateur"
-                        })
-                    except:
-                        pass
-                    
-                    # Fermer la connexion
-                    print(f"⚠️  Admin a kické: {pseudo} ({client_address})")
-                    del self.clients[client_socket]
-                    
-                    try:
-                        client_socket.close()
-                    except:
-                        pass
-                    
-                    return True
-        return False
+            client_socket = self.connections_by_address.get(client_address)
+            if client_socket is None:
+                return False
+            
+            client_info = self.unregister_client(client_socket)
+            pseudo = client_info.get("pseudo", "Inconnu")
+            room_id = client_info.get("room")
+            
+            # Notifier les autres membres de la room
+            if room_id and self.leave_room_index(client_socket, pseudo, room_id):
+                # Envoyer le message USER_KICKED aux autres
+                self.broadcast_to_room(room_id, "USER_KICKED", {
+                    "username": pseudo,
+                    "room_id": room_id
+                }, exclude_socket=client_socket)
+            
+            # Envoyer un message de kick au client
+            try:
+                self.send_message(client_socket, "KICKED", {
+                    "reason": "Vous avez été déconnecté par un administrateur"
+                })
+            except:
+                pass
+            
+            # Fermer la connexion
+            print(f"⚠️  Admin a kické: {pseudo} ({client_address})")
+            
+            try:
+                client_socket.close()
+            except:
+                pass
+            
+            return True
     
     def broadcast_server_message(self, message, target_type="all", target_id=None):
         """
@@ -917,56 +2094,64 @@ class FileShareServer:
         
         with self.clients_lock:
             if target_type == "all":
-                # Envoyer à tous les clients connectés
-                for client_socket in self.clients.keys():
-                    try:
-                        self.send_message(client_socket, "SERVER_BROADCAST", {
-                            "message": message,
-                            "timestamp": timestamp,
-                            "target": "Tous les clients"
-                        })
-                    except:
-                        pass
+                # Envoyer à tous les clients connectés (trame encodée une fois)
+                self.send_to_connections(list(self.clients.keys()), "SERVER_BROADCAST", {
+                    "message": message,
+                    "timestamp": timestamp,
+                    "target": "Tous les clients"
+                })
                 print(f"📢 Broadcast envoyé à tous les clients: {message}")
             
             elif target_type == "room" and target_id:
                 # Envoyer à tous les clients d'une room spécifique
                 if target_id in self.rooms:
                     room_name = self.rooms[target_id]["name"]
-                    for client_socket, client_info in self.clients.items():
-                        if client_info.get("room") == target_id:
-                            try:
-                                self.send_message(client_socket, "SERVER_BROADCAST", {
-                                    "message": message,
-                                    "timestamp": timestamp,
-                                    "target": f"Room {room_name}"
-                                })
-                            except:
-                                pass
+                    self.send_to_connections(self.get_room_connections(target_id), "SERVER_BROADCAST", {
+                        "message": message,
+                        "timestamp": timestamp,
+                        "target": f"Room {room_name}"
+                    })
                     print(f"📢 Broadcast envoyé à la room {room_name}: {message}")
             
             elif target_type == "user" and target_id:
                 # Envoyer à un client spécifique (par adresse)
-                for client_socket, client_info in self.clients.items():
-                    if client_info.get("address") == target_id:
-                        pseudo = client_info.get("pseudo", "Inconnu")
-                        try:
-                            self.send_message(client_socket, "SERVER_BROADCAST", {
-                                "message": message,
-                                "timestamp": timestamp,
-                                "target": f"Message privé pour {pseudo}"
-                            })
-                            print(f"📢 Message privé envoyé à {pseudo}: {message}")
-                        except:
-                            pass
-                        break
+                client_socket = self.connections_by_address.get(target_id)
+                if client_socket is not None:
+                    pseudo = self.clients[client_socket].get("pseudo", "Inconnu")
+                    try:
+                        self.send_message(client_socket, "SERVER_BROADCAST", {
+                            "message": message,
+                            "timestamp": timestamp,
+                            "target": f"Message privé pour {pseudo}"
+                        })
+                        print(f"📢 Message privé envoyé à {pseudo}: {message}")
+                    except:
+                        pass
     
     def stop(self):
         """Arrêter le serveur"""
         print("\n⏳ Arrêt du serveur...")
         self.running = False
         if self.socket:
+            # close() seul ne réveille pas un accept() bloqué (Linux)
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             self.socket.close()
+        if self.async_server and self.loop:
+            try:
+                self.loop.call_soon_threadsafe(self.async_server.close)
+            except RuntimeError:
+                # Boucle déjà terminée (stop() appelé une deuxième fois)
+                pass
+        if self.metadata:
+            # Valider les dernières écritures en attente
+            self.metadata.close()
+        if self.chat_log:
+            self.chat_log.close()
+        self.passwords.close()
+        self.timers.stop()
 
 
 class AdminDashboard:
@@ -1022,6 +2207,7 @@ class AdminDashboard:
                 ft.DataColumn(ft.Text("Pseudo", weight=ft.FontWeight.BOLD)),
                 ft.DataColumn(ft.Text("Room", weight=ft.FontWeight.BOLD)),
                 ft.DataColumn(ft.Text("Dernier Message", weight=ft.FontWeight.BOLD)),
+                ft.DataColumn(ft.Text("File sortante", weight=ft.FontWeight.BOLD)),
                 ft.DataColumn(ft.Text("Action", weight=ft.FontWeight.BOLD)),
             ],
             rows=[],
@@ -1118,11 +2304,42 @@ class AdminDashboard:
         """Obtenir le texte des statistiques"""
         with self.server.clients_lock:
             num_clients = len(self.server.clients)
+            total_dropped = sum(
+                client_socket.outbound.stats()["dropped"] for client_socket in self.server.clients
+            )
         
         num_users = len(self.server.users)
         num_rooms = len(self.server.rooms)
+        storage = self.server.blobs.stats()
+        passwords = self.server.passwords.stats()
+        sessions = self.server.sessions.stats()
+        
+        # Requêtes refusées (RATE_LIMITED) par type, et le seau qui a refusé
+        throttled = "désactivée"
+        if self.server.rate_limiter:
+            throttled = " | ".join(
+                f"{kind}: {sum(stats['limited'].values())} refusées / {stats['allowed']} acceptées ("
+                + ", ".join(f"{scope} {count}" for scope, count in stats["limited"].items()) + ")"
+                for kind, stats in self.server.rate_limiter.stats().items()
+            )
         
-        return f"👥 Clients connectés: {num_clients} | 📝 Utilisateurs enregistrés: {num_users} | 🚪 Rooms: {num_rooms}"
+        # Mémoire de l'historique de chat par room
+        history = " | ".join(
+            f"{room_id}: {stats['messages']} msg, {stats['bytes'] / 1024:.1f}/{stats['budget'] / 1024:.0f} Ko"
+            for room_id, stats in self.server.history_stats().items()
+        )
+        
+        return (f"👥 Clients connectés: {num_clients} | 📝 Utilisateurs enregistrés: {num_users} | "
+                f"🚪 Rooms: {num_rooms} | 💾 Fichiers stockés: {storage['blobs']} "
+                f"({storage['references']} partages) | 🗑️ Trames abandonnées: {total_dropped}\n"
+                f"📜 Historique: {history}\n"
+                f"🔐 KDF: {passwords['running']} en cours, {passwords['waiting']} en attente, "
+                f"{passwords['cache_hits']} vérifications en cache\n"
+                f"🎫 Sessions: {sessions['live']} actives, {sessions['expired']} expirées, "
+                f"{sessions['evicted']} évincées, {sessions['logged_out']} fermées (LOGOUT)\n"
+                f"💓 Heartbeat: {self.server.pings_sent} PING envoyés, "
+                f"{self.server.reaped_connections} connexions inactives fermées\n"
+                f"🚦 Limitation: {throttled}")
     
     def confirm_kick(self, address, pseudo):
         """Afficher une boîte de dialogue de confirmation pour kicker un client"""
@@ -1237,13 +2454,18 @@ class AdminDashboard:
                 if room and room in self.server.rooms:
                     room_name = self.server.rooms[room]["name"]
                 
+                # Profondeur de la file sortante et trames perdues
+                outbound = client_socket.outbound.stats()
+                queue_str = f"{outbound['depth']} (max {outbound['max_depth']}) | {outbound['dropped']} perdues"
+                
                 clients_data.append({
                     "ip": address[0],
                     "port": str(address[1]),
                     "address": address,  # Garder l'adresse complète pour le kick
                     "pseudo": pseudo,
                     "room": room_name,
-                    "last_msg": last_msg_str
+                    "last_msg": last_msg_str,
+                    "queue": queue_str
                 })
         
         # Mettre à jour le tableau
@@ -1274,6 +2496,7 @@ class AdminDashboard:
                         ft.DataCell(ft.Text(client["pseudo"], color="#4DD0E1")),
                         ft.DataCell(ft.Text(client["room"], color="#FFD54F")),
                         ft.DataCell(ft.Text(client["last_msg"], color="#66BB6A")),
+                        ft.DataCell(ft.Text(client["queue"], color="#FF9800")),
                         ft.DataCell(kick_button),
                     ]
                 )
@@ -1317,7 +2540,14 @@ if __name__ == "__main__":
     ╚═══════════════════════════════════════╝
     """)
     
-    server = FileShareServer()
+    # python server.py --async : boucle asyncio au lieu d'un thread par client
+    mode = "async" if "--async" in sys.argv else "threaded"
+    # python server.py --db server.db : utilisateurs, sessions et fichiers persistants
+    metadata_db = sys.argv[sys.argv.index("--db") + 1] if "--db" in sys.argv[:-1] else None
+    # python server.py --chat-logs /var/lib/chat : dossier du journal de chat ("none" = désactivé)
+    chat_log_dir = sys.argv[sys.argv.index("--chat-logs") + 1] if "--chat-logs" in sys.argv[:-1] else "chat_logs"
+    server = FileShareServer(mode=mode, metadata_db=metadata_db,
+                             chat_log_dir=None if chat_log_dir == "none" else chat_log_dir)
     
     # Lancer le serveur dans un thread séparé
     server_thread = threading.Thread(target=server.start, daemon=True)
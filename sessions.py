@@ -0,0 +1,200 @@
+"""
+Sessions (token → pseudo) avec expiration
+
+Une session expire après idle_ttl secondes sans être utilisée ni liée à
+une connexion, et dans tous les cas absolute_ttl secondes après le LOGIN.
+Tant qu'une connexion est liée au token, la session ne peut pas expirer
+par inactivité ; le délai repart quand la dernière connexion se ferme.
+
+Chaque session a un seul minuteur dans la roue (timingwheel.TimingWheel) :
+à son échéance, la session est expirée ou le minuteur reprogrammé. Une
+utilisation ne touche pas la roue (elle met juste à jour last_used).
+Au-delà de max_per_user sessions pour un même pseudo, la plus ancienne sans
+connexion est évincée.
+"""
+
+import threading
+import time
+
+
+class Session:
+    __slots__ = ("token", "username", "created", "last_used", "connections", "timer")
+
+    def __init__(self, token, username, created, now):
+        self.token = token
+        self.username = username
+        self.created = created  # Heure murale (persistée avec la session)
+        self.last_used = now
+        self.connections = set()
+        self.timer = None
+
+
+class SessionStore:
+    """{token: pseudo} avec expiration par inactivité et durée de vie maximale
+
+    load(token) -> (pseudo, created) ou None, save(token, pseudo, created) et
+    delete(token) relient le store à une base (optionnelle).
+    """
+
+    def __init__(self, wheel, idle_ttl=30 * 60, absolute_ttl=7 * 24 * 3600, max_per_user=20,
+                 load=None, save=None, delete=None, clock=time.time):
+        self.wheel = wheel
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_per_user = max_per_user
+        self._load = load
+        self._save = save
+        self._delete = delete
+        self.clock = clock
+        self.sessions = {}  # {token: Session}
+        self.by_user = {}  # {pseudo: {token: None}} (ordre de création)
+        self.lock = threading.RLock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.logged_out = 0
+
+    # --- Interface dict utilisée par les handlers ---
+
+    def __contains__(self, token):
+        return self._session(token) is not None
+
+    def __getitem__(self, token):
+        session = self._session(token)
+        if session is None:
+            raise KeyError(token)
+        session.last_used = self.clock()
+        return session.username
+
+    def get(self, token, default=None):
+        try:
+            return self[token]
+        except KeyError:
+            return default
+
+    def __setitem__(self, token, username):
+        now = self.clock()
+        with self.lock:
+            self._insert(Session(token, username, now, now))
+            self.created += 1
+            self._evict_extra(username)
+        if self._save:
+            self._save(token, username, now)
+
+    def __delitem__(self, token):
+        """LOGOUT"""
+        with self.lock:
+            if self._session(token) is None:
+                raise KeyError(token)
+            self._remove(token)
+            self.logged_out += 1
+
+    def __len__(self):
+        return len(self.sessions)
+
+    # --- Connexions liées ---
+
+    def bind(self, token, connection):
+        with self.lock:
+            session = self._session(token)
+            if session is not None:
+                session.connections.add(connection)
+
+    def unbind(self, token, connection):
+        """Connexion fermée: le délai d'inactivité repart de maintenant"""
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is not None and connection in session.connections:
+                session.connections.discard(connection)
+                session.last_used = self.clock()
+
+    # --- Interne ---
+
+    def _session(self, token):
+        """Session valide du token (chargée depuis la base si besoin), ou None"""
+        if not isinstance(token, str):
+            return None
+        session = self.sessions.get(token)
+        if session is None and self._load:
+            stored = self._load(token)
+            if stored is not None:
+                username, created = stored
+                with self.lock:
+                    session = self.sessions.get(token)
+                    if session is None:
+                        session = Session(token, username, created or self.clock(), self.clock())
+                        self._insert(session)
+        if session is None:
+            return None
+        if self._deadline(session) <= self.clock():
+            # Échue entre deux ticks de la roue
+            self._expire(token)
+            return None
+        return session
+
+    def _deadline(self, session):
+        """Prochaine échéance (l'inactivité ne compte pas tant qu'une connexion est liée)"""
+        deadline = session.created + self.absolute_ttl
+        if not session.connections:
+            deadline = min(deadline, session.last_used + self.idle_ttl)
+        return deadline
+
+    def _insert(self, session):
+        """Ajouter une session et programmer son minuteur (lock tenu)"""
+        self.sessions[session.token] = session
+        self.by_user.setdefault(session.username, {})[session.token] = None
+        self._schedule(session)
+
+    def _schedule(self, session):
+        # Liée à une connexion: revérifier au plus tard dans idle_ttl
+        check = min(self._deadline(session), self.clock() + self.idle_ttl)
+        session.timer = self.wheel.schedule(max(0, check - self.clock()), self._check, session.token)
+
+    def _check(self, token):
+        """Échéance du minuteur: expirer la session ou la reprogrammer"""
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return
+            if self._deadline(session) <= self.clock():
+                self._expire(token)
+            else:
+                self._schedule(session)
+
+    def _expire(self, token):
+        with self.lock:
+            if token in self.sessions:
+                self._remove(token)
+                self.expired += 1
+
+    def _evict_extra(self, username):
+        """Évincer les plus anciennes sessions sans connexion au-delà de max_per_user (lock tenu)"""
+        tokens = self.by_user.get(username, {})
+        for token in list(tokens):
+            if len(tokens) <= self.max_per_user:
+                return
+            if not self.sessions[token].connections:
+                self._remove(token)
+                self.evicted += 1
+
+    def _remove(self, token):
+        """Retirer une session, son minuteur et sa ligne en base (lock tenu)"""
+        session = self.sessions.pop(token)
+        if session.timer is not None:
+            self.wheel.cancel(session.timer)
+        tokens = self.by_user[session.username]
+        del tokens[token]
+        if not tokens:
+            del self.by_user[session.username]
+        if self._delete:
+            self._delete(token)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "live": len(self.sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "logged_out": self.logged_out
+            }
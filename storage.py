@@ -0,0 +1,209 @@
+"""
+Stockage des fichiers partagés, adressé par contenu
+
+Chaque contenu est stocké une seule fois sous uploads/.blobs/<ab>/<sha256>.
+Les entrées des rooms ne sont que des références vers ces blobs : le même
+fichier partagé dans plusieurs rooms (ou ré-uploadé) n'occupe qu'une place
+disque et le blob est supprimé quand sa dernière référence disparaît.
+
+Sans base de données, les entrées des rooms sont journalisées à côté des
+blobs (RoomReferences) pour survivre à un redémarrage.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+
+def is_valid_hash(value):
+    """Vrai si value est un SHA-256 hexadécimal (minuscules)"""
+    return (isinstance(value, str) and len(value) == 64
+            and all(c in "0123456789abcdef" for c in value))
+
+
+def hash_file(path, buffer, digest=None, length=None):
+    """SHA-256 des length premiers octets d'un fichier (tout le fichier par défaut)
+
+    Le fichier est lu dans buffer (réutilisé) ; digest permet de continuer un
+    hash existant. Retourne l'objet hash.
+    """
+    digest = digest or hashlib.sha256()
+    view = memoryview(buffer)
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            n = f.readinto(view[:min(len(view), remaining)])
+            if not n:
+                break
+            digest.update(view[:n])
+            remaining -= n
+    return digest
+
+
+class BlobStore:
+    """Blobs nommés par leur SHA-256, avec compteur de références"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.refs = {}  # {hash: nombre d'entrées de room qui pointent vers le blob}
+        self.pending = {}  # {hash: threading.Event} contenus en cours d'upload
+        self.lock = threading.Lock()
+
+    def path(self, blob_hash):
+        return os.path.join(self.root, blob_hash[:2], blob_hash)
+
+    def exists(self, blob_hash, size):
+        """Vrai si le contenu est déjà stocké (même hash et même taille)"""
+        try:
+            return os.path.getsize(self.path(blob_hash)) == size
+        except OSError:
+            return False
+
+    def link(self, blob_hash, size):
+        """Ajouter une référence vers un blob existant (retourne son chemin ou None)"""
+        with self.lock:
+            if not self.exists(blob_hash, size):
+                return None
+            self.refs[blob_hash] = self.refs.get(blob_hash, 0) + 1
+            return self.path(blob_hash)
+
+    def store(self, source_path, blob_hash):
+        """Déplacer un fichier complet dans le store et y ajouter une référence
+
+        Si le contenu est déjà présent, source_path est simplement supprimé.
+        """
+        path = self.path(blob_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            if os.path.exists(path):
+                os.remove(source_path)
+            else:
+                os.replace(source_path, path)
+            self.refs[blob_hash] = self.refs.get(blob_hash, 0) + 1
+        return path
+
+    def release(self, blob_hash):
+        """Retirer une référence ; supprime le blob à la dernière (retourne True si supprimé)"""
+        with self.lock:
+            count = self.refs.get(blob_hash, 0) - 1
+            if count > 0:
+                self.refs[blob_hash] = count
+                return False
+
+            self.refs.pop(blob_hash, None)
+            try:
+                os.remove(self.path(blob_hash))
+            except OSError:
+                pass
+            return True
+
+    def claim(self, blob_hash):
+        """Réserver l'upload d'un contenu
+
+        Retourne None si l'appelant doit l'envoyer, sinon un Event signalé
+        quand l'upload identique déjà en cours se termine (réussi ou non).
+        """
+        with self.lock:
+            event = self.pending.get(blob_hash)
+            if event is not None:
+                return event
+            self.pending[blob_hash] = threading.Event()
+            return None
+
+    def release_claim(self, blob_hash):
+        with self.lock:
+            event = self.pending.pop(blob_hash, None)
+        if event is not None:
+            event.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "blobs": len(self.refs),
+                "references": sum(self.refs.values())
+            }
+
+
+class RoomReferences:
+    """Entrées des rooms vers les blobs, persistées sans base de données
+
+    Un journal par room (<root>/<room_id>.jsonl): une ligne par ajout ou
+    suppression, compacté à la relecture. Mêmes méthodes que les fichiers de
+    metadata.MetadataStore (load_room_files, add_file, delete_file,
+    blob_references).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.files = {}  # {file_id: (room_id, hash)}
+        for name in os.listdir(self.root):
+            if name.endswith(".jsonl"):
+                room_id = name[:-len(".jsonl")]
+                # Compacté d'abord: une ligne tronquée ne doit pas précéder les ajouts suivants
+                for file_metadata in self.load_room_files(room_id):
+                    self.files[file_metadata["file_id"]] = (room_id, file_metadata.get("hash"))
+
+    def journal_path(self, room_id):
+        return os.path.join(self.root, f"{room_id}.jsonl")
+
+    def replay(self, room_id):
+        """(entrées de la room dans l'ordre de partage, nombre de lignes du journal)"""
+        files = {}
+        lines = 0
+        try:
+            with open(self.journal_path(room_id), encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par un arrêt brutal
+                        continue
+                    if "add" in record:
+                        files[record["add"]["file_id"]] = record["add"]
+                    else:
+                        files.pop(record.get("delete"), None)
+        except OSError:
+            pass
+        return list(files.values()), lines
+
+    def append(self, room_id, record):
+        with open(self.journal_path(room_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add_file(self, room_id, file_metadata):
+        with self.lock:
+            self.append(room_id, {"add": file_metadata})
+            self.files[file_metadata["file_id"]] = (room_id, file_metadata.get("hash"))
+
+    def delete_file(self, file_id):
+        with self.lock:
+            room_id, _ = self.files.pop(file_id, (None, None))
+            if room_id is not None:
+                self.append(room_id, {"delete": file_id})
+
+    def load_room_files(self, room_id):
+        """Fichiers d'une room, dans l'ordre de partage"""
+        with self.lock:
+            files, lines = self.replay(room_id)
+            if lines > len(files):
+                # Réécriture atomique sans les suppressions
+                tmp_path = self.journal_path(room_id) + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for file_metadata in files:
+                        f.write(json.dumps({"add": file_metadata}, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.journal_path(room_id))
+            return files
+
+    def blob_references(self):
+        """Nombre d'entrées de room par hash (compteurs du store de blobs)"""
+        with self.lock:
+            references = {}
+            for _, blob_hash in self.files.values():
+                if blob_hash is not None:
+                    references[blob_hash] = references.get(blob_hash, 0) + 1
+            return references
@@ -0,0 +1,122 @@
+"""
+Tests de régression de la base des métadonnées (metadata.MetadataStore)
+
+Le lot en cours est bloqué en tenant write_lock: les écritures restent en attente.
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from metadata import MetadataStore
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition non atteinte")
+        time.sleep(0.01)
+
+
+def entry(file_id, blob_hash="11" * 32):
+    return {"file_id": file_id, "filename": f"{file_id}.bin", "uploader": "alice", "size": 1,
+            "path": f"uploads/.blobs/{file_id}", "hash": blob_hash, "upload_date": "2026-01-01T00:00:00"}
+
+
+def committed_users(path):
+    with sqlite3.connect(path) as db:
+        return [row[0] for row in db.execute("SELECT username FROM users ORDER BY username")]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetadataStore(str(tmp_path / "server.db"))
+    yield store
+    store.close()
+
+
+def test_pending_writes_are_visible_before_commit(store):
+    store.add_file("general", entry("a"))
+    store.flush()
+
+    with store.write_lock:
+        store.save_user("alice", {"password": "hash", "user_id": "1"})
+        store.save_session("token", "alice", 1000.0)
+        store.add_file("general", entry("b"))
+        store.delete_file("a")
+
+        assert store.load_user("alice")["user_id"] == "1"
+        assert store.load_session("token") == ("alice", 1000.0)
+        assert [f["file_id"] for f in store.load_room_files("general")] == ["b"]
+        assert store.count_users() == 1
+        assert committed_users(store.path) == []
+
+    wait_for(lambda: committed_users(store.path) == ["alice"])
+    assert [f["file_id"] for f in store.load_room_files("general")] == ["b"]
+
+
+def test_everything_reloaded_after_restart(tmp_path):
+    path = str(tmp_path / "server.db")
+    store = MetadataStore(path)
+    store.save_user("alice", {"password": "hash", "email": None, "user_id": "1"})
+    store.save_session("token", "alice", 1000.0)
+    for file_id in "abc":
+        store.add_file("general", entry(file_id))
+    store.add_file("projets", entry("d", "22" * 32))
+    store.delete_file("b")
+    store.close()
+
+    store = MetadataStore(path)
+    try:
+        assert store.load_user("alice") == {"password": "hash", "email": None, "user_id": "1"}
+        assert store.load_session("token") == ("alice", 1000.0)
+        assert store.count_users() == 1
+        assert [f["file_id"] for f in store.load_room_files("general")] == ["a", "c"]
+        assert store.load_room_files("projets") == [entry("d", "22" * 32)]
+        assert store.blob_references() == {"11" * 32: 2, "22" * 32: 1}
+    finally:
+        store.close()
+
+
+def test_blob_references_count_entries_per_hash(store):
+    store.add_file("general", entry("a"))
+    store.add_file("projets", entry("b"))
+    store.add_file("general", entry("c", None))
+    store.flush()
+
+    assert store.blob_references() == {"11" * 32: 2}
+    store.delete_file("a")
+    store.flush()
+    assert store.blob_references() == {"11" * 32: 1}
+
+
+def test_refused_write_is_dropped_and_writer_keeps_running(store):
+    store.RETRY_INTERVAL = 0.01
+    store._queue("INSERT INTO missing_table VALUES (?)", (1,))
+    store.save_user("alice", {"password": "hash", "user_id": "1"})
+
+    wait_for(lambda: committed_users(store.path) == ["alice"])
+    assert store.dropped_writes == 1
+    assert store.writer_thread.is_alive()
+
+    store.save_user("bob", {"password": "hash", "user_id": "2"})
+    wait_for(lambda: committed_users(store.path) == ["alice", "bob"])
+
+
+def test_locked_database_delays_the_batch(store):
+    store.RETRY_INTERVAL = 0.01
+    store.MAX_FLUSH_RETRIES = 1000
+    store.write_db.execute("PRAGMA busy_timeout = 10")
+    locker = sqlite3.connect(store.path, isolation_level=None)
+    locker.execute("BEGIN IMMEDIATE")
+
+    store.save_user("alice", {"password": "hash", "user_id": "1"})
+    wait_for(lambda: store.failed_flushes >= 1)
+    assert store.load_user("alice")["user_id"] == "1"
+
+    locker.execute("ROLLBACK")
+    locker.close()
+    wait_for(lambda: committed_users(store.path) == ["alice"])
+    assert store.dropped_writes == 0
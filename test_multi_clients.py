@@ -4,10 +4,10 @@ Lance plusieurs clients en parallèle pour tester la connexion simultanée
 """
 
 import socket
-import json
 import threading
 import time
-from datetime import datetime
+
+from protocol import FrameReader, decode_body, encode_frame, make_message
 
 
 class TestClient:
@@ -16,6 +16,7 @@ class TestClient:
         self.host = host
         self.port = port
         self.socket = None
+        self.reader = None
         self.pseudo = f"TestUser{client_id}"
         self.session_token = None
         
@@ -24,6 +25,7 @@ class TestClient:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
+            self.reader = FrameReader(self.socket)
             print(f"[Client {self.client_id}] ✅ Connecté au serveur")
             return True
         except Exception as e:
@@ -31,30 +33,19 @@ class TestClient:
             return False
     
     def send_message(self, message_type, payload):
-        """Envoyer un message"""
-        message = {
-            "type": message_type,
-            "payload": payload,
-            "timestamp": datetime.now().isoformat()
-        }
+        """Envoyer un message (trame: taille sur 4 octets + JSON)"""
         try:
-            message_json = json.dumps(message) + "\n"
-            self.socket.sendall(message_json.encode('utf-8'))
+            self.socket.sendall(encode_frame(make_message(message_type, payload)))
         except Exception as e:
             print(f"[Client {self.client_id}] ❌ Erreur d'envoi: {e}")
     
     def receive_message(self):
         """Recevoir un message"""
         try:
-            buffer = ""
-            while True:
-                chunk = self.socket.recv(1024).decode('utf-8')
-                if not chunk:
-                    return None
-                buffer += chunk
-                if "\n" in buffer:
-                    message_str, buffer = buffer.split("\n", 1)
-                    return json.loads(message_str)
+            message_bytes = self.reader.read_frame()
+            if message_bytes is None:
+                return None
+            return decode_body(message_bytes)
         except Exception as e:
             print(f"[Client {self.client_id}] ❌ Erreur de réception: {e}")
             return None
@@ -119,8 +110,11 @@ class TestClient:
     def ping(self):
         """Envoyer un ping au serveur"""
         self.send_message("PING", {})
+        # Les messages de la room reçus entre-temps sont ignorés
         response = self.receive_message()
-        if response and response["type"] == "PONG":
+        while response and response["type"] != "PONG":
+            response = self.receive_message()
+        if response:
             print(f"[Client {self.client_id}] 🏓 PONG reçu")
             return True
         return False
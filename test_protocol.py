@@ -0,0 +1,101 @@
+"""
+Tests de régression du découpage des trames (protocol.FrameReader)
+
+python -m pytest test_protocol.py
+"""
+
+import pytest
+
+from protocol import FRAME_HEADER, FrameReader, FrameTooLargeError, decode_body, encode_frame, make_message
+
+
+class ChunkedSocket:
+    """Faux socket: chaque recv rend le morceau suivant (b"" une fois vide)"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.calls = 0
+
+    def recv(self, bufsize):
+        self.calls += 1
+        if not self.chunks:
+            return b""
+        chunk = self.chunks.pop(0)
+        if len(chunk) > bufsize:
+            self.chunks.insert(0, chunk[bufsize:])
+            chunk = chunk[:bufsize]
+        return chunk
+
+
+def frame(message_type, **payload):
+    return encode_frame(make_message(message_type, payload))
+
+
+def test_frame_split_in_single_bytes():
+    data = frame("SEND_MESSAGE", message="bonjour")
+    reader = FrameReader(ChunkedSocket(data[i:i + 1] for i in range(len(data))))
+
+    message = decode_body(reader.read_frame())
+
+    assert message["type"] == "SEND_MESSAGE"
+    assert message["payload"]["message"] == "bonjour"
+    assert reader.read_frame() is None
+
+
+def test_header_split_across_recv():
+    data = frame("PING") + frame("PONG")
+    # Coupure au milieu de l'en-tête de la deuxième trame
+    cut = len(frame("PING")) + 2
+    reader = FrameReader(ChunkedSocket([data[:cut], data[cut:]]))
+
+    assert decode_body(reader.read_frame())["type"] == "PING"
+    assert decode_body(reader.read_frame())["type"] == "PONG"
+    assert reader.read_frame() is None
+
+
+def test_many_frames_in_one_recv():
+    data = b"".join(frame("SEND_MESSAGE", message=str(i)) for i in range(50))
+    sock = ChunkedSocket([data])
+    reader = FrameReader(sock)
+
+    messages = [decode_body(reader.read_frame())["payload"]["message"] for _ in range(50)]
+
+    assert messages == [str(i) for i in range(50)]
+    assert sock.calls == 1
+    assert not reader.buffer
+
+
+def test_bytes_after_frame_are_served_to_recv():
+    # Un flux binaire (upload) peut suivre la trame dans le même recv
+    data = frame("UPLOAD_FILE", size=4) + b"\x00\x01\x02\x03"
+    reader = FrameReader(ChunkedSocket([data]))
+
+    assert decode_body(reader.read_frame())["type"] == "UPLOAD_FILE"
+    assert reader.recv(2) == b"\x00\x01"
+    view = bytearray(4)
+    assert reader.recv_into(view) == 2
+    assert view[:2] == b"\x02\x03"
+
+
+def test_oversize_frame_is_rejected_from_header():
+    sock = ChunkedSocket([FRAME_HEADER.pack(1025)])
+    reader = FrameReader(sock, max_frame_size=1024)
+
+    with pytest.raises(FrameTooLargeError):
+        reader.read_frame()
+    # Refusée dès l'en-tête, sans attendre (ni allouer) le corps
+    assert sock.calls == 1
+
+
+def test_frame_at_max_size_is_accepted():
+    body = b"x" * 1024
+    reader = FrameReader(ChunkedSocket([FRAME_HEADER.pack(len(body)) + body]), max_frame_size=1024)
+
+    assert reader.read_frame() == body
+
+
+def test_connection_closed_mid_frame():
+    data = frame("SEND_MESSAGE", message="coupé")
+    reader = FrameReader(ChunkedSocket([data[:-3]]))
+
+    assert reader.read_frame() is None
@@ -0,0 +1,105 @@
+"""
+Tests de régression de la limitation de débit (ratelimit.RateLimiter)
+"""
+
+import pytest
+
+from ratelimit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(limits, **options):
+    clock = FakeClock()
+    return RateLimiter(limits, clock=clock, **options), clock
+
+
+def test_burst_up_to_capacity_then_refused():
+    limiter, clock = make_limiter({"chat": {"connection": (2, 5)}})
+
+    for _ in range(5):
+        assert limiter.acquire("chat", connection="a") == 0
+    # Plus de jeton: un jeton revient en 1 / rate secondes
+    assert limiter.acquire("chat", connection="a") == pytest.approx(0.5)
+    assert limiter.stats()["chat"] == {"allowed": 5, "limited": {"connection": 1}}
+
+
+def test_refill_at_rate_without_exceeding_capacity():
+    limiter, clock = make_limiter({"chat": {"connection": (2, 5)}})
+    for _ in range(5):
+        limiter.acquire("chat", connection="a")
+
+    clock.now += 1
+    assert limiter.acquire("chat", connection="a") == 0
+    assert limiter.acquire("chat", connection="a") == 0
+    assert limiter.acquire("chat", connection="a") > 0
+
+    # Longue inactivité: le seau est plein, pas plus
+    clock.now += 3600
+    allowed = 0
+    while limiter.acquire("chat", connection="a") == 0:
+        allowed += 1
+    assert allowed == 5
+
+
+def test_refusal_consumes_no_token():
+    limiter, clock = make_limiter({"chat": {"connection": (1, 1), "room": (1, 10)}})
+    assert limiter.acquire("chat", connection="a", room="general") == 0
+
+    # Refusé par la connexion: le seau de la room n'est pas entamé
+    for _ in range(20):
+        assert limiter.acquire("chat", connection="a", room="general") > 0
+    bucket = limiter.buckets[("chat", "room")]["general"]
+    assert bucket.tokens == 9
+
+
+def test_most_restrictive_scope_decides():
+    limiter, clock = make_limiter({"chat": {"connection": (10, 10), "user": (1, 2)}})
+
+    assert limiter.acquire("chat", connection="a", user="alice") == 0
+    assert limiter.acquire("chat", connection="b", user="alice") == 0
+    # Nouvelle connexion, même pseudo: le seau du pseudo est vide
+    assert limiter.acquire("chat", connection="c", user="alice") == pytest.approx(1.0)
+    assert limiter.stats()["chat"]["limited"] == {"connection": 0, "user": 1}
+
+
+def test_scopes_are_independent_per_key():
+    limiter, clock = make_limiter({"chat": {"connection": (1, 1)}})
+
+    assert limiter.acquire("chat", connection="a") == 0
+    assert limiter.acquire("chat", connection="a") > 0
+    assert limiter.acquire("chat", connection="b") == 0
+
+
+def test_unlimited_kind_is_always_allowed():
+    limiter, clock = make_limiter({"chat": {"connection": (1, 1)}})
+
+    for _ in range(100):
+        assert limiter.acquire("p2p", connection="a") == 0
+
+
+def test_forget_frees_connection_buckets_only():
+    limiter, clock = make_limiter({"chat": {"connection": (1, 1), "user": (1, 1)}})
+    limiter.acquire("chat", connection="a", user="alice")
+
+    limiter.forget("a")
+
+    assert limiter.buckets[("chat", "connection")] == {}
+    assert "alice" in limiter.buckets[("chat", "user")]
+
+
+def test_full_buckets_pruned_beyond_max_buckets():
+    limiter, clock = make_limiter({"chat": {"user": (1, 1)}}, max_buckets=10)
+    for i in range(10):
+        limiter.acquire("chat", user=f"u{i}")
+
+    # Tous pleins de nouveau: libérés à l'ajout suivant
+    clock.now += 5
+    limiter.acquire("chat", user="new")
+    assert list(limiter.buckets[("chat", "user")]) == ["new"]
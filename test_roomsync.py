@@ -0,0 +1,217 @@
+"""
+Tests de régression de la synchronisation des rooms: séquences d'événements
+(roomsync.RoomEvents) et index des fichiers (roomindex)
+"""
+
+import base64
+import json
+import random
+
+import pytest
+
+from roomindex import (SORT_KEYS, InvalidCursorError, RoomFileIndex, RoomFiles, decode_cursor,
+                       disk_file_id, encode_cursor)
+from roomsync import RoomEvents
+
+
+def record(events, count):
+    with events.lock:
+        return [events.record("MESSAGE", {"message": str(i)}) for i in range(count)]
+
+
+def test_record_numbers_events_from_one():
+    events = RoomEvents()
+    payloads = record(events, 3)
+
+    assert [payload["seq"] for payload in payloads] == [1, 2, 3]
+    assert events.seq == 3
+
+
+def test_since_returns_missed_events_in_order():
+    events = RoomEvents()
+    record(events, 5)
+
+    missed = events.since(2)
+
+    assert [event["payload"]["seq"] for event in missed] == [3, 4, 5]
+    assert all(event["type"] == "MESSAGE" for event in missed)
+
+
+def test_since_up_to_date_is_empty_not_a_gap():
+    events = RoomEvents()
+    record(events, 5)
+
+    assert events.since(5) == []
+    assert RoomEvents().since(0) == []
+
+
+def test_since_oldest_kept_event():
+    events = RoomEvents(max_events=3)
+    record(events, 10)
+
+    # L'anneau garde 8, 9, 10: reprendre après 7 est encore possible
+    assert [event["payload"]["seq"] for event in events.since(7)] == [8, 9, 10]
+
+
+def test_cursor_out_of_ring_is_a_gap():
+    events = RoomEvents(max_events=3)
+    record(events, 10)
+
+    assert events.since(6) is None
+    assert events.since(0) is None
+
+
+def test_cursor_ahead_of_room_is_a_gap():
+    # Curseur d'une séquence plus longue (autre démarrage du serveur)
+    events = RoomEvents()
+    record(events, 2)
+
+    assert events.since(3) is None
+
+
+def test_disk_file_ids_do_not_collide():
+    # Collision des 8 premiers caractères du SHA-1
+    assert disk_file_id("file_42555.bin")[:8] == disk_file_id("file_141372.bin")[:8]
+    assert disk_file_id("file_42555.bin") != disk_file_id("file_141372.bin")
+
+
+def test_manifest_of_older_version_is_rebuilt(tmp_path):
+    room_dir = tmp_path / "general"
+    room_dir.mkdir()
+    (room_dir / "a.txt").write_bytes(b"a")
+    index = RoomFileIndex(str(tmp_path), {"general"})
+    manifest_path = index.manifest_path("general")
+    files = index.scan("general")
+
+    # Manifeste écrit avant les identifiants complets: même mtime, pas de version
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    del manifest["version"]
+    manifest["files"][0]["file_id"] = files[0]["file_id"][:8]
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    assert index.scan("general")[0]["file_id"] == disk_file_id("a.txt")
+    assert index.scans == 2
+
+
+def make_files(count=60, seed=7):
+    """Fichiers aux noms, tailles, auteurs et dates en partie identiques"""
+    rng = random.Random(seed)
+    return [{
+        "file_id": f"id{i:03d}",
+        "filename": rng.choice(["a.txt", "ab.txt", "b.bin", "notes.md", "rapport.pdf", "é.txt"]),
+        "uploader": rng.choice(["alice", "bob", "carol"]),
+        "size": rng.choice([0, 10, 10, 500, 4096, 70_000]),
+        "upload_date": f"2026-01-{rng.randint(1, 9):02d}T00:00:00",
+        "path": f"uploads/general/{i}",
+        "hash": None
+    } for i in range(count)]
+
+
+FILTERS = [
+    {},
+    {"uploader": "bob"},
+    {"min_size": 10},
+    {"max_size": 500},
+    {"min_size": 10, "max_size": 4096},
+    {"prefix": "a"},
+    {"prefix": "zz"},
+    {"uploader": "alice", "prefix": "a", "min_size": 10},
+]
+
+
+def matches(f, uploader=None, min_size=None, max_size=None, prefix=None):
+    return ((uploader is None or f["uploader"] == uploader)
+            and (min_size is None or f["size"] >= min_size)
+            and (max_size is None or f["size"] <= max_size)
+            and (not prefix or f["filename"].startswith(prefix)))
+
+
+def read_pages(files, sort, descending, limit, **filters):
+    """Toutes les pages, le curseur faisant l'aller-retour comme dans LIST_ROOM_FILES"""
+    result = []
+    cursor = None
+    for _ in range(len(files) + 2):
+        after = decode_cursor(cursor, sort, descending) if cursor else None
+        page, last_key = files.page(sort, descending, after, limit, **filters)
+        assert len(page) <= limit
+        result += page
+        if last_key is None:
+            return result
+        cursor = encode_cursor(sort, descending, last_key)
+    raise AssertionError("La pagination ne se termine pas")
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_KEYS))
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("limit", [1, 7, 1000])
+def test_pages_match_sorted_filtered_reference(sort, descending, filters, limit):
+    entries = make_files()
+    files = RoomFiles(entries)
+    expected = sorted((f for f in entries if matches(f, **filters)), key=SORT_KEYS[sort], reverse=descending)
+
+    assert read_pages(files, sort, descending, limit, **filters) == expected
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_KEYS))
+def test_whole_list_without_limit(sort):
+    entries = make_files()
+    page, last_key = RoomFiles(entries).page(sort)
+
+    assert page == sorted(entries, key=SORT_KEYS[sort])
+    assert last_key is None
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_KEYS))
+@pytest.mark.parametrize("descending", [False, True])
+def test_changes_between_pages_keep_the_cursor_position(sort, descending):
+    entries = make_files()
+    files = RoomFiles(entries[:40])
+    first, last_key = files.page(sort, descending, limit=10)
+
+    # Entre deux pages: des fichiers partagés, d'autres supprimés
+    for f in entries[40:]:
+        files.append(f)
+    removed = entries[:40:3]
+    for f in removed:
+        files.remove(f)
+
+    after = decode_cursor(encode_cursor(sort, descending, last_key), sort, descending)
+    page, _ = files.page(sort, descending, after)
+    expected = [f for f in sorted(files, key=SORT_KEYS[sort], reverse=descending)
+                if (SORT_KEYS[sort](f) < last_key if descending else SORT_KEYS[sort](f) > last_key)]
+    assert page == expected
+    assert not {f["file_id"] for f in page} & {f["file_id"] for f in first}
+
+
+def test_sorted_keys_follow_appends_and_removals():
+    entries = make_files()
+    files = RoomFiles(entries[:30])
+    files.page("size")
+    for f in entries[30:]:
+        files.append(f)
+    files.remove(entries[0])
+
+    page, _ = files.page("size")
+    assert page == sorted(entries[1:], key=SORT_KEYS["size"])
+
+
+@pytest.mark.parametrize("cursor", [
+    "pas un curseur!",
+    "é",
+    base64.urlsafe_b64encode(b"{not json").decode("ascii"),
+    base64.urlsafe_b64encode(json.dumps(["date", False, 5]).encode()).decode("ascii"),
+    encode_cursor("name", False, ("a.txt", "id001")),
+    encode_cursor("date", True, ("2026-01-01T00:00:00", "id001")),
+    None,
+])
+def test_invalid_cursor_is_refused(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, "date", False)
+
+
+def test_cursor_round_trip():
+    key = ("bob", "2026-01-01T00:00:00", "id001")
+    assert decode_cursor(encode_cursor("uploader", True, key), "uploader", True) == key
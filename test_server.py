@@ -0,0 +1,620 @@
+"""
+Tests de régression de bout en bout: un serveur par test, dans chaque mode
+
+Le serveur écoute sur un port libre et travaille dans un dossier temporaire.
+server.py importe le dashboard: ces tests demandent flet.
+"""
+
+import asyncio
+import hashlib
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import pytest
+
+pytest.importorskip("flet")
+
+from protocol import CHUNK_HEADER, FrameReader, decode_body, encode_frame, make_message, recv_exact
+from server import FileShareServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition non atteinte")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server_options():
+    """Options du serveur (un test les remplace par parametrize)"""
+    return {}
+
+
+@pytest.fixture(params=["threaded", "async"])
+def server(request, tmp_path, monkeypatch, server_options):
+    monkeypatch.chdir(tmp_path)
+    options = dict(chat_log_dir=None, kdf_workers=0, rate_limits=None)
+    options.update(server_options)
+    server = FileShareServer(host="127.0.0.1", port=free_port(), mode=request.param, **options)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    wait_for(lambda: server.running)
+    yield server
+    server.stop()
+    thread.join(5)
+
+
+class Connection:
+    """Client minimal: trames JSON et flux binaires bruts"""
+
+    def __init__(self, server):
+        self.sock = socket.create_connection(("127.0.0.1", server.port), timeout=10)
+        self.reader = FrameReader(self.sock)
+        self.token = None
+
+    def send(self, message_type, **payload):
+        if self.token:
+            payload.setdefault("session_token", self.token)
+        self.sock.sendall(encode_frame(make_message(message_type, payload)))
+
+    def receive(self, *types):
+        """Prochain message d'un des types (les diffusions intercalées sont ignorées)"""
+        while True:
+            body = self.reader.read_frame()
+            assert body is not None, "Connexion fermée par le serveur"
+            message = decode_body(body)
+            if not types or message["type"] in types:
+                return message
+
+    def request(self, message_type, *types, **payload):
+        self.send(message_type, **payload)
+        return self.receive(*types)
+
+    def login(self, username, room_id="general"):
+        self.request("REGISTER", "REGISTER_SUCCESS", "REGISTER_ERROR", username=username, password="test123")
+        self.token = self.request("LOGIN", "LOGIN_SUCCESS", username=username,
+                                  password="test123")["payload"]["session_token"]
+        if room_id:
+            return self.request("JOIN_ROOM", "JOIN_SUCCESS", room_id=room_id)["payload"]
+
+    def send_chunks(self, data, chunk_size=4096):
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            self.sock.sendall(CHUNK_HEADER.pack(len(chunk)) + chunk)
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def connect(server):
+    connections = []
+
+    def connect():
+        connection = Connection(server)
+        connections.append(connection)
+        return connection
+
+    yield connect
+    for connection in connections:
+        connection.close()
+
+
+def payload_data(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def upload(connection, filename, data):
+    ready = connection.request("UPLOAD_FILE", "UPLOAD_READY", filename=filename, size=len(data))["payload"]
+    connection.send_chunks(data[ready["offset"]:])
+    return connection.receive("UPLOAD_COMPLETE")["payload"]
+
+
+def test_interrupted_upload_resumes_at_server_offset(server, connect):
+    data = payload_data(100_000)
+    first = connect()
+    first.login("alice")
+    ready = first.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=len(data))["payload"]
+    assert ready["offset"] == 0
+
+    # Coupure après 40 000 octets: le fichier partiel est conservé
+    first.send_chunks(data[:40_000])
+    first.close()
+    upload_id = ready["upload_id"]
+    wait_for(lambda: upload_id not in server.active_uploads and not server.clients)
+
+    second = connect()
+    second.token = first.token
+    resumed = second.request("UPLOAD_RESUME", "UPLOAD_READY", "ERROR", upload_id=upload_id)
+    assert resumed["type"] == "UPLOAD_READY", resumed
+    assert resumed["payload"]["offset"] == 40_000
+
+    second.send_chunks(data[40_000:])
+    complete = second.receive("UPLOAD_COMPLETE")["payload"]
+    assert complete["upload_id"] == upload_id
+
+    # Le fichier reconstitué est identique à l'original
+    stored = next(f for f in server.files_by_room["general"] if f["file_id"] == upload_id)
+    with open(stored["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_resume_unknown_upload(server, connect):
+    connection = connect()
+    connection.login("alice")
+
+    error = connection.request("UPLOAD_RESUME", "ERROR", upload_id="inconnu")["payload"]
+    assert error["code"] == "UPLOAD_NOT_FOUND"
+
+
+def test_resume_of_another_users_upload_is_refused(server, connect):
+    owner = connect()
+    owner.login("alice")
+    ready = owner.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=10)["payload"]
+    owner.close()
+    wait_for(lambda: not server.active_uploads)
+
+    other = connect()
+    other.login("bob")
+    error = other.request("UPLOAD_RESUME", "ERROR", upload_id=ready["upload_id"])["payload"]
+    assert error["code"] == "UPLOAD_NOT_FOUND"
+
+
+def download(connection, file_id, mode="chunked", **byte_range):
+    """DOWNLOAD_FILE: (payload de DOWNLOAD_READY, octets reçus) ou (payload de ERROR, None)"""
+    response = connection.request("DOWNLOAD_FILE", "DOWNLOAD_READY", "ERROR",
+                                  file_id=file_id, mode=mode, **byte_range)
+    if response["type"] == "ERROR":
+        return response["payload"], None
+    ready = response["payload"]
+
+    def read_block():
+        size = CHUNK_HEADER.unpack(recv_exact(connection.reader, CHUNK_HEADER.size))[0]
+        return recv_exact(connection.reader, size)
+
+    # stream: un seul bloc (même vide) ; chunked: des blocs jusqu'à length octets
+    if mode == "stream":
+        return ready, read_block()
+    data = bytearray()
+    while len(data) < ready["length"]:
+        data += read_block()
+    return ready, bytes(data)
+
+
+@pytest.mark.parametrize("mode", ["chunked", "stream"])
+def test_broadcasts_wait_for_the_end_of_a_download(server, connect, mode):
+    data = os.urandom(8_000_000)
+    alice = connect()
+    alice.login("alice")
+    bob = connect()
+    bob.login("bob")
+    file_id = upload(alice, "big.bin", data)["upload_id"]
+
+    # alice ne lit pas encore: le serveur envoie le fichier pendant que bob parle
+    alice.request("DOWNLOAD_FILE", "DOWNLOAD_READY", file_id=file_id, mode=mode)
+    for i in range(5):
+        bob.request("SEND_MESSAGE", "MESSAGE", message=str(i))
+
+    received = bytearray()
+    while len(received) < len(data):
+        size = CHUNK_HEADER.unpack(recv_exact(alice.reader, CHUNK_HEADER.size))[0]
+        received += recv_exact(alice.reader, size)
+    assert received == data
+    assert [alice.receive("MESSAGE")["payload"]["message"] for _ in range(5)] == list("01234")
+
+
+@pytest.mark.parametrize("mode", ["chunked", "stream"])
+@pytest.mark.parametrize("offset, length, expected", [
+    (0, None, slice(0, 50_000)),
+    (10_000, 5_000, slice(10_000, 15_000)),
+    (49_990, None, slice(49_990, 50_000)),
+    (45_000, 20_000, slice(45_000, 50_000)),  # Tronquée à la fin du fichier
+    (50_000, None, slice(50_000, 50_000)),
+])
+def test_byte_range_download(server, connect, mode, offset, length, expected):
+    data = payload_data(50_000)
+    connection = connect()
+    connection.login("alice")
+    file_id = upload(connection, "f.bin", data)["upload_id"]
+
+    byte_range = {"offset": offset} if length is None else {"offset": offset, "length": length}
+    ready, received = download(connection, file_id, mode, **byte_range)
+
+    assert ready["size"] == len(data)
+    assert ready["offset"] == offset
+    assert ready["length"] == len(data[expected])
+    assert received == data[expected]
+
+    # La connexion reste utilisable après la plage
+    assert connection.request("PING", "PONG")["type"] == "PONG"
+
+
+@pytest.mark.parametrize("byte_range", [
+    {"offset": 50_001},
+    {"offset": -1},
+    {"offset": 0, "length": -5},
+    {"offset": "10"},
+])
+def test_invalid_byte_range(server, connect, byte_range):
+    connection = connect()
+    connection.login("alice")
+    file_id = upload(connection, "f.bin", payload_data(50_000))["upload_id"]
+
+    error, received = download(connection, file_id, **byte_range)
+
+    assert received is None
+    assert error["code"] == "INVALID_RANGE"
+    assert error["size"] == 50_000
+
+
+def send_messages(connection, *texts):
+    for text in texts:
+        connection.send("SEND_MESSAGE", message=text)
+    return [connection.receive("MESSAGE")["payload"]["seq"] for _ in texts]
+
+
+def test_resume_replays_missed_events(server, connect):
+    alice = connect()
+    alice.login("alice")
+    bob = connect()
+    joined = bob.login("bob")
+    send_messages(alice, "m0", "m1")
+    seen = bob.receive("MESSAGE")["payload"]["seq"]
+
+    # bob se déconnecte après le premier message et manque la suite
+    bob.close()
+    alice.receive("USER_LEFT")
+    send_messages(alice, "x0", "x1")
+
+    again = connect()
+    again.token = bob.token
+    again.send("RESUME", room_id="general", epoch=joined["epoch"], last_seq=seen)
+    assert again.receive("JOIN_SUCCESS")
+    resumed = again.receive("RESUMED")["payload"]
+
+    replayed = resumed["events"]
+    assert not resumed["gap"]
+    # Tout ce qui suit seen, sauf le dernier numéro: l'entrée de bob dans la room
+    assert [event["payload"]["seq"] for event in replayed] == list(range(seen + 1, resumed["last_seq"]))
+    messages = [event["payload"]["message"] for event in replayed if event["type"] == "MESSAGE"]
+    assert messages == ["m1", "x0", "x1"]
+
+    # Le direct reprend à la suite des événements rejoués
+    alice.send("SEND_MESSAGE", message="live")
+    assert again.receive("MESSAGE")["payload"]["seq"] > resumed["last_seq"]
+
+
+def test_resume_from_another_epoch_is_a_gap(server, connect):
+    connection = connect()
+    connection.login("alice")
+
+    resumed = connection.request("RESUME", "RESUMED", room_id="general",
+                                 epoch="autre", last_seq=1)["payload"]
+
+    assert resumed["gap"]
+    assert resumed["events"] == []
+    assert resumed["epoch"] == server.epoch
+
+
+def test_resume_beyond_event_ring_is_a_gap(server, connect):
+    alice = connect()
+    joined = alice.login("alice")
+    # Anneau réduit à 2 événements: le curseur d'alice en sort
+    server.room_events["general"].events = deque(maxlen=2)
+    send_messages(alice, "a", "b", "c", "d")
+
+    resumed = alice.request("RESUME", "RESUMED", room_id="general", epoch=joined["epoch"],
+                            last_seq=joined["last_seq"])["payload"]
+
+    assert resumed["gap"]
+    assert resumed["events"] == []
+
+
+@pytest.mark.parametrize("server_options", [{"heartbeat_interval": 1, "idle_timeout": 2}])
+def test_stalled_upload_is_reaped(server, connect):
+    connection = connect()
+    connection.login("alice")
+    ready = connection.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=10_000_000)["payload"]
+
+    # Le pair cesse d'envoyer sans fermer la connexion (lien coupé)
+    connection.send_chunks(payload_data(100_000))
+    connection.sock.settimeout(10)
+    with pytest.raises(AssertionError, match="Connexion fermée"):
+        while True:
+            connection.receive()
+
+    wait_for(lambda: ready["upload_id"] not in server.active_uploads)
+    assert server.reaped_connections == 1
+    assert "alice" not in server.connections_by_user
+
+
+@pytest.mark.parametrize("server_options", [{"heartbeat_interval": 1, "idle_timeout": 2}])
+def test_progressing_upload_is_not_reaped(server, connect):
+    data = payload_data(6_000_000)
+    connection = connect()
+    connection.login("alice")
+    connection.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=len(data))
+
+    # Plus lent que idle_timeout au total, mais chaque seconde transfère plus d'un Mo
+    for start in range(0, len(data), 1_500_000):
+        connection.send_chunks(data[start:start + 1_500_000], chunk_size=100_000)
+        time.sleep(0.8)
+
+    assert connection.receive("UPLOAD_COMPLETE")["payload"]["success"]
+    assert server.reaped_connections == 0
+
+
+@pytest.mark.parametrize("server_options", [{"heartbeat_interval": 1, "idle_timeout": 2}])
+@pytest.mark.parametrize("mode", ["chunked", "stream"])
+def test_stalled_download_is_reaped(server, connect, mode):
+    connection = connect()
+    connection.login("alice")
+    file_id = upload(connection, "big.bin", os.urandom(32_000_000))["upload_id"]
+
+    # Le client ne lit plus: les buffers des sockets se remplissent et l'envoi bloque
+    connection.send("DOWNLOAD_FILE", file_id=file_id, mode=mode)
+    wait_for(lambda: server.reaped_connections == 1, timeout=10)
+    wait_for(lambda: "alice" not in server.connections_by_user)
+
+
+def test_resume_takes_over_upload_of_dead_connection(server, connect):
+    data = payload_data(100_000)
+    first = connect()
+    first.login("alice")
+    ready = first.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=len(data))["payload"]
+    upload_id = ready["upload_id"]
+
+    # Lien coupé sans fermeture: le serveur reçoit toujours l'upload sur first
+    first.send_chunks(data[:40_000])
+    part_path, _ = server.partial_upload_paths(upload_id)
+    wait_for(lambda: os.path.exists(part_path) and os.path.getsize(part_path) > 0)
+
+    second = connect()
+    second.token = first.token
+    resumed = second.request("UPLOAD_RESUME", "UPLOAD_READY", "ERROR", upload_id=upload_id)
+    assert resumed["type"] == "UPLOAD_READY", resumed
+    # Le receveur de first a été fermé: tout ce qu'il a écrit est repris
+    offset = resumed["payload"]["offset"]
+    assert 0 < offset <= 40_000
+
+    second.send_chunks(data[offset:])
+    assert second.receive("UPLOAD_COMPLETE")["payload"]["upload_id"] == upload_id
+    wait_for(lambda: server.active_uploads == {})
+
+
+def test_other_session_cannot_take_over_upload(server, connect):
+    first = connect()
+    first.login("alice")
+    ready = first.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=100_000)["payload"]
+
+    # Même pseudo, autre session (nouveau LOGIN): l'upload en cours n'est pas à elle
+    other = connect()
+    other.login("alice")
+    error = other.request("UPLOAD_RESUME", "ERROR", upload_id=ready["upload_id"])["payload"]
+    assert error["code"] == "UPLOAD_IN_PROGRESS"
+    assert server.active_uploads[ready["upload_id"]] is not None
+
+
+@pytest.fixture
+def share_client(server, tmp_path):
+    """FileShareClient du dépôt connecté, dans la room general"""
+    from client import FileShareClient
+
+    client = FileShareClient("127.0.0.1", server.port)
+    assert client.connect()
+    account = Connection(server)
+    account.login("alice", room_id=None)
+    account.close()
+    client.session_token = account.token
+    assert client.join_room("general")
+    yield client
+    client.socket.close()
+
+
+def test_client_resumes_upload_after_half_open_drop(server, share_client, tmp_path, monkeypatch):
+    data = os.urandom(3_000_000)
+    path = tmp_path / "f.bin"
+    path.write_bytes(data)
+    send_upload_data = share_client.send_upload_data
+    kept = []
+
+    def drop_once(file_path, offset, file_size):
+        if kept:
+            return send_upload_data(file_path, offset, file_size)
+        send_upload_data(file_path, offset, 1_000_000)
+        # Le client perd le lien mais le serveur garde la connexion ouverte
+        kept.append(share_client.socket.dup())
+        raise ConnectionError("Lien coupé")
+
+    monkeypatch.setattr(share_client, "send_upload_data", drop_once)
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+    assert share_client.send_file(str(path))
+    stored = next(f for f in server.files_by_room["general"] if f["filename"] == "f.bin")
+    with open(stored["path"], "rb") as f:
+        assert f.read() == data
+    kept[0].close()
+
+
+def test_client_aborts_upload_when_reconnect_fails(server, share_client, tmp_path, monkeypatch):
+    path = tmp_path / "f.bin"
+    path.write_bytes(os.urandom(100_000))
+    reconnects = []
+
+    def fail(*args):
+        raise ConnectionError("Lien coupé")
+
+    monkeypatch.setattr(share_client, "send_upload_data", fail)
+    monkeypatch.setattr(share_client, "reconnect", lambda: reconnects.append(1) and False)
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+    assert not share_client.send_file(str(path))
+    assert len(reconnects) == 1
+
+
+def test_identical_upload_stops_waiting_for_stuck_claim(server, connect, monkeypatch):
+    monkeypatch.setattr("server.BLOB_CLAIM_WAIT", 0.5)
+    data = payload_data(50_000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    connection = connect()
+    connection.login("alice")
+
+    # Upload identique qui ne se termine jamais: le contenu est reçu directement
+    server.blobs.claim(blob_hash)
+    started = time.monotonic()
+    ready = connection.request("UPLOAD_FILE", "UPLOAD_READY", filename="f.bin", size=len(data), hash=blob_hash)
+    assert 0.5 <= time.monotonic() - started < 5
+    connection.send_chunks(data)
+    assert connection.receive("UPLOAD_COMPLETE")["payload"]["upload_id"] == ready["payload"]["upload_id"]
+    assert server.blobs.exists(blob_hash, len(data))
+    server.blobs.release_claim(blob_hash)
+
+
+def upload_with_hash(connection, filename, data):
+    """Upload annonçant le SHA-256: UPLOAD_COMPLETE direct si le contenu est déjà stocké"""
+    response = connection.request("UPLOAD_FILE", "UPLOAD_READY", "UPLOAD_COMPLETE", filename=filename,
+                                  size=len(data), hash=hashlib.sha256(data).hexdigest())
+    if response["type"] == "UPLOAD_READY":
+        connection.send_chunks(data[response["payload"]["offset"]:])
+        response = connection.receive("UPLOAD_COMPLETE")
+    return response["payload"]
+
+
+def test_identical_content_is_stored_once_across_rooms(server, connect):
+    data = payload_data(60_000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    alice = connect()
+    alice.login("alice")
+    bob = connect()
+    bob.login("bob", room_id="projets")
+
+    check = bob.request("UPLOAD_CHECK", "UPLOAD_CHECK_RESULT", hash=blob_hash, size=len(data))["payload"]
+    assert not check["exists"]
+    assert not upload_with_hash(alice, "a.bin", data)["deduplicated"]
+    check = bob.request("UPLOAD_CHECK", "UPLOAD_CHECK_RESULT", hash=blob_hash, size=len(data))["payload"]
+    assert check["exists"]
+    # Même hash, autre taille: pas le même contenu
+    assert not bob.request("UPLOAD_CHECK", "UPLOAD_CHECK_RESULT", hash=blob_hash, size=1)["payload"]["exists"]
+
+    assert upload_with_hash(bob, "b.bin", data)["deduplicated"]
+    assert server.blobs.refs[blob_hash] == 2
+    blob_path = server.blobs.path(blob_hash)
+
+    # Le blob ne disparaît qu'avec sa dernière référence
+    alice.request("DELETE_FILE", "FILE_DELETED", filename="a.bin")
+    assert os.path.exists(blob_path)
+    bob.request("DELETE_FILE", "FILE_DELETED", filename="b.bin")
+    assert not os.path.exists(blob_path)
+    assert blob_hash not in server.blobs.refs
+
+
+def test_concurrent_identical_uploads_transfer_once(server, connect):
+    data = payload_data(80_000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    first = connect()
+    first.login("alice")
+    second = connect()
+    second.login("bob", room_id="projets")
+
+    ready = first.request("UPLOAD_FILE", "UPLOAD_READY", filename="a.bin", size=len(data), hash=blob_hash)
+    # Le second attend l'upload en cours au lieu de recevoir le même contenu
+    second.send("UPLOAD_FILE", filename="b.bin", size=len(data), hash=blob_hash)
+    wait_for(lambda: blob_hash in server.blobs.pending)
+    first.send_chunks(data)
+    assert first.receive("UPLOAD_COMPLETE")["payload"]["upload_id"] == ready["payload"]["upload_id"]
+
+    completed = second.receive("UPLOAD_READY", "UPLOAD_COMPLETE")
+    assert completed["type"] == "UPLOAD_COMPLETE"
+    assert completed["payload"]["deduplicated"]
+    assert server.blobs.refs[blob_hash] == 2
+    assert os.listdir(os.path.dirname(server.blobs.path(blob_hash))) == [blob_hash]
+
+
+def test_uploads_survive_restart_without_database(server, connect):
+    data = payload_data(30_000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    alice = connect()
+    alice.login("alice")
+    upload_with_hash(alice, "kept.bin", data)
+    upload_with_hash(alice, "deleted.bin", payload_data(10_000))
+    alice.request("DELETE_FILE", "FILE_DELETED", filename="deleted.bin")
+    server.stop()
+
+    restarted = FileShareServer(host="127.0.0.1", port=free_port(), chat_log_dir=None, kdf_workers=0)
+    assert restarted.metadata is None
+    assert [f["filename"] for f in restarted.files_by_room["general"]] == ["kept.bin"]
+    assert restarted.blobs.refs == {blob_hash: 1}
+
+
+@pytest.mark.parametrize("request_type, response_type", [
+    ("LIST_ROOM_FILES", "ROOM_FILES_LIST"),
+    ("SYNC_ROOM", "SYNC_COMPLETE"),
+])
+def test_room_files_are_loaded_off_the_event_loop(server, connect, monkeypatch, request_type, response_type):
+    load = server.files_by_room.load
+    on_loop = []
+
+    def recording_load(room_id):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(room_id)
+        except RuntimeError:
+            pass
+        return load(room_id)
+
+    monkeypatch.setattr(server.files_by_room, "load", recording_load)
+    connection = connect()
+    connection.login("alice", room_id="projets")
+    assert not server.files_by_room.is_loaded("projets")
+
+    connection.request(request_type, response_type)
+    assert server.files_by_room.is_loaded("projets")
+    assert on_loop == []
+
+
+def shared(client):
+    """Lire la diffusion FILE_SHARED avant de télécharger"""
+    while client.receive_message()["type"] != "FILE_SHARED":
+        pass
+
+
+@pytest.mark.parametrize("mode", ["chunked", "stream"])
+def test_client_resumes_part_only_for_the_same_file(server, share_client, connect, tmp_path, mode):
+    old, new = os.urandom(200_000), os.urandom(300_000)
+    bob = connect()
+    bob.login("bob")
+    old_id = upload(bob, "f.bin", old)["upload_id"]
+    shared(share_client)
+    part = tmp_path / "dl" / "f.bin.part"
+    part.parent.mkdir()
+
+    # Même fichier côté serveur: la suite du .part est téléchargée
+    part.write_bytes(old[:50_000])
+    (tmp_path / "dl" / "f.bin.part.id").write_text(old_id)
+    with open(share_client.fetch_file("f.bin", str(tmp_path / "dl"), mode), "rb") as f:
+        assert f.read() == old
+    assert not os.path.exists(str(part) + ".id")
+
+    # Ré-upload sous le même nom: le début de l'ancien contenu n'est pas réutilisé
+    upload(bob, "f.bin", new)
+    shared(share_client)
+    part.write_bytes(old[:50_000])
+    (tmp_path / "dl" / "f.bin.part.id").write_text(old_id)
+    with open(share_client.fetch_file("f.bin", str(tmp_path / "dl"), mode), "rb") as f:
+        assert f.read() == new
+
+    # .part sans identifiant (ancien client): tout est téléchargé
+    part.write_bytes(old[:50_000])
+    with open(share_client.fetch_file("f.bin", str(tmp_path / "dl"), mode), "rb") as f:
+        assert f.read() == new
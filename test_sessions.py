@@ -0,0 +1,124 @@
+"""
+Tests de régression des sessions avec expiration (sessions.SessionStore)
+
+Le store et sa roue partagent une horloge factice ; la roue est avancée à la main.
+"""
+
+from sessions import SessionStore
+from timingwheel import TimingWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(**options):
+    clock = FakeClock()
+    wheel = TimingWheel(tick=1.0, clock=clock)
+    return SessionStore(wheel, clock=clock, **options), wheel, clock
+
+
+def wait(wheel, clock, seconds):
+    for _ in range(int(seconds)):
+        clock.now += 1
+        wheel.advance()
+
+
+def test_idle_session_expires():
+    store, wheel, clock = make_store(idle_ttl=10, absolute_ttl=1000)
+    store["token"] = "alice"
+
+    wait(wheel, clock, 9)
+    assert "token" in store
+    wait(wheel, clock, 1)
+
+    # Expirée par le minuteur, sans lecture du token
+    assert len(store) == 0
+    assert store.stats()["expired"] == 1
+    assert "token" not in store
+
+
+def test_use_postpones_idle_expiry():
+    store, wheel, clock = make_store(idle_ttl=10, absolute_ttl=1000)
+    store["token"] = "alice"
+
+    for _ in range(5):
+        wait(wheel, clock, 8)
+        assert store["token"] == "alice"
+
+    wait(wheel, clock, 10)
+    assert "token" not in store
+
+
+def test_bound_connection_prevents_idle_expiry():
+    store, wheel, clock = make_store(idle_ttl=10, absolute_ttl=1000)
+    store["token"] = "alice"
+    store.bind("token", "connection")
+
+    wait(wheel, clock, 50)
+    assert "token" in store
+
+    # Le délai d'inactivité repart de la fermeture de la dernière connexion
+    store.unbind("token", "connection")
+    wait(wheel, clock, 9)
+    assert "token" in store
+    wait(wheel, clock, 1)
+    assert "token" not in store
+
+
+def test_absolute_ttl_expires_even_when_used_and_bound():
+    store, wheel, clock = make_store(idle_ttl=10, absolute_ttl=30)
+    store["token"] = "alice"
+    store.bind("token", "connection")
+
+    wait(wheel, clock, 29)
+    assert store["token"] == "alice"
+    wait(wheel, clock, 1)
+
+    assert "token" not in store
+    assert store.stats()["expired"] == 1
+
+
+def test_expired_between_ticks_is_refused():
+    store, wheel, clock = make_store(idle_ttl=10, absolute_ttl=1000)
+    store["token"] = "alice"
+
+    # La roue n'a pas encore tourné: la lecture vérifie l'échéance elle-même
+    clock.now += 10
+    assert "token" not in store
+    assert store.get("token") is None
+
+
+def test_logout_cancels_timer():
+    store, wheel, clock = make_store(idle_ttl=10)
+    store["token"] = "alice"
+    del store["token"]
+
+    assert len(wheel) == 0
+    assert store.stats()["logged_out"] == 1
+
+
+def test_oldest_unbound_sessions_are_evicted():
+    store, wheel, clock = make_store(max_per_user=2)
+    store["first"] = "alice"
+    store.bind("first", "connection")
+    store["second"] = "alice"
+    store["third"] = "alice"
+
+    # "first" a une connexion: "second" est la plus ancienne évinçable
+    assert "first" in store and "third" in store
+    assert "second" not in store
+    assert store.stats()["evicted"] == 1
+
+
+def test_deleted_from_database_on_expiry():
+    deleted = []
+    store, wheel, clock = make_store(idle_ttl=5, delete=deleted.append)
+    store["token"] = "alice"
+
+    wait(wheel, clock, 5)
+    assert deleted == ["token"]
@@ -0,0 +1,59 @@
+"""
+Tests de régression du stockage des fichiers partagés (storage)
+"""
+
+from storage import BlobStore, RoomReferences
+
+
+def entry(file_id, blob_hash):
+    return {"file_id": file_id, "filename": f"{file_id}.bin", "uploader": "alice", "size": 1,
+            "path": f"uploads/.blobs/{blob_hash[:2]}/{blob_hash}", "hash": blob_hash,
+            "upload_date": "2026-01-01T00:00:00"}
+
+
+def test_release_deletes_blob_with_last_reference(tmp_path):
+    source = tmp_path / "part"
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    source.write_bytes(b"x")
+    path = blobs.store(str(source), "ab" * 32)
+    assert blobs.link("ab" * 32, 1) == path
+
+    assert not blobs.release("ab" * 32)
+    assert blobs.release("ab" * 32)
+    assert not blobs.exists("ab" * 32, 1)
+
+
+def test_references_reloaded_in_sharing_order(tmp_path):
+    references = RoomReferences(str(tmp_path))
+    references.add_file("general", entry("a", "11" * 32))
+    references.add_file("general", entry("b", "22" * 32))
+    references.add_file("projets", entry("c", "11" * 32))
+    references.delete_file("b")
+
+    reloaded = RoomReferences(str(tmp_path))
+    assert [f["file_id"] for f in reloaded.load_room_files("general")] == ["a"]
+    assert reloaded.load_room_files("projets") == [entry("c", "11" * 32)]
+    assert reloaded.blob_references() == {"11" * 32: 2}
+
+
+def test_journal_compacted_on_load(tmp_path):
+    references = RoomReferences(str(tmp_path))
+    for file_id in "abc":
+        references.add_file("general", entry(file_id, "11" * 32))
+        references.delete_file(file_id)
+    references.add_file("general", entry("d", "22" * 32))
+
+    assert [f["file_id"] for f in references.load_room_files("general")] == ["d"]
+    with open(references.journal_path("general"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    references = RoomReferences(str(tmp_path))
+    references.add_file("general", entry("a", "11" * 32))
+    with open(references.journal_path("general"), "a", encoding="utf-8") as f:
+        f.write('{"add": {"file_id"')
+
+    reloaded = RoomReferences(str(tmp_path))
+    reloaded.add_file("general", entry("b", "22" * 32))
+    assert [f["file_id"] for f in reloaded.load_room_files("general")] == ["a", "b"]
@@ -0,0 +1,140 @@
+"""
+Tests de régression de la roue de minuteurs (timingwheel.TimingWheel)
+
+La roue est avancée à la main (advance) avec une horloge factice.
+"""
+
+import pytest
+
+from timingwheel import TimingWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_wheel(**options):
+    clock = FakeClock()
+    return TimingWheel(clock=clock, **options), clock
+
+
+def run_until(wheel, clock, seconds):
+    """Avancer l'horloge seconde par seconde, retourne {seconde: minuteurs échus}"""
+    fired = {}
+    for second in range(1, seconds + 1):
+        clock.now += 1
+        fired[second] = wheel.advance()
+    return fired
+
+
+def test_timer_fires_on_its_tick():
+    wheel, clock = make_wheel(tick=1.0)
+    fired = []
+    wheel.schedule(3, fired.append, "a")
+
+    clock.now += 2
+    wheel.advance()
+    assert fired == []
+
+    clock.now += 1
+    wheel.advance()
+    assert fired == ["a"]
+    assert len(wheel) == 0
+
+
+def test_delay_rounded_up_to_next_tick():
+    wheel, clock = make_wheel(tick=1.0)
+    fired = []
+    wheel.schedule(0.2, fired.append, "a")
+    wheel.schedule(1.5, fired.append, "b")
+
+    clock.now += 1
+    wheel.advance()
+    assert fired == ["a"]
+
+    clock.now += 1
+    wheel.advance()
+    assert fired == ["a", "b"]
+
+
+def test_cancelled_timer_never_fires():
+    wheel, clock = make_wheel()
+    fired = []
+    timer = wheel.schedule(2, fired.append, "a")
+    wheel.cancel(timer)
+
+    assert len(wheel) == 0
+    run_until(wheel, clock, 5)
+    assert fired == []
+
+
+@pytest.mark.parametrize("delay", [63, 64, 65, 200, 64 * 64 + 7])
+def test_timers_cascade_from_upper_levels(delay):
+    wheel, clock = make_wheel(slots=64, levels=3)
+    fired = []
+    wheel.schedule(delay, fired.append, delay)
+
+    clock.now += delay - 1
+    wheel.advance()
+    assert fired == []
+
+    clock.now += 1
+    wheel.advance()
+    assert fired == [delay]
+
+
+def test_delay_beyond_wheel_range_fires_on_time():
+    # 4 cases sur 2 niveaux: portée de 16 ticks
+    wheel, clock = make_wheel(slots=4, levels=2)
+    fired = []
+    wheel.schedule(40, fired.append, "far")
+
+    fired_at = [second for second, count in run_until(wheel, clock, 45).items() if count]
+    assert fired == ["far"]
+    assert fired_at == [40]
+
+
+def test_ticks_missed_by_a_late_thread_are_caught_up():
+    wheel, clock = make_wheel()
+    fired = []
+    for delay in (1, 2, 3):
+        wheel.schedule(delay, fired.append, delay)
+
+    clock.now += 10
+    assert wheel.advance() == 3
+    assert fired == [1, 2, 3]
+
+
+def test_callback_can_reschedule():
+    wheel, clock = make_wheel()
+    fired = []
+
+    def again(count):
+        fired.append(clock.now)
+        if count:
+            wheel.schedule(2, again, count - 1)
+
+    wheel.schedule(2, again, 2)
+    run_until(wheel, clock, 10)
+
+    assert fired == [1002.0, 1004.0, 1006.0]
+
+
+def test_failing_callback_does_not_stop_the_wheel():
+    wheel, clock = make_wheel()
+    fired = []
+    wheel.schedule(1, lambda: 1 / 0)
+    wheel.schedule(1, fired.append, "ok")
+
+    clock.now += 1
+    wheel.advance()
+    assert fired == ["ok"]
+
+
+def test_slots_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        TimingWheel(slots=48)
@@ -0,0 +1,131 @@
+"""
+Roue de minuteurs hiérarchique (hierarchical timing wheel)
+
+Des milliers d'échéances (sessions, connexions inactives...) sans parcours :
+ajouter ou annuler un minuteur est en O(1), et chaque tick ne traite que
+la case courante. Le niveau 0 a une case par tick ; une case du niveau n
+couvre slots^n ticks et ses minuteurs redescendent d'un niveau quand leur
+fenêtre arrive. La précision est d'un tick.
+"""
+
+import threading
+import time
+
+
+class Timer:
+    __slots__ = ("expires", "callback", "args", "slot", "cancelled")
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires  # Numéro du tick d'échéance
+        self.callback = callback
+        self.args = args
+        self.slot = None  # Case où le minuteur attend ({Timer: None})
+        self.cancelled = False
+
+
+class TimingWheel:
+    """Minuteurs à un tick près, O(1) par ajout, annulation et tick"""
+
+    def __init__(self, tick=1.0, slots=64, levels=4, clock=time.monotonic):
+        if slots & (slots - 1):
+            raise ValueError("slots doit être une puissance de 2")
+        self.tick = tick
+        self.slots = slots
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.origin = clock()
+        self.current = 0  # Dernier tick traité
+        self.count = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def schedule(self, delay, callback, *args):
+        """Appeler callback(*args) dans delay secondes (depuis le thread de la roue)"""
+        ticks = max(1, -int(-delay // self.tick))  # Arrondi au tick supérieur
+        with self.lock:
+            # Ticks écoulés mais pas encore traités: l'échéance part de maintenant
+            now = max(self.current, int((self.clock() - self.origin) / self.tick))
+            timer = Timer(now + ticks, callback, args)
+            self._add(timer)
+            self.count += 1
+        return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.slot is not None:
+                del timer.slot[timer]
+                timer.slot = None
+                self.count -= 1
+            timer.cancelled = True
+
+    def _add(self, timer):
+        """Ranger un minuteur dans la case de son échéance (lock tenu)"""
+        expires = max(timer.expires, self.current)
+        remaining = expires - self.current
+        for level in range(self.levels):
+            if remaining < 1 << (self.bits * (level + 1)):
+                break
+        else:
+            # Au-delà de la portée de la roue: dernière case atteignable, reclassé à son passage
+            expires = self.current + (1 << (self.bits * self.levels)) - 1
+        slot = self.wheels[level][(expires >> (self.bits * level)) & self.mask]
+        slot[timer] = None
+        timer.slot = slot
+
+    def advance(self):
+        """Traiter les ticks écoulés et appeler les minuteurs échus (retourne leur nombre)"""
+        target = int((self.clock() - self.origin) / self.tick)
+        due = []
+        with self.lock:
+            while self.current < target:
+                self.current += 1
+                # Faire redescendre les niveaux supérieurs dont la fenêtre commence
+                for level in range(self.levels - 1, 0, -1):
+                    if self.current & ((1 << (self.bits * level)) - 1) == 0:
+                        slot = self.wheels[level][(self.current >> (self.bits * level)) & self.mask]
+                        timers = list(slot)
+                        slot.clear()
+                        for timer in timers:
+                            self._add(timer)
+
+                slot = self.wheels[0][self.current & self.mask]
+                for timer in list(slot):
+                    if timer.expires <= self.current:
+                        del slot[timer]
+                        timer.slot = None
+                        self.count -= 1
+                        due.append(timer)
+
+        # Hors du lock: un callback peut reprogrammer ou annuler des minuteurs
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"❌ Erreur de minuteur: {e}")
+        return len(due)
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(self.tick)
+            self.advance()
+
+    def start(self, name="Timers"):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __len__(self):
+        return self.count